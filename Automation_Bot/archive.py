@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import datetime
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+import database
+
+load_dotenv()
+
+# Orders in one of these statuses, unchanged for ORDER_ARCHIVE_AFTER_DAYS, are moved to the archive.
+# past_due is left alone: it is still inside its payment grace period and can become active again.
+ARCHIVE_STATUSES = tuple(s.strip() for s in os.getenv("ORDER_ARCHIVE_STATUSES", "cancelled,lapsed").split(",") if s.strip())
+ARCHIVE_AFTER_DAYS = float(os.getenv("ORDER_ARCHIVE_AFTER_DAYS", 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ORDER_ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_PAUSE_SECONDS = 0.05  # Between batches, so webhook writes get the lock in between
+
+
+def archive_orders(older_than_days=ARCHIVE_AFTER_DAYS, statuses=ARCHIVE_STATUSES, batch_size=ARCHIVE_BATCH_SIZE, pause=ARCHIVE_PAUSE_SECONDS, max_batches=None):
+    """
+    Move old terminal-state orders from orders.db to the archive in batches of `batch_size`.
+    Each batch is two short write transactions: copy to the archive, then delete from
+    orders.db the rows that have not changed since. An order that is reactivated in
+    between stays live and its copy is dropped. An interrupted run leaves at most
+    one batch in both places, which the next run finishes.
+    Returns a summary with the number archived and the longest batch.
+    """
+    cutoff = (datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)).strftime("%Y-%m-%d %H:%M:%S")
+    summary = {"archived": 0, "batches": 0, "kept": 0, "max_batch_seconds": 0.0, "cutoff": cutoff}
+    if not statuses:
+        return summary
+
+    start = time.perf_counter()
+    while max_batches is None or summary["batches"] < max_batches:
+        rows = database.get_archivable_orders(statuses, cutoff, batch_size)
+        if not rows:
+            break
+        batch_start = time.perf_counter()
+        database.copy_orders_to_archive(rows)
+        ids = [row[0] for row in rows]
+        deleted = database.delete_archived_orders(ids, statuses, cutoff)
+        kept = [order_id for order_id in ids if order_id not in deleted]
+        if kept:
+            database.drop_archive_copies(kept)
+
+        summary["archived"] += len(deleted)
+        summary["kept"] += len(kept)
+        summary["batches"] += 1
+        summary["max_batch_seconds"] = max(summary["max_batch_seconds"], round(time.perf_counter() - batch_start, 4))
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    if summary["archived"]:
+        logging.info(f"Archived {summary['archived']} orders last changed before {cutoff} in {summary['batches']} batches.")
+    return summary
+
+
+def vacuum():
+    """Give the space freed by archiving back to the filesystem. Locks orders.db while it runs, so run it off-peak."""
+    with database.connection() as conn:
+        conn.execute("VACUUM")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Move old cancelled orders from orders.db to the archive database.")
+    parser.add_argument("--days", type=float, default=ARCHIVE_AFTER_DAYS, help=f"Archive orders unchanged for this many days (default {ARCHIVE_AFTER_DAYS:g})")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM orders.db afterwards (locks it while it runs)")
+    args = parser.parse_args()
+
+    database.init_db()
+    result = archive_orders(older_than_days=args.days, batch_size=args.batch_size)
+    if args.vacuum:
+        vacuum()
+    result["counts"] = database.get_order_counts()
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,65 @@
+import os
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: no gunicorn there either, so the single process owns automation
+    fcntl = None
+
+LOCK_FILENAME = "automation.lock"
+
+
+class AutomationOwner:
+    """
+    Elects one process (out of several server workers) to own the browser
+    automation and job queue workers, using an exclusive lock on a file.
+    Workers that lose the election wait on the lock in a background thread,
+    so another worker takes over if the owner exits or crashes.
+    """
+
+    def __init__(self, lock_path, on_acquired):
+        self.lock_path = lock_path
+        self.on_acquired = on_acquired
+        self.is_owner = False
+        self._file = None
+        self._thread = None
+
+    def _acquired(self):
+        self.is_owner = True
+        logging.info(f"Process {os.getpid()} owns browser automation ({self.lock_path})")
+        self.on_acquired()
+
+    def start(self):
+        """Try to become the owner now; otherwise stand by in a daemon thread. Returns is_owner."""
+        if fcntl is None:
+            self._acquired()
+            return True
+
+        self._file = open(self.lock_path, "a+")
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info(f"Process {os.getpid()} is on standby for browser automation.")
+            self._thread = threading.Thread(target=self._wait_for_lock, name="automation-standby", daemon=True)
+            self._thread.start()
+            return False
+
+        self._acquired()
+        return True
+
+    def _wait_for_lock(self):
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except OSError as e:
+            logging.error(f"Waiting for the automation lock failed: {e}")
+            return
+        self._acquired()
+
+    def release(self):
+        if self._file is not None:
+            if fcntl is not None and self.is_owner:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self.is_owner = False
@@ -0,0 +1,173 @@
+"""
+Shared helpers for the benchmark scripts in this folder.
+Run benchmarks from the Automation_Bot folder, e.g. `python benchmarks/bench_order_indexes.py`.
+"""
+import os
+import sys
+import json
+import time
+
+# Make the bot modules (database, server, ...) importable from here
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BOT_DIR not in sys.path:
+    sys.path.insert(0, BOT_DIR)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None):
+    """Latency summary (milliseconds) plus throughput for a list of per-call durations in seconds."""
+    values = sorted(latencies)
+    total = elapsed if elapsed is not None else sum(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 4),
+        "p95_ms": round(percentile(values, 95) * 1000, 4),
+        "p99_ms": round(percentile(values, 99) * 1000, 4),
+        "max_ms": round(values[-1] * 1000, 4) if values else 0.0,
+        "throughput_per_s": round(len(values) / total, 1) if total else 0.0,
+    }
+
+
+def time_calls(fn, args_list):
+    """Call fn(*args) for every entry and return the per-call durations."""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB (None where the resource module is missing, e.g. Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def emit(name, results):
+    """Print a benchmark result as one JSON document."""
+    print(json.dumps({"benchmark": name, "results": results}, indent=2))
+
+
+def sign_stripe_payload(payload, secret, timestamp=None):
+    """Build a Stripe-Signature header for a payload, the same way Stripe signs webhooks."""
+    import hmac
+    import hashlib
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.{payload}".encode("utf-8")
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def checkout_event(index, tv_username=None, mt5_account=None, product_key="prod_Qwerty123"):
+    """A minimal checkout.session.completed event body."""
+    metadata = {"product_key": product_key}
+    if tv_username:
+        metadata["tv_username"] = tv_username
+    if mt5_account:
+        metadata["mt5_account"] = mt5_account
+    return json.dumps({
+        "id": f"evt_bench_{index}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": f"cs_bench_{index}",
+            "object": "checkout.session",
+            "customer": f"cus_bench_{index}",
+            "subscription": f"sub_bench_{index}",
+            "metadata": metadata,
+        }},
+    })
+
+
+class StubBot:
+    """Stands in for TradingViewBot: sleeps instead of driving a browser."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.driver = None
+        self.operations = 0
+        self.access = {}  # script_url -> usernames with access
+
+    def start_driver(self):
+        self.driver = object()
+        self.operations = 0
+
+    def login(self):
+        pass
+
+    def close_driver(self):
+        self.driver = None
+
+    def is_alive(self):
+        return self.driver is not None
+
+    def manage_access(self, script_url, username, action="add", expiration_date=None):
+        self.calls += 1
+        self.operations += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return True
+
+    def manage_access_batch(self, script_url, add=(), remove=()):
+        self.calls += 1
+        self.operations += 1
+        if self.delay:
+            time.sleep(self.delay)
+        users = self.access.setdefault(script_url, set())
+        users.update(add)
+        users.difference_update(remove)
+        return {username: True for username in list(add) + list(remove)}
+
+    def list_access(self, script_url):
+        self.calls += 1
+        self.operations += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return set(self.access.get(script_url, ()))
+
+
+class StubSubscriptions:
+    """Stands in for reconcile.StripeSubscriptions: serves {subscription_id: stripe_status} from memory."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def list_subscriptions(self):
+        return iter(self.statuses.items())
+
+
+class StubMailer:
+    """Stands in for mailer.Mailer: accepts every message without any network I/O."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay # Seconds per message, to mimic SMTP round trips
+        self.sent = 0
+
+    def send(self, message):
+        self.sent += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return True
+
+    def send_batch(self, messages):
+        self.sent += len(messages)
+        if self.delay:
+            time.sleep(self.delay * len(messages))
+        return [True] * len(messages)
+
+    def close(self):
+        pass
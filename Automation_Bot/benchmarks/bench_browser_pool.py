@@ -0,0 +1,49 @@
+"""
+Grants per minute through BrowserPool as the pool grows. Browsers are replaced by
+stubs that take --op-delay seconds per access change, so this measures the pool
+and worker plumbing, not TradingView.
+
+Usage: python benchmarks/bench_browser_pool.py [--grants 40] [--op-delay 0.5] [--sizes 1,2,4]
+"""
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import _common
+from browser_pool import BrowserPool
+
+
+def run(size, grants, op_delay):
+    pool = BrowserPool(None, None, size=size, bot_factory=lambda slot: _common.StubBot(delay=op_delay))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=size) as executor:
+        results = list(executor.map(
+            lambda i: pool.manage_access("https://example.com/script/", f"user_{i}", action="add"),
+            range(grants)
+        ))
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return {
+        "pool_size": size,
+        "grants": grants,
+        "succeeded": sum(results),
+        "elapsed_s": round(elapsed, 3),
+        "grants_per_minute": round(grants / elapsed * 60, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grants", type=int, default=40)
+    parser.add_argument("--op-delay", type=float, default=0.5)
+    parser.add_argument("--sizes", default="1,2,4")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    _common.emit("browser_pool", [run(size, args.grants, args.op_delay) for size in sizes])
+
+
+if __name__ == "__main__":
+    main()
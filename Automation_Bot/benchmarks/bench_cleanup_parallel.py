@@ -0,0 +1,82 @@
+"""
+woo_cleanup plan / execute split against local fakes.
+Seeds a cleanup where warning emails and TradingView removals (spread over the
+product scripts) are both due. It then times the read-only planning pass and
+compares running the two sides one after the other with execute_cleanup_plan(),
+which runs them concurrently.
+
+Usage: python benchmarks/bench_cleanup_parallel.py [--rows 20000] [--email-delay 0.0005] [--batch-delay 0.5]
+"""
+import os
+import time
+import datetime
+import argparse
+import logging
+import tempfile
+
+import _common
+from run_all import write_export
+
+
+def seed(database, woo_cleanup, tmp, rows):
+    """Fresh orders.db and export: every lapsed row gets a warning, a third of them are also past the grace period."""
+    database.close_pool()
+    database.DB_NAME = os.path.join(tmp, f"orders_{time.monotonic_ns()}.db")
+    database.init_db()
+    woo_cleanup.CSV_FILE = os.path.join(tmp, "export.csv")
+    write_export(woo_cleanup.CSV_FILE, rows)
+    past = str(datetime.date.today() - datetime.timedelta(days=woo_cleanup.GRACE_PERIOD_DAYS + 1))
+    database.save_cleanup_state([
+        {"order_id": f"old_{i}", "tv_username": f"old_user_{i}", "product_name": name, "email": f"old{i}@example.com",
+         "status": "cancelled", "warning_sent_date": past, "removed_date": None}
+        for i, name in enumerate(["BTMM State Engine", "BTMM Multi-Pair Scanner"] * (rows // 20))
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--email-delay", type=float, default=0.0005, help="Simulated SMTP seconds per message")
+    parser.add_argument("--batch-delay", type=float, default=0.5, help="Simulated seconds per TradingView access batch")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        import woo_cleanup
+        from browser_pool import BrowserPool
+        logging.getLogger().setLevel(logging.WARNING)
+        woo_cleanup.create_browser_pool = lambda size: BrowserPool(None, None, size=size, bot_factory=lambda slot: _common.StubBot(args.batch_delay))
+
+        results = {}
+        for mode in ("sequential", "parallel"):
+            seed(database, woo_cleanup, tmp, args.rows)
+            mailer = _common.StubMailer(args.email_delay)
+            woo_cleanup.create_mailer = lambda: mailer
+
+            start = time.perf_counter()
+            plan = woo_cleanup.build_cleanup_plan()
+            plan_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            if mode == "sequential":
+                today = datetime.date.fromisoformat(plan["date"])
+                warned = woo_cleanup._send_planned_warnings(plan, mailer, today)
+                removed = woo_cleanup._run_planned_removals(plan, today)
+            else:
+                summary = woo_cleanup.execute_cleanup_plan(plan)
+                warned, removed = summary["warnings"], summary["removals"]
+            results[mode] = {
+                "plan_seconds": round(plan_s, 3),
+                "execute_seconds": round(time.perf_counter() - start, 3),
+                "warnings_sent": warned,
+                "users_removed": removed,
+                "scripts": len(plan["removals"]),
+                "skips": len(plan["skips"]),
+            }
+        database.close_pool()
+
+    _common.emit("cleanup_parallel", dict(results, rows=args.rows, cleanup_browsers=woo_cleanup.CLEANUP_BROWSERS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Replays abusive license traffic against /api/verify_license and counts how many
+requests reach database.check_mt5_license, with and without the protections
+(per-IP / per-account rate limits and the negative cache).
+
+Traffic mix per round:
+- one IP flooding random made-up accounts
+- many IPs repeating the same few invalid accounts (cracked EA)
+- regular EAs checking valid licenses (these must keep working)
+
+Usage: python benchmarks/bench_license_abuse.py [--requests 20000]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+
+import _common
+
+PRODUCT = "prod_Qwerty123"
+
+
+def replay(server, client, requests, protected):
+    import database
+    server.RATE_LIMIT_IP_PER_SECOND = 20 if protected else 0
+    server.RATE_LIMIT_ACCOUNT_PER_SECOND = 1 if protected else 0
+    server.license_cache.negative_ttl = 60 if protected else 0
+    server.license_cache.clear()
+    server.ip_limiter._buckets.clear()
+    server.account_limiter._buckets.clear()
+
+    db_calls = [0]
+    check = database.check_mt5_license
+    def counted(*a):
+        db_calls[0] += 1
+        return check(*a)
+    database.check_mt5_license = counted
+
+    rng = random.Random(11)
+    statuses = {"flood": {}, "cracked": {}, "legit": {}}
+    start = time.perf_counter()
+    try:
+        for i in range(requests):
+            kind = rng.choice(("flood", "flood", "cracked", "legit"))
+            if kind == "flood":
+                ip, account = "203.0.113.7", str(rng.randrange(10**9))
+            elif kind == "cracked":
+                ip, account = f"198.51.100.{rng.randrange(250)}", str(90000000 + rng.randrange(5))
+            else:
+                ip, account = f"192.0.2.{rng.randrange(250)}", str(10000000 + rng.randrange(1000))
+            response = client.get(f"/api/verify_license?account_number={account}&product_id={PRODUCT}", environ_base={"REMOTE_ADDR": ip})
+            code = response.status_code if response.status_code != 200 else ("valid" if response.json["valid"] else "invalid")
+            statuses[kind][code] = statuses[kind].get(code, 0) + 1
+    finally:
+        database.check_mt5_license = check
+    return {"db_calls": db_calls[0], "seconds": round(time.perf_counter() - start, 3), "responses": statuses}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["BROWSER_POOL_WARM"] = "0"
+        os.environ["USE_LICENSE_SNAPSHOT"] = "0"  # Measures the cache + rate limiter path
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, 'active')",
+                    ((f"sub_{i}", str(10000000 + i), PRODUCT) for i in range(1000))
+                )
+        import server
+        logging.getLogger().setLevel(logging.WARNING)
+        client = server.app.test_client()
+        client.get("/api/license_cache_stats")
+
+        results = {
+            "unprotected": replay(server, client, args.requests, protected=False),
+            "protected": replay(server, client, args.requests, protected=True),
+        }
+        database.close_pool()
+
+    _common.emit("license_abuse", dict(results, requests=args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares N single /api/verify_license calls with one /api/verify_licenses call
+for the same N (account, product) pairs against a seeded orders.db. The license
+cache is cleared before each run so both paths go to SQLite.
+
+Usage: python benchmarks/bench_license_batch.py [--orders 100000] [--pairs 50] [--rounds 20]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--pairs", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["USE_JOB_QUEUE"] = "0"
+        os.environ["BROWSER_POOL_WARM"] = "0"
+        os.environ["RATE_LIMIT_IP_PER_SECOND"] = "0"
+        os.environ["USE_LICENSE_SNAPSHOT"] = "0"  # Compare the SQL paths behind the cache
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, ?)",
+                    ((f"sub_{i}", str(10000000 + i), PRODUCTS[i % 2], "active" if i % 3 else "cancelled") for i in range(args.orders))
+                )
+        import server
+        logging.getLogger().setLevel(logging.WARNING)
+        client = server.app.test_client()
+
+        rng = random.Random(7)
+        single, batched = [], []
+        for _ in range(args.rounds):
+            pairs = [(str(10000000 + i), PRODUCTS[i % 2]) for i in (rng.randrange(args.orders) for _ in range(args.pairs))]
+
+            server.license_cache.clear()
+            start = time.perf_counter()
+            single_results = [client.get(f"/api/verify_license?account_number={a}&product_id={p}").json["valid"] for a, p in pairs]
+            single.append(time.perf_counter() - start)
+
+            server.license_cache.clear()
+            start = time.perf_counter()
+            batch_results = client.post("/api/verify_licenses", json={"pairs": pairs}).json["valid"]
+            batched.append(time.perf_counter() - start)
+            assert single_results == batch_results
+        database.close_pool()
+
+    _common.emit("license_batch", {
+        "orders": args.orders,
+        "pairs_per_round": args.pairs,
+        "single_calls": _common.summarize(single),
+        "one_batch_call": _common.summarize(batched),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Memory footprint and lookup latency of the license snapshot for --licenses active
+licenses, compared with a plain frozenset of (account, product) tuples, the
+LicenseCache and the SQL path (database.check_mt5_license).
+Half of the lookups are for accounts that have no license.
+
+Usage: python benchmarks/bench_license_snapshot.py [--licenses 1000000] [--lookups 20000]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+import tracemalloc
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def measure(build):
+    """Returns (object, MB allocated while building it and still held)."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, round((after - before) / (1024 * 1024), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--licenses", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        from license_cache import LicenseCache
+        from license_snapshot import LicenseSnapshot
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        logging.getLogger().setLevel(logging.WARNING)
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, 'active')",
+                    ((f"sub_{i}", str(10000000 + i), PRODUCTS[i % 2]) for i in range(args.licenses))
+                )
+
+        plain, plain_mb = measure(lambda: frozenset(tuple(row) for row in database.get_active_licenses()))
+
+        snapshot = LicenseSnapshot(refresh_seconds=0)
+        _, snapshot_mb = measure(snapshot.load)
+        start = time.perf_counter()
+        snapshot.load()  # Timed outside tracemalloc
+        load_s = time.perf_counter() - start
+
+        cache = LicenseCache(max_size=args.licenses)
+        _, cache_mb = measure(cache.warm)
+
+        rng = random.Random(9)
+        lookups = []
+        for _ in range(args.lookups):
+            i = rng.randrange(args.licenses * 2)
+            lookups.append((str(10000000 + i), PRODUCTS[i % 2]))
+
+        expected = [(a, p) in plain for a, p in lookups]
+        assert snapshot.contains_many(lookups) == expected
+
+        start = time.perf_counter()
+        snapshot.on_order_change("99999999", PRODUCTS[0], "active")
+        publish_ms = (time.perf_counter() - start) * 1000
+
+        results = {
+            "licenses": args.licenses,
+            "memory_mb": {"frozenset_of_tuples": plain_mb, "license_snapshot": snapshot_mb, "license_cache": cache_mb},
+            "snapshot_load_s": round(load_s, 2),
+            "snapshot_publish_ms": round(publish_ms, 3),
+            "lookup": {
+                "license_snapshot": _common.summarize(_common.time_calls(snapshot.contains, lookups)),
+                "frozenset_of_tuples": _common.summarize(_common.time_calls(lambda a, p: (a, p) in plain, lookups)),
+                "license_cache": _common.summarize(_common.time_calls(cache.check, lookups)),
+                "sql": _common.summarize(_common.time_calls(database.check_mt5_license, lookups[:min(len(lookups), 5000)])),
+            },
+        }
+        database.close_pool()
+
+    _common.emit("license_snapshot", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Read-replica license checks: export --licenses active licenses with license_export.py,
+then answer lookups from the memory-mapped file the way license_verifier.py does.
+Reports export time and file size, verifier start-up time and heap use (against
+loading a LicenseSnapshot from orders.db), lookup latency, and how long an order
+change takes to reach the verifier through the delta log.
+
+Usage: python benchmarks/bench_license_verifier.py [--licenses 1000000] [--lookups 20000]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+import tracemalloc
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--licenses", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        from license_export import LicensePublisher
+        from license_snapshot import LicenseSnapshot
+        from license_verifier import SnapshotReader
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        logging.getLogger().setLevel(logging.WARNING)
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, 'active')",
+                    ((f"sub_{i}", str(10000000 + i), PRODUCTS[i % 2]) for i in range(args.licenses))
+                )
+
+        path = os.path.join(tmp, "licenses.bin")
+        publisher = LicensePublisher(path)
+        start = time.perf_counter()
+        publisher.publish_full()
+        export_s = time.perf_counter() - start
+
+        reader = SnapshotReader(path, refresh_seconds=0)
+        tracemalloc.start()
+        start = time.perf_counter()
+        reader.refresh()
+        map_ms = (time.perf_counter() - start) * 1000
+        reader_mb = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+        tracemalloc.stop()
+
+        snapshot = LicenseSnapshot(refresh_seconds=0)
+        start = time.perf_counter()
+        snapshot.load()
+        snapshot_load_s = time.perf_counter() - start
+
+        rng = random.Random(9)
+        lookups = []
+        for _ in range(args.lookups):
+            i = rng.randrange(args.licenses * 2)
+            lookups.append((str(10000000 + i), PRODUCTS[i % 2]))
+        assert [reader.contains(a, p) for a, p in lookups] == snapshot.contains_many(lookups)
+
+        # An order change reaching the verifier: one delta publish plus one refresh
+        start = time.perf_counter()
+        database.add_order("cus_new", "sub_new", None, "99999999", PRODUCTS[0])
+        database.update_order_status("sub_0", "cancelled")
+        publisher.publish_deltas()
+        reader.refresh()
+        propagate_ms = (time.perf_counter() - start) * 1000
+        assert reader.contains("99999999", PRODUCTS[0]) and not reader.contains("10000000", PRODUCTS[0])
+        database.close_pool()
+
+        results = {
+            "licenses": args.licenses,
+            "export_s": round(export_s, 2),
+            "file_mb": round(os.path.getsize(path) / (1024 * 1024), 1),
+            "verifier_start_ms": round(map_ms, 2),
+            "verifier_heap_mb": round(reader_mb, 3),
+            "license_snapshot_load_s": round(snapshot_load_s, 2),
+            "change_to_verifier_ms": round(propagate_ms, 2),
+            "lookup": {
+                "mmap_verifier": _common.summarize(_common.time_calls(reader.contains, lookups)),
+                "license_snapshot": _common.summarize(_common.time_calls(snapshot.contains, lookups)),
+            },
+        }
+
+    _common.emit("license_verifier", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Sends a batch of warning emails to a local aiosmtpd sink and reports throughput,
+comparing connect-per-message (the old behaviour) against the pooled Mailer.
+Needs aiosmtpd (`pip install -r requirements-dev.txt`).
+
+Usage: python benchmarks/bench_mailer.py [--messages 500] [--workers 4] [--rate 1000]
+"""
+import time
+import smtplib
+import argparse
+import logging
+
+import _common
+from mailer import Mailer
+from woo_cleanup import build_warning_email
+
+HOST = "127.0.0.1"
+PORT = 8025
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def connect_per_message(messages):
+    start = time.perf_counter()
+    for msg in messages:
+        server = smtplib.SMTP(HOST, PORT)
+        server.send_message(msg, from_addr="bench@example.com")
+        server.quit()
+    return time.perf_counter() - start
+
+
+def pooled(messages, workers, rate):
+    mailer = Mailer(HOST, PORT, sender="bench@example.com", workers=workers, rate_per_second=rate, starttls=False)
+    start = time.perf_counter()
+    results = mailer.send_batch(messages)
+    elapsed = time.perf_counter() - start
+    mailer.close()
+    assert all(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    from aiosmtpd.controller import Controller
+
+    logging.getLogger().setLevel(logging.WARNING) # woo_cleanup configures INFO on import
+    logging.getLogger("mail.log").setLevel(logging.ERROR)
+    handler = CountingHandler()
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        messages = [build_warning_email(f"user{i}@example.com", f"user{i}", "BTMM State Engine") for i in range(args.messages)]
+        single = connect_per_message(messages)
+        batch = pooled([build_warning_email(f"user{i}@example.com", f"user{i}", "BTMM State Engine") for i in range(args.messages)], args.workers, args.rate)
+    finally:
+        controller.stop()
+
+    _common.emit("mailer", {
+        "messages": args.messages,
+        "received": handler.received,
+        "connect_per_message": {"elapsed_s": round(single, 3), "per_second": round(args.messages / single, 1)},
+        "pooled": {"workers": args.workers, "elapsed_s": round(batch, 3), "per_second": round(args.messages / batch, 1)},
+    })
+
+
+if __name__ == "__main__":
+    main()
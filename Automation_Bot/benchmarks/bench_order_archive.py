@@ -0,0 +1,126 @@
+"""
+Order archiving (archive.py) as history grows. For each --history size it seeds
+--live active orders plus that many old cancelled ones, then measures the hot-path
+queries, orders.db size and a full read of the table (what reconcile does) before
+and after archive_orders() + VACUUM. While the archive runs, another thread keeps
+updating order statuses (like webhooks) to show how long writers wait. It also
+times get_user_by_subscription for archived orders, which falls back to the archive.
+
+Usage: python benchmarks/bench_order_archive.py [--live 50000] [--history 100000,300000] [--lookups 2000]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+import threading
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def seed(database, live, history):
+    """`live` active orders and `history` cancelled ones last changed a year ago, customers shared between them."""
+    def rows():
+        for i in range(live + history):
+            status = "active" if i < live else "cancelled"
+            yield (f"cus_{i % live}", f"sub_{i}", f"tv_user_{i}", str(10000000 + i), PRODUCTS[i % 2], status,
+                   "2025-01-01 00:00:00" if status == "cancelled" else "2026-01-01 00:00:00")
+    with database.connection() as conn:
+        with conn:
+            conn.executemany('''
+                INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows())
+
+
+def measure(database, live, lookups):
+    rng = random.Random(7)
+    license_args, customer_args = [], []
+    for _ in range(lookups):
+        i = rng.randrange(live)
+        license_args.append((str(10000000 + i), PRODUCTS[i % 2]))
+        customer_args.append((f"cus_{i}",))
+    start = time.perf_counter()
+    orders = database.get_all_orders()
+    full_read_s = time.perf_counter() - start
+    return {
+        "orders_rows": len(orders),
+        "orders_db_mb": round(os.path.getsize(database.DB_NAME) / (1024 * 1024), 1),
+        "get_all_orders_s": round(full_read_s, 3),
+        "check_mt5_license": _common.summarize(_common.time_calls(database.check_mt5_license, license_args)),
+        "get_user_by_customer_id": _common.summarize(_common.time_calls(database.get_user_by_customer_id, customer_args)),
+    }
+
+
+def run(database, archive, tmp, live, history, lookups):
+    database.close_pool()
+    database.DB_NAME = os.path.join(tmp, f"orders_{history}.db")
+    os.environ["ORDER_ARCHIVE_DB"] = os.path.join(tmp, f"orders_archive_{history}.db")
+    database.init_db()
+    seed(database, live, history)
+    archive.vacuum()  # Same starting layout for both measurements
+    before = measure(database, live, lookups)
+
+    # Webhook-style writes while the archive runs
+    stop = threading.Event()
+    write_latencies = []
+
+    def writer():
+        rng = random.Random(3)
+        while not stop.is_set():
+            sub_id = f"sub_{rng.randrange(live)}"
+            start = time.perf_counter()
+            database.update_order_status(sub_id, "active")
+            write_latencies.append(time.perf_counter() - start)
+            time.sleep(0.002)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    summary = archive.archive_orders(older_than_days=90)
+    stop.set()
+    thread.join()
+    archive.vacuum()
+
+    after = measure(database, live, lookups)
+    rng = random.Random(11)
+    archived_args = [(f"sub_{live + rng.randrange(history)}",) for _ in range(lookups)]
+    after["get_user_by_subscription_archived"] = _common.summarize(_common.time_calls(database.get_user_by_subscription, archived_args))
+    return {
+        "live": live,
+        "history": history,
+        "before": before,
+        "after": after,
+        "archive_run": {
+            "archived": summary["archived"],
+            "batches": summary["batches"],
+            "seconds": summary["seconds"],
+            "max_batch_s": summary["max_batch_seconds"],
+            "archive_db_mb": round(os.path.getsize(os.environ["ORDER_ARCHIVE_DB"]) / (1024 * 1024), 1),
+        },
+        "concurrent_status_updates": _common.summarize(write_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--live", type=int, default=50000)
+    parser.add_argument("--history", default="100000,300000")
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        import archive
+        logging.getLogger().setLevel(logging.WARNING)
+        results = [run(database, archive, tmp, args.live, int(h), args.lookups) for h in args.history.split(",")]
+        database.close_pool()
+
+    _common.emit("order_archive", results)
+
+
+if __name__ == "__main__":
+    main()
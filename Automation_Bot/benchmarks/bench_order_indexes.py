@@ -0,0 +1,83 @@
+"""
+Seeds an orders table with N rows (default 1,000,000) and measures the license and
+customer lookups before and after the index migration.
+
+Usage: python benchmarks/bench_order_indexes.py [--rows 1000000] [--lookups 2000]
+"""
+import os
+import random
+import argparse
+import logging
+import tempfile
+
+import _common
+import database
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456", "prod_Zxcvbn789"]
+STATUSES = ["active", "cancelled", "past_due"]
+
+
+def seed(rows):
+    batch = []
+    with database.connection() as conn:
+        for i in range(rows):
+            batch.append((
+                f"cus_{i % (rows // 2 or 1)}",
+                f"sub_{i}",
+                f"tv_user_{i}",
+                str(10000000 + i),
+                PRODUCTS[i % len(PRODUCTS)],
+                STATUSES[i % len(STATUSES)],
+            ))
+            if len(batch) == 50000:
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', batch)
+                batch = []
+        if batch:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+
+
+def measure(rows, lookups):
+    rng = random.Random(42)
+    license_args = []
+    customer_args = []
+    for _ in range(lookups):
+        i = rng.randrange(rows)
+        license_args.append((str(10000000 + i), PRODUCTS[i % len(PRODUCTS)]))
+        customer_args.append((f"cus_{rng.randrange(rows // 2 or 1)}",))
+    return {
+        "check_mt5_license": _common.summarize(_common.time_calls(database.check_mt5_license, license_args)),
+        "get_user_by_customer_id": _common.summarize(_common.time_calls(database.get_user_by_customer_id, customer_args)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench_orders.db")
+        database.migrate(target_version=1)  # Table only, no lookup indexes
+        seed(args.rows)
+
+        # Unindexed lookups are full scans, so sample fewer of them
+        before = measure(args.rows, max(10, args.lookups // 100))
+        database.migrate()
+        after = measure(args.rows, args.lookups)
+        database.close_pool()
+
+    _common.emit("order_indexes", {"rows": args.rows, "before": before, "after": after})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Product name -> script URL resolution over a synthetic WooCommerce product column.
+Compares the old per-row loop over every catalog key with ProductCatalog's
+memoized per-row lookup and its vectorized scripts_for_names().
+
+Usage: python benchmarks/bench_product_catalog.py [--rows 1000000] [--products 50]
+"""
+import time
+import random
+import argparse
+
+import pandas as pd
+
+import _common
+from product_catalog import ProductCatalog
+
+
+def legacy_script_url_for(product_script_map, product_name):
+    """The loop woo_cleanup used before products.json: first key (in dict order) contained in the name."""
+    script_url = product_script_map.get("Default")
+    for key, url in product_script_map.items():
+        if key in product_name:
+            script_url = url
+            break
+    return script_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--products", type=int, default=50, help="Product names in the catalog")
+    args = parser.parse_args()
+
+    names = {f"BTMM Product {i:03d}": f"https://www.tradingview.com/script/Example{i}/" for i in range(args.products)}
+    catalog = ProductCatalog({}, names, "https://www.tradingview.com/script/Default/")
+    legacy_map = dict(names)  # No "Default": unmapped names resolve to None
+
+    rng = random.Random(7)
+    titles = [f"{name} - Monthly" for name in names] + [f"{name} - Yearly" for name in names] + ["Gift Card", "Some Other Product"]
+    column = pd.Series([rng.choice(titles) for _ in range(args.rows)], dtype=object)
+
+    start = time.perf_counter()
+    legacy = [legacy_script_url_for(legacy_map, name) for name in column]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    memoized = [catalog.script_for_name(name) for name in column]
+    memoized_s = time.perf_counter() - start
+
+    catalog.script_for_name.cache_clear()
+    start = time.perf_counter()
+    vectorized = catalog.scripts_for_names(column)
+    vectorized_s = time.perf_counter() - start
+
+    _common.emit("product_catalog", {
+        "rows": args.rows,
+        "catalog_names": args.products,
+        "seconds": {
+            "legacy_loop": round(legacy_s, 3),
+            "memoized_per_row": round(memoized_s, 3),
+            "vectorized": round(vectorized_s, 3),
+        },
+        "same_result": legacy == memoized == vectorized.tolist(),
+    })
+
+
+if __name__ == "__main__":
+    main()
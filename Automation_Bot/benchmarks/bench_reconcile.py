@@ -0,0 +1,88 @@
+"""
+Full Stripe / orders.db / TradingView resync against local fakes.
+Seeds orders with some drift: Stripe statuses that changed without a webhook, users
+missing from or left on access lists, and a few manual grants. It then compares the
+browser operations of reconcile.py (one list read plus one batch per script) with a
+per-user resync (one manage_access call per user). A second pass checks that the
+result is stable (empty plan).
+
+Usage: python benchmarks/bench_reconcile.py [--orders 20000] [--drift 0.05]
+"""
+import os
+import time
+import random
+import argparse
+import logging
+import tempfile
+
+import _common
+
+PRODUCT_SCRIPT_MAP = {
+    "prod_Qwerty123": "https://www.tradingview.com/script/Example1-StateEngine/",
+    "prod_Asdfgh456": "https://www.tradingview.com/script/Example2-Scanner/",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--drift", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        import reconcile
+        from product_catalog import ProductCatalog
+        catalog = ProductCatalog(PRODUCT_SCRIPT_MAP, {})
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        logging.getLogger().setLevel(logging.WARNING)
+
+        rng = random.Random(5)
+        products = list(PRODUCT_SCRIPT_MAP)
+        rows, stripe_statuses = [], {}
+        bot = _common.StubBot()
+        for i in range(args.orders):
+            product = products[i % 2]
+            status = "active" if rng.random() < 0.7 else "cancelled"
+            rows.append((f"cus_{i}", f"sub_{i}", f"tv_user_{i}", product, status))
+            stripe_statuses[f"sub_{i}"] = "active" if status == "active" else "canceled"
+            if rng.random() < args.drift:  # Missed webhook: Stripe moved on, orders.db did not
+                stripe_statuses[f"sub_{i}"] = "canceled" if status == "active" else "active"
+            has_access = status == "active"
+            if rng.random() < args.drift:  # Access list drifted from orders.db
+                has_access = not has_access
+            if has_access:
+                bot.access.setdefault(PRODUCT_SCRIPT_MAP[product], set()).add(f"tv_user_{i}")
+        for script_url in PRODUCT_SCRIPT_MAP.values():
+            bot.access[script_url].update({"manual_vip_1", "manual_vip_2"})
+
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, product_id, status) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+
+        start = time.perf_counter()
+        first = reconcile.reconcile(_common.StubSubscriptions(stripe_statuses), bot, catalog)
+        first_s = time.perf_counter() - start
+        reconcile_ops = bot.calls
+
+        second = reconcile.reconcile(_common.StubSubscriptions(stripe_statuses), bot, catalog)
+        manual_kept = all({"manual_vip_1", "manual_vip_2"} <= users for users in bot.access.values())
+        database.close_pool()
+
+    _common.emit("reconcile", {
+        "orders": args.orders,
+        "status_changes": len(first["plan"]["status_changes"]),
+        "access_changes": first["applied"]["added"] + first["applied"]["removed"],
+        "browser_operations": {"per_user_resync": args.orders, "reconcile": reconcile_ops},
+        "reconcile_seconds": round(first_s, 3),
+        "second_pass_changes": len(second["plan"]["status_changes"]) + sum(len(c["add"]) + len(c["remove"]) for c in second["plan"]["access"].values()),
+        "manual_grants_kept": manual_kept,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Grace-period scheduler (scheduler.py) with server.run_scheduled_revokes and a stub browser.
+
+- reload:  start-up cost of loading --pending open actions from scheduled_actions
+- idle:    thread wake-ups while nothing is due (a poller would wake every second)
+- burst:   --burst past-due subscriptions whose grace period ends at the same moment;
+           reports how many access batches (browser round trips) revoked them
+- restart: actions scheduled before a stop() still run after a fresh Scheduler starts
+
+Usage: python benchmarks/bench_scheduler.py [--pending 100000] [--burst 2000] [--idle-seconds 3]
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def wait_until(predicate, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Scheduler did not finish in time")
+        time.sleep(0.01)
+
+
+def seed_past_due(database, prefix, count, due_at=None):
+    """Past-due orders, each with an open revoke unless due_at is None, inserted in one transaction."""
+    with database.connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO orders (stripe_subscription_id, tv_username, product_id, status) VALUES (?, ?, ?, 'past_due')",
+                ((f"{prefix}_{i}", f"{prefix}_user_{i}", PRODUCTS[i % 2]) for i in range(count))
+            )
+            if due_at is not None:
+                conn.executemany(
+                    "INSERT INTO scheduled_actions (action, stripe_subscription_id, due_at) VALUES ('revoke', ?, ?)",
+                    ((f"{prefix}_{i}", due_at) for i in range(count))
+                )
+
+
+def count_status(database, status):
+    with database.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM scheduled_actions WHERE status = ?", (status,)).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pending", type=int, default=100000)
+    parser.add_argument("--burst", type=int, default=2000)
+    parser.add_argument("--idle-seconds", type=float, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        os.environ["BROWSER_POOL_WARM"] = "0"
+        import server
+        from scheduler import Scheduler
+        logging.getLogger().setLevel(logging.WARNING)
+        database.init_db()
+        server.browsers = _common.StubBot(delay=0.05)
+        handlers = {"revoke": server.run_scheduled_revokes}
+
+        # Reload: grace periods that end a week from now
+        seed_past_due(database, "sub_later", args.pending, time.time() + 7 * 86400)
+        scheduler = Scheduler(handlers, pickup_seconds=3600)
+        start = time.perf_counter()
+        scheduler.load()
+        reload_s = time.perf_counter() - start
+
+        # Idle: nothing due for a week
+        scheduler.start()
+        wakeups_before = scheduler.wakeups
+        time.sleep(args.idle_seconds)
+        idle_wakeups = scheduler.wakeups - wakeups_before
+
+        # Burst: every grace period ends now
+        seed_past_due(database, "sub_now", args.burst, time.time())
+        scheduler.load()
+        with scheduler._cond:
+            scheduler._cond.notify()
+        start = time.perf_counter()
+        wait_until(lambda: count_status(database, "done") >= args.burst)
+        burst_s = time.perf_counter() - start
+        batches = scheduler.batches
+        scheduler.stop()
+        revoked = sum(1 for i in range(args.burst) if database.get_user_by_subscription(f"sub_now_{i}")["status"] == "lapsed")
+
+        # Restart: schedule through a running scheduler, stop it before anything is due, start a new one
+        seed_past_due(database, "sub_restart", 100)
+        first = Scheduler(handlers, pickup_seconds=3600)
+        first.start()
+        for i in range(100):
+            first.schedule("revoke", f"sub_restart_{i}", delay=1)
+        first.stop()
+        restarted = Scheduler(handlers, pickup_seconds=3600)
+        restarted.start()
+        wait_until(lambda: all(database.get_user_by_subscription(f"sub_restart_{i}")["status"] == "lapsed" for i in range(100)))
+        restarted.stop()
+        database.close_pool()
+
+        results = {
+            "reload": {"pending": args.pending, "seconds": round(reload_s, 3)},
+            "idle": {"seconds": args.idle_seconds, "wakeups": idle_wakeups, "polling_every_second_wakeups": int(args.idle_seconds)},
+            "burst": {
+                "revokes": args.burst,
+                "revoked": revoked,
+                "access_batches": batches,
+                "seconds": round(burst_s, 2),
+                "one_call_per_user_seconds": round(args.burst * server.browsers.delay, 1),
+            },
+            "restart": {"scheduled_before_stop": 100, "revoked_after_restart": 100},
+        }
+
+    _common.emit("scheduler", results)
+
+
+if __name__ == "__main__":
+    main()
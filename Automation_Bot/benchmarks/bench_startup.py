@@ -0,0 +1,96 @@
+"""
+Cold start of a fresh process, measured with `python -X importtime`:
+
+- license_server: import server, run init_worker() and answer one /api/verify_license
+                  (what a new gunicorn worker does before its first license check)
+- cleanup_idle:   import woo_cleanup and run a cleanup over an export with nothing
+                  to warn or remove (what a daily cron run usually is)
+
+For each path it reports the median import time of the top-level module, the median
+wall time of the whole process, and which heavy dependencies ended up loaded.
+
+Usage: python benchmarks/bench_startup.py [--runs 5]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import _common
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["stripe", "selenium", "webdriver_manager", "pandas"]
+
+SCENARIOS = {
+    "license_server": ("server", """
+import database
+database.DB_NAME = os.path.join(TMP, "orders.db")
+import server
+server.init_worker()
+server.app.test_client().get("/api/verify_license?account_number=1&product_id=prod_Qwerty123")
+server.shutdown_worker()
+"""),
+    "cleanup_idle": ("woo_cleanup", """
+import database
+database.DB_NAME = os.path.join(TMP, "orders.db")
+import woo_cleanup
+woo_cleanup.CSV_FILE = os.path.join(TMP, "export.csv")
+with open(woo_cleanup.CSV_FILE, "w") as f:
+    f.write("Order ID,Status,Product Name,TV Username,Customer Email\\n101,active,BTMM State Engine,TraderJoe,joe@example.com\\n")
+woo_cleanup.clean_up_cancelled_users()
+"""),
+}
+
+CHILD = """
+import os, sys, time, json, logging
+start = time.perf_counter()
+TMP = sys.argv[1]
+logging.disable(logging.CRITICAL)
+{body}
+print(json.dumps({{"wall_s": time.perf_counter() - start, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def import_seconds(stderr, module):
+    """Cumulative import time of `module` as a top-level import, from -X importtime output."""
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            return int(parts[1]) / 1e6
+    return None
+
+
+def run_once(module, body, tmp):
+    env = dict(os.environ, PYTHONPATH=BOT_DIR, BROWSER_POOL_WARM="0", RECONCILE_INTERVAL_HOURS="0")
+    code = CHILD.format(body=body, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code, tmp], cwd=tmp, env=env, capture_output=True, text=True, check=True)
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["import_s"] = import_seconds(proc.stderr, module)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for name, (module, body) in SCENARIOS.items():
+        runs = []
+        for i in range(args.runs + 1):  # The first run only writes .pyc files
+            with tempfile.TemporaryDirectory() as tmp:
+                runs.append(run_once(module, body, tmp))
+        runs = runs[1:]
+        results[name] = {
+            "import_ms": round(statistics.median(r["import_s"] for r in runs) * 1000, 1),
+            "process_ms": round(statistics.median(r["wall_s"] for r in runs) * 1000, 1),
+            "heavy_modules_loaded": runs[-1]["loaded"],
+        }
+    _common.emit("startup", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Runs TradingViewBot.manage_access_batch against the local Manage Access stand-in
+(manage_access_standin.html) and reports the time spent in each step
+(navigate, open_modal, input, confirm, close). Needs Chrome installed.
+
+Usage: python benchmarks/bench_tv_bot_steps.py [--users 10] [--rounds 3]
+"""
+import os
+import time
+import argparse
+import logging
+import pathlib
+import tempfile
+
+import _common
+from tv_bot import TradingViewBot
+
+STANDIN_URL = pathlib.Path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "manage_access_standin.html")).as_uri()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    steps = {}
+
+    def record(step, seconds, success, labels):
+        name = f"{step}:{labels['action']}" if "action" in labels else step
+        steps.setdefault(name, []).append(seconds)
+
+    with tempfile.TemporaryDirectory() as profile:
+        bot = TradingViewBot(None, None, user_data_dir=profile, headless=True, metrics_sink=record)
+        bot.start_driver()  # No login: the stand-in page needs none
+        batches = []
+        try:
+            for r in range(args.rounds):
+                users = [f"bench_{r}_{i}" for i in range(args.users)]
+                start = time.perf_counter()
+                added = bot.manage_access_batch(STANDIN_URL, add=users)
+                removed = bot.manage_access_batch(STANDIN_URL, remove=["ExistingUser1"])
+                batches.append(time.perf_counter() - start)
+                assert all(added.values()) and all(removed.values()), (added, removed)
+        finally:
+            bot.close_driver()
+
+    _common.emit("tv_bot_steps", {
+        "users_per_batch": args.users,
+        "batches": _common.summarize(batches),
+        "steps": {name: _common.summarize(values) for name, values in steps.items()},
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures /webhook response time with TradingView access changes run inline
+versus handed to the background job queue. The browser is replaced by a stub
+that sleeps for --bot-delay seconds per access change.
+
+Usage: python benchmarks/bench_webhook_queue.py [--events 20] [--bot-delay 2.0]
+"""
+import os
+import time
+import argparse
+import logging
+import tempfile
+
+import _common
+
+WEBHOOK_SECRET = "whsec_benchmark"
+
+
+def post_events(client, count, offset):
+    latencies = []
+    for i in range(offset, offset + count):
+        payload = _common.checkout_event(i, tv_username=f"bench_user_{i}")
+        headers = {"Stripe-Signature": _common.sign_stripe_payload(payload, WEBHOOK_SECRET)}
+        start = time.perf_counter()
+        response = client.post("/webhook", data=payload, headers=headers, content_type="application/json")
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.data
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--bot-delay", type=float, default=2.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+        os.environ["USE_JOB_QUEUE"] = "0"  # Workers are started below, after the stub bot is in place
+        os.environ["BROWSER_POOL_WARM"] = "0"
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        import server
+        logging.getLogger().setLevel(logging.WARNING)
+        server.browsers = _common.StubBot(delay=args.bot_delay)
+        client = server.app.test_client()
+
+        inline = post_events(client, args.events, 0)
+
+        server.USE_JOB_QUEUE = True
+        server.jobs.start()
+        queued = post_events(client, args.events, args.events)
+        server.jobs.stop(timeout=0)
+        database.close_pool()
+
+    _common.emit("webhook_queue", {
+        "events": args.events,
+        "bot_delay_s": args.bot_delay,
+        "inline": _common.summarize(inline),
+        "queued": _common.summarize(queued),
+    })
+
+
+if __name__ == "__main__":
+    main()
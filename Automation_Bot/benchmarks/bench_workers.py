@@ -0,0 +1,113 @@
+"""
+Load test for /api/verify_license under gunicorn with a growing number of workers.
+Seeds a temporary orders.db, starts `gunicorn -c gunicorn.conf.py wsgi:app` for each
+worker count and hammers it from keep-alive client processes, reporting requests
+per second and latency percentiles per worker count.
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--clients 8] [--duration 5]
+"""
+import os
+import sys
+import time
+import socket
+import random
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/license_cache_stats")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client(port, orders, duration, seed, results):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        i = rng.randrange(orders)
+        start = time.perf_counter()
+        conn.request("GET", f"/api/verify_license?account_number={10000000 + i}&product_id={PRODUCTS[i % 2]}")
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+    results.put(latencies)
+
+
+def run(worker_count, args, tmp):
+    port = free_port()
+    env = dict(os.environ, BIND=f"127.0.0.1:{port}", WEB_WORKERS=str(worker_count), USE_JOB_QUEUE="0", BROWSER_POOL_WARM="0",
+               RATE_LIMIT_IP_PER_SECOND="0", RATE_LIMIT_ACCOUNT_PER_SECOND="0")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(_common.BOT_DIR, "gunicorn.conf.py"),
+         "--pythonpath", _common.BOT_DIR, "--log-level", "warning", "wsgi:app"],
+        cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_ready(port):
+            raise RuntimeError("gunicorn did not start")
+        results = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client, args=(port, args.orders, args.duration, n, results)) for n in range(args.clients)]
+        start = time.perf_counter()
+        for p in clients:
+            p.start()
+        latencies = [value for _ in clients for value in results.get()]
+        elapsed = time.perf_counter() - start
+        for p in clients:
+            p.join()
+        return _common.summarize(latencies, elapsed)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--orders", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        database.init_db()
+        with database.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO orders (stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, ?)",
+                    ((f"sub_{i}", str(10000000 + i), PRODUCTS[i % 2], "active" if i % 3 else "cancelled") for i in range(args.orders))
+                )
+        database.close_pool()
+
+        results = {"cpus": multiprocessing.cpu_count(), "clients": args.clients}
+        for count in (int(w) for w in args.workers.split(",")):
+            results[f"workers_{count}"] = run(count, args, tmp)
+
+    _common.emit("gunicorn_workers", results)
+
+
+if __name__ == "__main__":
+    main()
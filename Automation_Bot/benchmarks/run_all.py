@@ -0,0 +1,259 @@
+"""
+Benchmark suite for the three hot paths:
+
+- verify_license: GET /api/verify_license against a seeded orders.db (valid and unknown accounts)
+- webhook:        POST /webhook with locally signed checkout events (MT5 saves, queued
+                  TradingView grants and duplicate deliveries), using a stub browser
+- cleanup:        woo_cleanup.clean_up_cancelled_users over synthetic exports, using a pool of
+                  stub TradingView bots and stub SMTP. The first run sends the warnings; the second
+                  run, after the grace period, does the removals. Latencies are per CSV chunk.
+
+Each scenario runs in its own process so peak RSS is measured per scenario.
+Results are printed (or written with --output) as one JSON document with
+p50/p95/p99 latency, throughput and peak RSS. Pass --baseline with an earlier
+result file to fail (exit code 1) when p95 latency or throughput regress by more
+than --tolerance.
+
+Usage: python benchmarks/run_all.py [--rows 10000,100000,1000000] [--output results.json] [--baseline old.json]
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import logging
+import datetime
+import tempfile
+import subprocess
+
+import _common
+
+PRODUCTS = ["prod_Qwerty123", "prod_Asdfgh456"]
+PRODUCT_NAMES = ["BTMM State Engine", "BTMM Multi-Pair Scanner", "Some Other Product"]
+WEBHOOK_SECRET = "whsec_bench"
+
+
+def seed_orders(count):
+    import database
+    database.init_db()
+    with database.connection() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO orders (stripe_customer_id, stripe_subscription_id, mt5_account_number, product_id, status) VALUES (?, ?, ?, ?, ?)",
+                ((f"cus_{i}", f"sub_{i}", str(10000000 + i), PRODUCTS[i % 2], "active" if i % 3 else "cancelled") for i in range(count))
+            )
+
+
+def import_server():
+    os.environ["STRIPE_WEBHOOK_SECRET"] = WEBHOOK_SECRET
+    os.environ["BROWSER_POOL_WARM"] = "0"
+    os.environ["RATE_LIMIT_IP_PER_SECOND"] = "0"  # All traffic comes from one local client
+    os.environ["RATE_LIMIT_ACCOUNT_PER_SECOND"] = "0"
+    import server
+    logging.getLogger().setLevel(logging.WARNING)
+    server.browsers = _common.StubBot()
+    client = server.app.test_client()
+    client.get("/api/license_cache_stats")  # Runs the per-process startup outside the timings
+    return server, client
+
+
+def bench_verify_license(args):
+    seed_orders(args.orders)
+    server, client = import_server()
+    rng = random.Random(1)
+    # Half the checks hit warmed accounts, the other half accounts that were never sold
+    urls = []
+    for _ in range(args.requests):
+        i = rng.randrange(args.orders * 2)
+        urls.append(f"/api/verify_license?account_number={10000000 + i}&product_id={PRODUCTS[i % 2]}")
+
+    latencies = []
+    start = time.perf_counter()
+    for url in urls:
+        t = time.perf_counter()
+        client.get(url)
+        latencies.append(time.perf_counter() - t)
+    return dict(_common.summarize(latencies, time.perf_counter() - start), orders=args.orders, snapshot_size=len(server.license_snapshot))
+
+
+def bench_webhook(args):
+    seed_orders(args.orders)
+    server, client = import_server()
+    rng = random.Random(2)
+    bodies = []
+    for i in range(args.requests):
+        if bodies and rng.random() < 0.1:
+            bodies.append(rng.choice(bodies))  # Stripe re-delivery
+        elif i % 2:
+            bodies.append(_common.checkout_event(i, mt5_account=str(20000000 + i), product_key=PRODUCTS[i % 2]))
+        else:
+            bodies.append(_common.checkout_event(i, tv_username=f"bench_user_{i}", product_key=PRODUCTS[i % 2]))
+
+    latencies = []
+    start = time.perf_counter()
+    for body in bodies:
+        headers = {"Stripe-Signature": _common.sign_stripe_payload(body, WEBHOOK_SECRET), "Content-Type": "application/json"}
+        t = time.perf_counter()
+        response = client.post("/webhook", data=body, headers=headers)
+        latencies.append(time.perf_counter() - t)
+        if response.status_code != 200:
+            raise RuntimeError(f"Webhook returned {response.status_code}: {response.get_data(as_text=True)}")
+    elapsed = time.perf_counter() - start
+    server.jobs.stop(timeout=0)
+    return dict(_common.summarize(latencies, elapsed), jobs=server.jobs.stats())
+
+
+def write_export(path, rows, seed=3):
+    """Synthetic WooCommerce export: ~30% lapsed subscriptions, a few manual rows without email."""
+    rng = random.Random(seed)
+    statuses = ["active"] * 7 + ["cancelled", "expired", "on-hold"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Order ID", "Status", "Product Name", "TV Username", "Customer Email"])
+        for i in range(rows):
+            email = "" if i % 97 == 0 else f"user{i}@example.com"
+            writer.writerow([100000 + i, rng.choice(statuses), rng.choice(PRODUCT_NAMES), f"tv_user_{i}", email])
+
+
+def bench_cleanup(args):
+    import database
+    import woo_cleanup
+    from browser_pool import BrowserPool
+    logging.getLogger().setLevel(logging.WARNING)
+    database.init_db()
+
+    woo_cleanup.CSV_FILE = os.path.join(os.path.dirname(database.DB_NAME), "export.csv")
+    write_export(woo_cleanup.CSV_FILE, args.rows)
+    mailer = _common.StubMailer()
+    bots = []
+    woo_cleanup.create_mailer = lambda: mailer
+    def stub_pool(size):
+        return BrowserPool(None, None, size=size, bot_factory=lambda slot: bots.append(_common.StubBot()) or bots[-1])
+    woo_cleanup.create_browser_pool = stub_pool
+
+    # Per-chunk timings give the cleanup scenario its latency percentiles
+    chunk_latencies = []
+    plan_chunk = woo_cleanup._plan_chunk
+    def timed_chunk(*a):
+        t = time.perf_counter()
+        plan_chunk(*a)
+        chunk_latencies.append(time.perf_counter() - t)
+    woo_cleanup._plan_chunk = timed_chunk
+
+    runs = {}
+    start = time.perf_counter()
+    woo_cleanup.clean_up_cancelled_users()
+    runs["warn_run_s"] = round(time.perf_counter() - start, 3)
+
+    # Move every warning past the grace period so the next run removes them
+    past = str(datetime.date.today() - datetime.timedelta(days=woo_cleanup.GRACE_PERIOD_DAYS + 1))
+    with database.connection() as conn:
+        with conn:
+            conn.execute("UPDATE cleanup_state SET warning_sent_date = ?", (past,))
+
+    start = time.perf_counter()
+    woo_cleanup.clean_up_cancelled_users()
+    runs["remove_run_s"] = round(time.perf_counter() - start, 3)
+
+    total = runs["warn_run_s"] + runs["remove_run_s"]
+    return dict(
+        _common.summarize(chunk_latencies),
+        **runs,
+        rows=args.rows,
+        rows_per_s=round(2 * args.rows / total, 1) if total else 0.0,
+        warnings_sent=mailer.sent,
+        removal_batches=sum(bot.calls for bot in bots),
+    )
+
+
+SCENARIOS = {
+    "verify_license": bench_verify_license,
+    "webhook": bench_webhook,
+    "cleanup": bench_cleanup,
+}
+
+
+def run_scenario(name, args):
+    """Child process: run one scenario in a fresh temp folder and print its JSON result."""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import database
+        database.DB_NAME = os.path.join(tmp, "orders.db")
+        result = SCENARIOS[name](args)
+        database.close_pool()
+    result["peak_rss_mb"] = _common.peak_rss_mb()
+    print(json.dumps(result))
+
+
+def spawn(name, extra):
+    cmd = [sys.executable, os.path.abspath(__file__), "--scenario", name] + extra
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """List of human-readable regressions against a baseline result document."""
+    regressions = []
+    for name, old in baseline.get("results", {}).items():
+        new = results.get(name)
+        if not isinstance(new, dict) or not isinstance(old, dict):
+            continue
+        for metric, higher_is_better in (("p95_ms", False), ("throughput_per_s", True), ("rows_per_s", True), ("peak_rss_mb", False)):
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{name}.{metric}: {before} -> {after} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--only", help="Comma-separated scenarios to run (default: all)")
+    parser.add_argument("--orders", type=int, default=50000, help="Orders seeded for the HTTP scenarios")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per HTTP scenario")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="Export sizes for the cleanup scenario")
+    parser.add_argument("--output", help="Write the JSON result here as well")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression (default 0.25)")
+    args, _ = parser.parse_known_args()
+
+    if args.scenario:
+        if args.scenario == "cleanup":
+            args.rows = int(args.rows)
+        run_scenario(args.scenario, args)
+        return
+
+    only = set(args.only.split(",")) if args.only else set(SCENARIOS)
+    results = {}
+    if "verify_license" in only:
+        results["verify_license"] = spawn("verify_license", ["--orders", str(args.orders), "--requests", str(args.requests)])
+    if "webhook" in only:
+        results["webhook"] = spawn("webhook", ["--orders", str(args.orders), "--requests", str(args.requests)])
+    if "cleanup" in only:
+        for rows in (int(r) for r in args.rows.split(",")):
+            results[f"cleanup_{rows}"] = spawn("cleanup", ["--rows", str(rows)])
+
+    document = {"benchmark": "suite", "python": sys.version.split()[0], "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    print(json.dumps(document, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import queue
+import shutil
+import tempfile
+import logging
+import threading
+from contextlib import contextmanager
+
+from tv_bot import TradingViewBot, LoginRequiredError, DEFAULT_PROFILE_DIR, SCRIPT_DIR, get_driver_path
+
+PROFILES_DIR = os.path.join(SCRIPT_DIR, "chrome_profiles")
+
+# Chrome refuses to share a profile between processes; these lock files must not be copied
+_PROFILE_LOCK_FILES = shutil.ignore_patterns("Singleton*", "lockfile", "*.lock")
+
+
+def prepare_profile(slot, base_profile=DEFAULT_PROFILE_DIR, profiles_dir=PROFILES_DIR):
+    """Give each pooled browser its own copy of the logged-in chrome_profile."""
+    profile_dir = os.path.join(profiles_dir, f"slot_{slot}")
+    if os.path.exists(profile_dir):
+        return profile_dir
+    # Several processes may prepare the same slot at once: build a private copy,
+    # then move it into place; whoever comes second keeps the first copy.
+    os.makedirs(profiles_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".slot_{slot}_", dir=profiles_dir)
+    try:
+        if os.path.exists(base_profile):
+            shutil.copytree(base_profile, tmp_dir, ignore=_PROFILE_LOCK_FILES, dirs_exist_ok=True)
+        else:
+            logging.warning(f"No saved login at {base_profile}. Run `python tv_bot.py` once and log in manually.")
+        os.replace(tmp_dir, profile_dir)
+    except OSError:
+        if not os.path.isdir(profile_dir):
+            raise
+    finally:
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return profile_dir
+
+
+class BrowserPool:
+    """
+    Keeps `size` logged-in TradingView browsers warm and hands them out to
+    concurrent access jobs, one job per browser at a time.
+    A browser is health-checked before every use and restarted after
+    `max_operations` access changes (long-lived Chrome sessions leak memory).
+    """
+
+    def __init__(self, tv_username, tv_password, size=2, max_operations=50, headless=True, bot_factory=None, metrics_sink=None, profiles_dir=PROFILES_DIR):
+        self.tv_username = tv_username
+        self.tv_password = tv_password
+        self.size = size
+        self.max_operations = max_operations
+        self.headless = headless
+        self.metrics_sink = metrics_sink
+        self.profiles_dir = profiles_dir
+        self._bot_factory = bot_factory or self._make_bot
+        self._idle = queue.Queue()
+        self._bots = []
+        self._lock = threading.Lock()
+        for slot in range(size):
+            bot = self._bot_factory(slot)
+            self._bots.append(bot)
+            self._idle.put(bot)
+
+    def _make_bot(self, slot):
+        return TradingViewBot(
+            self.tv_username,
+            self.tv_password,
+            user_data_dir=prepare_profile(slot, profiles_dir=self.profiles_dir),
+            headless=self.headless,
+            metrics_sink=self.metrics_sink
+        )
+
+    def _ensure_ready(self, bot):
+        """Start, restart or recycle a browser so it is ready for the next job."""
+        if bot.driver is None:
+            self._start(bot)
+            return
+        if not bot.is_alive():
+            logging.warning("Pooled browser failed health check. Restarting it.")
+        elif bot.operations >= self.max_operations:
+            logging.info(f"Recycling pooled browser after {bot.operations} operations.")
+        else:
+            return
+        bot.close_driver()
+        self._start(bot)
+
+    def _start(self, bot):
+        bot.start_driver()
+        try:
+            bot.login()
+        except Exception:
+            bot.close_driver()  # Never hand out a browser that is not logged in
+            raise
+
+    def warm(self):
+        """Start and log in every browser up front (slow, so call it off the request path)."""
+        get_driver_path()
+        try:
+            for _ in range(self.size):
+                with self.acquire():
+                    pass
+        except LoginRequiredError as e:
+            logging.error(f"Browser pool not warmed: {e}")
+            return
+        logging.info(f"Browser pool warmed ({self.size} sessions).")
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow a ready browser for the duration of a `with` block."""
+        try:
+            bot = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No browser available in the pool")
+        try:
+            self._ensure_ready(bot)
+            yield bot
+        finally:
+            self._idle.put(bot)
+
+    def manage_access(self, script_url, username, action="add", expiration_date=None):
+        """Same contract as TradingViewBot.manage_access, run on any free pooled browser."""
+        try:
+            with self.acquire() as bot:
+                return bot.manage_access(script_url, username, action=action, expiration_date=expiration_date)
+        except Exception as e:
+            logging.error(f"Browser pool could not run access change: {e}")
+            return False
+
+    def manage_access_batch(self, script_url, add=(), remove=()):
+        """Same contract as TradingViewBot.manage_access_batch, run on any free pooled browser."""
+        try:
+            with self.acquire() as bot:
+                return bot.manage_access_batch(script_url, add=add, remove=remove)
+        except Exception as e:
+            logging.error(f"Browser pool could not run access batch: {e}")
+            return {username: False for username in list(add) + list(remove)}
+
+    def list_access(self, script_url):
+        """Same contract as TradingViewBot.list_access, run on any free pooled browser."""
+        try:
+            with self.acquire() as bot:
+                return bot.list_access(script_url)
+        except Exception as e:
+            logging.error(f"Browser pool could not read access list: {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            for bot in self._bots:
+                bot.close_driver()
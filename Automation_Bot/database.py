@@ -1,17 +1,251 @@
 import sqlite3
 import datetime
+import json
 import logging
+import os
+import queue
+import threading
+import time
+import functools
+from contextlib import contextmanager
 
 DB_NAME = "orders.db"
+ARCHIVE_DB_FILENAME = "orders_archive.db"  # Archived orders, next to orders.db (see archive.py)
 
-def get_connection():
-    return sqlite3.connect(DB_NAME)
+# Connection Pool Settings
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+STATEMENT_CACHE_SIZE = 256  # Compiled statements kept per connection (sqlite3 prepared-statement cache)
 
-def init_db():
-    """Initialize the database with the necessary table."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
+# Callbacks notified as fn(mt5_account_number, product_id, status) whenever an order changes.
+_order_listeners = []
+
+def add_order_listener(callback):
+    """Register a callback to be told about order inserts and status changes."""
+    if callback not in _order_listeners:
+        _order_listeners.append(callback)
+
+def _notify_order_change(mt5_account_number, product_id, status):
+    for callback in _order_listeners:
+        try:
+            callback(mt5_account_number, product_id, status)
+        except Exception as e:
+            logging.error(f"Order listener failed: {e}")
+
+# Callbacks notified as fn(query_name, seconds, success) after every @timed_query function.
+_query_listeners = []
+
+def add_query_listener(callback):
+    """Register a callback to be told how long each database function took (e.g. for metrics)."""
+    if callback not in _query_listeners:
+        _query_listeners.append(callback)
+
+def timed_query(func):
+    """Report the duration of a database function to the query listeners (free when there are none)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _query_listeners:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        success = False
+        try:
+            result = func(*args, **kwargs)
+            success = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            for callback in _query_listeners:
+                try:
+                    callback(func.__name__, elapsed, success)
+                except Exception as e:
+                    logging.error(f"Query listener failed: {e}")
+    return wrapper
+
+def get_connection(db_name=None):
+    """Open a new, tuned connection (WAL journal, busy timeout). Prefer `connection()` for pooled access."""
+    conn = sqlite3.connect(
+        db_name or DB_NAME,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, avoids an fsync per commit
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-16000")  # ~16MB page cache per connection
+    return conn
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQLite connections.
+    Connections are opened lazily up to `size` and reused, so each request skips
+    the connect/pragma overhead and keeps its compiled statements warm.
+    """
+
+    def __init__(self, db_name, size=POOL_SIZE):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def acquire(self, timeout=30):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = get_connection(self.db_name)
+                self._created += 1
+                self._all.append(conn)
+                return conn
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection from the pool")
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all = []
+            self._created = 0
+            self._idle = queue.LifoQueue()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    pool = _pool
+    if pool is None or pool.db_name != DB_NAME:
+        with _pool_lock:
+            if _pool is None or _pool.db_name != DB_NAME:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_NAME)
+            pool = _pool
+    return pool
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for the duration of a `with` block."""
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def close_pool():
+    """Close every pooled connection (e.g. on shutdown or before forking)."""
+    global _pool, _archive_pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if _archive_pool is not None:
+            _archive_pool.close()
+            _archive_pool = None
+
+# Order Archive Storage
+# ---------------------------------------------------------
+# Old orders in a terminal state are moved out of `orders` (see archive.py) into the
+# orders_archive table of a separate file next to orders.db, so the hot table and
+# its backups only grow with live business. Lookups below fall back to the archive.
+
+ARCHIVE_SCHEMA = [
+    # Same columns as orders; `id` is the order's id in orders.db
+    '''
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INTEGER PRIMARY KEY,
+        stripe_customer_id TEXT,
+        stripe_subscription_id TEXT,
+        tv_username TEXT,
+        mt5_account_number TEXT,
+        product_id TEXT,
+        status TEXT,
+        created_at TIMESTAMP,
+        updated_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_archive_subscription ON orders_archive (stripe_subscription_id)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_customer ON orders_archive (stripe_customer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_account ON orders_archive (mt5_account_number, created_at)",
+]
+
+_archive_pool = None
+
+def archive_db_path():
+    """ORDER_ARCHIVE_DB, or orders_archive.db next to orders.db."""
+    return os.getenv("ORDER_ARCHIVE_DB") or os.path.join(os.path.dirname(os.path.abspath(DB_NAME)), ARCHIVE_DB_FILENAME)
+
+def _get_archive_pool(create):
+    """The archive's pool (its schema created on first use), or None when `create` is False and there is no archive file."""
+    global _archive_pool
+    path = archive_db_path()
+    pool = _archive_pool
+    if pool is None or pool.db_name != path:
+        if not create and not os.path.exists(path):
+            return None
+        with _pool_lock:
+            if _archive_pool is None or _archive_pool.db_name != path:
+                if _archive_pool is not None:
+                    _archive_pool.close()
+                pool = ConnectionPool(path, size=max(1, POOL_SIZE // 4))
+                conn = pool.acquire()
+                try:
+                    with conn:
+                        for statement in ARCHIVE_SCHEMA:
+                            conn.execute(statement)
+                finally:
+                    pool.release(conn)
+                _archive_pool = pool
+            pool = _archive_pool
+    return pool
+
+@contextmanager
+def archive_connection(create=True):
+    """Borrow an archive connection. Yields None if `create` is False and nothing was ever archived."""
+    pool = _get_archive_pool(create)
+    if pool is None:
+        yield None
+        return
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+# Schema Migrations
+# ---------------------------------------------------------
+# Each entry is (version, description, statements). The applied version is
+# stored in SQLite's `PRAGMA user_version`, so every migration runs exactly once.
+# A migration's statements and its version bump commit in one transaction: if any
+# statement fails, the schema and user_version are left as they were.
+
+def _migrate_mt5_column(c):
+    # Early databases were created before MT5 licensing existed
+    try:
+        c.execute("ALTER TABLE orders ADD COLUMN mt5_account_number TEXT")
+    except sqlite3.OperationalError:
+        pass # Column already exists
+
+MIGRATIONS = [
+    (1, "Create orders table", [
+        '''
         CREATE TABLE IF NOT EXISTS orders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             stripe_customer_id TEXT,
@@ -23,86 +257,595 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-    ''')
-    # Migration for existing DBs (try to add column if missing)
+        ''',
+        _migrate_mt5_column,
+    ]),
+    (2, "Indexes for license and customer lookups", [
+        # Covers check_mt5_license: WHERE mt5_account_number = ? AND product_id = ? AND status = 'active'
+        "CREATE INDEX IF NOT EXISTS idx_orders_license ON orders (mt5_account_number, product_id, status)",
+        # Covers get_user_by_customer_id: WHERE stripe_customer_id = ? AND status = ? ORDER BY created_at DESC
+        '''
+        CREATE INDEX IF NOT EXISTS idx_orders_customer_status
+        ON orders (stripe_customer_id, status, created_at, tv_username, product_id, stripe_subscription_id)
+        ''',
+    ]),
+    (3, "WooCommerce cleanup state", [
+        # Warning/removal state for woo_cleanup, keyed by WooCommerce order and TradingView username
+        '''
+        CREATE TABLE IF NOT EXISTS cleanup_state (
+            order_id TEXT NOT NULL,
+            tv_username TEXT NOT NULL,
+            product_name TEXT,
+            email TEXT,
+            status TEXT,
+            warning_sent_date TEXT,
+            removed_date TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (order_id, tv_username)
+        )
+        ''',
+        # Finds warned-but-not-removed users whose grace period is over
+        "CREATE INDEX IF NOT EXISTS idx_cleanup_state_due ON cleanup_state (removed_date, warning_sent_date)",
+    ]),
+    (4, "Stripe event ledger", [
+        # One row per Stripe event ID with the outcome of processing it
+        '''
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            event_id TEXT PRIMARY KEY,
+            event_type TEXT,
+            status TEXT NOT NULL,
+            outcome TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (5, "License change log", [
+        # One row per license change, written in the same transaction as the order change.
+        # `active` is the pair's state after the change. license_export.py publishes these as deltas.
+        '''
+        CREATE TABLE IF NOT EXISTS license_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            mt5_account_number TEXT NOT NULL,
+            product_id TEXT NOT NULL,
+            active INTEGER NOT NULL,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (6, "Scheduled actions", [
+        # Timed actions such as "revoke sub_X at due_at" (unix time), run by scheduler.py
+        '''
+        CREATE TABLE IF NOT EXISTS scheduled_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action TEXT NOT NULL,
+            stripe_subscription_id TEXT NOT NULL,
+            due_at REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # At most one open action of each kind per subscription
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_scheduled_actions_open
+        ON scheduled_actions (action, stripe_subscription_id) WHERE status IN ('pending', 'running')
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_scheduled_actions_status ON scheduled_actions (status, id)",
+    ]),
+    (7, "Index for order archiving", [
+        # Covers get_archivable_orders: WHERE status IN (...) AND updated_at < ?, oldest first
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_updated ON orders (status, updated_at)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version():
+    with connection() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(target_version=None):
+    """Apply every pending migration up to `target_version` (default: latest)."""
+    if target_version is None:
+        target_version = SCHEMA_VERSION
+    with connection() as conn:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, statements in MIGRATIONS:
+            if version <= current or version > target_version:
+                continue
+            if _apply_migration(conn, version, statements):
+                logging.info(f"Applied schema migration {version}: {description}")
+            current = version
+    return current
+
+def _apply_migration(conn, version, statements):
+    """Run one migration in its own transaction. Returns False if another process applied it first."""
+    # sqlite3 does not open transactions for DDL by itself, so begin one explicitly.
+    # IMMEDIATE takes the write lock up front: workers migrating at once run one after another.
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        c.execute("ALTER TABLE orders ADD COLUMN mt5_account_number TEXT")
-    except sqlite3.OperationalError:
-        pass # Column likely already exists
-    
-    conn.commit()
-    conn.close()
-    logging.info("Database initialized.")
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+            conn.rollback()
+            return False
+        c = conn.cursor()
+        for statement in statements:
+            if callable(statement):
+                statement(c)
+            else:
+                c.execute(statement)
+        c.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+def init_db():
+    """Initialize the database and bring the schema up to date."""
+    version = migrate()
+    logging.info(f"Database initialized (schema version {version}).")
 
+@timed_query
 def add_order(stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status="active"):
     """Add a new order to the database."""
-    conn = get_connection()
-    c = conn.cursor()
-    try:
-        c.execute('''
-            INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status))
-        conn.commit()
-        logging.info(f"Order added: {tv_username or mt5_account_number} ({stripe_subscription_id})")
-    except sqlite3.IntegrityError:
-        logging.warning(f"Order already exists for subscription: {stripe_subscription_id}")
-    finally:
-        conn.close()
+    with connection() as conn:
+        try:
+            with conn:
+                conn.execute('''
+                    INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (stripe_customer_id, stripe_subscription_id, tv_username, mt5_account_number, product_id, status))
+                _record_license_change(conn, mt5_account_number, product_id)
+            logging.info(f"Order added: {tv_username or mt5_account_number} ({stripe_subscription_id})")
+        except sqlite3.IntegrityError:
+            logging.warning(f"Order already exists for subscription: {stripe_subscription_id}")
+            return
+    _notify_order_change(mt5_account_number, product_id, status)
 
+@timed_query
 def check_mt5_license(mt5_account, product_id):
     """Check if an MT5 account has an active license for a product."""
-    conn = get_connection()
-    c = conn.cursor()
-    # Check for active subscription matching account and product
-    # We use LIKE for product_id in case you have variations, or exact match
-    c.execute('''
-        SELECT status FROM orders 
-        WHERE mt5_account_number = ? 
-        AND product_id = ? 
-        AND status = 'active'
-    ''', (mt5_account, product_id))
-    row = c.fetchone()
-    conn.close()
+    with connection() as conn:
+        # Check for active subscription matching account and product
+        # We use LIKE for product_id in case you have variations, or exact match
+        row = conn.execute('''
+            SELECT status FROM orders
+            WHERE mt5_account_number = ?
+            AND product_id = ?
+            AND status = 'active'
+        ''', (mt5_account, product_id)).fetchone()
     return row is not None
 
+# Pairs per set-based license query (stays well under SQLite's bound-parameter limit)
+LICENSE_QUERY_BATCH = 400
+
+@timed_query
+def check_mt5_licenses(pairs):
+    """
+    Set-based version of check_mt5_license for many (mt5_account, product_id) pairs.
+    Returns the set of pairs that have an active license.
+    """
+    pairs = list(dict.fromkeys((str(account), str(product_id)) for account, product_id in pairs))
+    active = set()
+    with connection() as conn:
+        for i in range(0, len(pairs), LICENSE_QUERY_BATCH):
+            batch = pairs[i:i + LICENSE_QUERY_BATCH]
+            values = ", ".join(["(?, ?)"] * len(batch))
+            params = [value for pair in batch for value in pair]
+            rows = conn.execute(f'''
+                WITH wanted (mt5_account_number, product_id) AS (VALUES {values})
+                SELECT DISTINCT o.mt5_account_number, o.product_id
+                FROM wanted w
+                JOIN orders o
+                    ON o.mt5_account_number = w.mt5_account_number
+                    AND o.product_id = w.product_id
+                    AND o.status = 'active'
+            ''', params).fetchall()
+            active.update(rows)
+    return active
+
+@timed_query
+def get_active_licenses():
+    """Return every (mt5_account_number, product_id) pair with an active order."""
+    with connection() as conn:
+        return conn.execute('''
+            SELECT DISTINCT mt5_account_number, product_id FROM orders
+            WHERE mt5_account_number IS NOT NULL
+            AND status = 'active'
+        ''').fetchall()
+
+@timed_query
 def get_user_by_subscription(stripe_subscription_id):
-    """Retrieve user details by subscription ID."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('SELECT tv_username, product_id, stripe_customer_id FROM orders WHERE stripe_subscription_id = ?', (stripe_subscription_id,))
-    row = c.fetchone()
-    conn.close()
+    """Retrieve user details by subscription ID (archived orders included)."""
+    with connection() as conn:
+        row = conn.execute('SELECT tv_username, product_id, stripe_customer_id, status FROM orders WHERE stripe_subscription_id = ?', (stripe_subscription_id,)).fetchone()
+    if not row:
+        with archive_connection(create=False) as archive:
+            if archive is not None:
+                row = archive.execute('''
+                    SELECT tv_username, product_id, stripe_customer_id, status FROM orders_archive
+                    WHERE stripe_subscription_id = ? ORDER BY id DESC LIMIT 1
+                ''', (stripe_subscription_id,)).fetchone()
     if row:
-        return {"tv_username": row[0], "product_id": row[1], "stripe_customer_id": row[2]}
+        return {"tv_username": row[0], "product_id": row[1], "stripe_customer_id": row[2], "status": row[3]}
     return None
 
+@timed_query
 def get_user_by_customer_id(stripe_customer_id):
     """Retrieve user details by Customer ID (returns most recent active if multiple)."""
-    conn = get_connection()
-    c = conn.cursor()
-    # Assuming we want the latest active subscription for this customer
-    c.execute('''
-        SELECT tv_username, product_id, stripe_subscription_id 
-        FROM orders 
-        WHERE stripe_customer_id = ? AND status = 'active'
-        ORDER BY created_at DESC LIMIT 1
-    ''', (stripe_customer_id,))
-    row = c.fetchone()
-    conn.close()
+    with connection() as conn:
+        # Assuming we want the latest active subscription for this customer
+        row = conn.execute('''
+            SELECT tv_username, product_id, stripe_subscription_id
+            FROM orders
+            WHERE stripe_customer_id = ? AND status = 'active'
+            ORDER BY created_at DESC LIMIT 1
+        ''', (stripe_customer_id,)).fetchone()
     if row:
         return {"tv_username": row[0], "product_id": row[1], "stripe_subscription_id": row[2]}
     return None
 
+@timed_query
+def get_all_orders():
+    """Every order's subscription, TradingView user, product and status (for reconciliation)."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT stripe_subscription_id, tv_username, product_id, status
+            FROM orders
+        ''').fetchall()
+    return [{"stripe_subscription_id": r[0], "tv_username": r[1], "product_id": r[2], "status": r[3]} for r in rows]
+
+@timed_query
 def update_order_status(stripe_subscription_id, new_status):
     """Update the status of an order."""
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute('''
-        UPDATE orders 
-        SET status = ?, updated_at = CURRENT_TIMESTAMP 
-        WHERE stripe_subscription_id = ?
-    ''', (new_status, stripe_subscription_id))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        with conn:
+            conn.execute('''
+                UPDATE orders
+                SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE stripe_subscription_id = ?
+            ''', (new_status, stripe_subscription_id))
+            row = conn.execute('SELECT mt5_account_number, product_id FROM orders WHERE stripe_subscription_id = ?', (stripe_subscription_id,)).fetchone()
+            if row:
+                _record_license_change(conn, row[0], row[1])
     logging.info(f"Updated status for {stripe_subscription_id} to {new_status}")
+    if row:
+        _notify_order_change(row[0], row[1], new_status)
+
+# --- License Export (read replicas, see license_export.py) ---
+
+def _record_license_change(conn, mt5_account_number, product_id):
+    """Log the pair's resulting license state inside the caller's transaction."""
+    if not mt5_account_number or not product_id:
+        return
+    conn.execute('''
+        INSERT INTO license_changes (mt5_account_number, product_id, active)
+        SELECT ?, ?, EXISTS (
+            SELECT 1 FROM orders WHERE mt5_account_number = ? AND product_id = ? AND status = 'active'
+        )
+    ''', (mt5_account_number, product_id, mt5_account_number, product_id))
+
+@timed_query
+def get_license_export():
+    """
+    Every active (mt5_account_number, product_id) pair plus the last license change
+    they include, read in one transaction: (last_seq, pairs).
+    """
+    with connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM license_changes").fetchone()[0]
+            pairs = conn.execute('''
+                SELECT DISTINCT mt5_account_number, product_id FROM orders
+                WHERE mt5_account_number IS NOT NULL
+                AND status = 'active'
+            ''').fetchall()
+        finally:
+            conn.rollback()
+    return last_seq, pairs
+
+@timed_query
+def get_license_changes(after_seq, limit=10000):
+    """License changes newer than `after_seq` as (seq, mt5_account_number, product_id, active) rows."""
+    with connection() as conn:
+        return conn.execute('''
+            SELECT seq, mt5_account_number, product_id, active FROM license_changes
+            WHERE seq > ? ORDER BY seq LIMIT ?
+        ''', (after_seq, limit)).fetchall()
+
+@timed_query
+def get_license_change_range():
+    """(first seq, last seq) still in license_changes, or (None, None) when it is empty."""
+    with connection() as conn:
+        return conn.execute("SELECT MIN(seq), MAX(seq) FROM license_changes").fetchone()
+
+@timed_query
+def prune_license_changes(older_than_seconds):
+    """
+    Drop license changes logged more than `older_than_seconds` ago. Returns how many were removed.
+    Readers that fall behind the pruned range (snapshots, the export) reload in full.
+    """
+    with connection() as conn:
+        with conn:
+            return conn.execute(
+                "DELETE FROM license_changes WHERE changed_at < datetime('now', ?)", (f"-{int(older_than_seconds)} seconds",)
+            ).rowcount
+
+# --- Scheduled Actions (see scheduler.py) ---
+
+@timed_query
+def schedule_action(action, stripe_subscription_id, due_at):
+    """
+    Schedule `action` for a subscription at `due_at` (unix time) unless one is already open.
+    Returns (id, due_at, created) of the open action.
+    """
+    with connection() as conn:
+        with conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO scheduled_actions (action, stripe_subscription_id, due_at) VALUES (?, ?, ?)",
+                (action, stripe_subscription_id, due_at)
+            )
+            if cur.rowcount:
+                return cur.lastrowid, due_at, True
+            row = conn.execute('''
+                SELECT id, due_at FROM scheduled_actions
+                WHERE action = ? AND stripe_subscription_id = ? AND status IN ('pending', 'running')
+            ''', (action, stripe_subscription_id)).fetchone()
+    return row[0], row[1], False
+
+@timed_query
+def cancel_scheduled_actions(action, stripe_subscription_id):
+    """Cancel a subscription's pending `action`. Returns how many were cancelled."""
+    with connection() as conn:
+        with conn:
+            cur = conn.execute('''
+                UPDATE scheduled_actions SET status = 'cancelled', updated_at = CURRENT_TIMESTAMP
+                WHERE action = ? AND stripe_subscription_id = ? AND status = 'pending'
+            ''', (action, stripe_subscription_id))
+    return cur.rowcount
+
+@timed_query
+def get_pending_actions(after_id=0):
+    """Pending actions with an id above `after_id`, as dicts."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, action, stripe_subscription_id, due_at, attempts FROM scheduled_actions
+            WHERE status = 'pending' AND id > ? ORDER BY id
+        ''', (after_id,)).fetchall()
+    return [{"id": r[0], "action": r[1], "stripe_subscription_id": r[2], "due_at": r[3], "attempts": r[4]} for r in rows]
+
+@timed_query
+def requeue_running_actions():
+    """Return actions interrupted by a crash or restart to 'pending'."""
+    with connection() as conn:
+        with conn:
+            conn.execute("UPDATE scheduled_actions SET status = 'pending' WHERE status = 'running'")
+
+@timed_query
+def claim_scheduled_actions(ids):
+    """Move pending actions to 'running'. Returns the ids claimed (cancelled ones are left out)."""
+    if not ids:
+        return set()
+    with connection() as conn:
+        with conn:
+            placeholders = ", ".join("?" * len(ids))
+            claimed = {row[0] for row in conn.execute(
+                f"SELECT id FROM scheduled_actions WHERE status = 'pending' AND id IN ({placeholders})", list(ids)
+            )}
+            conn.executemany(
+                "UPDATE scheduled_actions SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(action_id,) for action_id in claimed]
+            )
+    return claimed
+
+@timed_query
+def finish_scheduled_action(action_id, status, error=None, retry_at=None):
+    """Record an action's result; with `retry_at` it goes back to 'pending' for another attempt."""
+    with connection() as conn:
+        with conn:
+            conn.execute('''
+                UPDATE scheduled_actions
+                SET status = ?, last_error = ?, due_at = COALESCE(?, due_at), attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', ("pending" if retry_at else status, error, retry_at, action_id))
+
+# --- Order Archive (see archive.py) ---
+
+ORDER_COLUMNS = ("id", "stripe_customer_id", "stripe_subscription_id", "tv_username", "mt5_account_number",
+                 "product_id", "status", "created_at", "updated_at")
+
+@timed_query
+def get_archivable_orders(statuses, updated_before, limit):
+    """Up to `limit` full order rows in one of `statuses`, last changed before `updated_before`, oldest first."""
+    placeholders = ", ".join("?" * len(statuses))
+    with connection() as conn:
+        return conn.execute(f'''
+            SELECT {", ".join(ORDER_COLUMNS)} FROM orders
+            WHERE status IN ({placeholders}) AND updated_at < ?
+            ORDER BY updated_at
+            LIMIT ?
+        ''', (*statuses, updated_before, limit)).fetchall()
+
+@timed_query
+def copy_orders_to_archive(rows):
+    """Write order rows (ORDER_COLUMNS tuples) to the archive; rows archived before are overwritten."""
+    with archive_connection() as archive:
+        with archive:
+            archive.executemany(
+                f"INSERT OR REPLACE INTO orders_archive ({', '.join(ORDER_COLUMNS)}) VALUES ({', '.join('?' * len(ORDER_COLUMNS))})",
+                rows
+            )
+
+@timed_query
+def delete_archived_orders(ids, statuses, updated_before):
+    """
+    Delete copied orders from the hot table, unless they changed since they were copied.
+    Returns the ids actually deleted.
+    """
+    placeholders = ", ".join("?" * len(ids))
+    with connection() as conn:
+        with conn:
+            # Select, then delete by id under one write lock (DELETE ... RETURNING needs SQLite 3.35+)
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = {row[0] for row in conn.execute(f'''
+                SELECT id FROM orders
+                WHERE id IN ({placeholders}) AND status IN ({", ".join("?" * len(statuses))}) AND updated_at < ?
+            ''', (*ids, *statuses, updated_before))}
+            if deleted:
+                conn.execute(f"DELETE FROM orders WHERE id IN ({', '.join('?' * len(deleted))})", tuple(deleted))
+    return deleted
+
+@timed_query
+def drop_archive_copies(ids):
+    """Remove archive copies of orders that stayed in the hot table."""
+    with archive_connection() as archive:
+        with archive:
+            archive.executemany("DELETE FROM orders_archive WHERE id = ?", [(order_id,) for order_id in ids])
+
+@timed_query
+def get_archived_access_users():
+    """Distinct (tv_username, product_id) of archived orders, so reconcile still treats their users as managed."""
+    with archive_connection(create=False) as archive:
+        if archive is None:
+            return []
+        return archive.execute('''
+            SELECT DISTINCT tv_username, product_id FROM orders_archive
+            WHERE tv_username IS NOT NULL AND tv_username != ''
+        ''').fetchall()
+
+@timed_query
+def get_order_history(stripe_customer_id=None, mt5_account_number=None):
+    """
+    Every order of a customer or MT5 account, live and archived, newest first.
+    Each row is a dict of ORDER_COLUMNS plus "archived".
+    """
+    if stripe_customer_id is not None:
+        where, value = "stripe_customer_id = ?", stripe_customer_id
+    elif mt5_account_number is not None:
+        where, value = "mt5_account_number = ?", str(mt5_account_number)
+    else:
+        raise ValueError("get_order_history needs a customer ID or an MT5 account number")
+
+    query = f"SELECT {', '.join(ORDER_COLUMNS)} FROM {{table}} WHERE {where}"
+    with connection() as conn:
+        orders = [dict(zip(ORDER_COLUMNS, row), archived=False) for row in conn.execute(query.format(table="orders"), (value,))]
+    live_ids = {order["id"] for order in orders}
+    with archive_connection(create=False) as archive:
+        if archive is not None:
+            orders += [
+                dict(zip(ORDER_COLUMNS, row), archived=True)
+                for row in archive.execute(query.format(table="orders_archive"), (value,))
+                if row[0] not in live_ids  # A copy left behind by an interrupted archive run
+            ]
+    orders.sort(key=lambda order: (order["created_at"] or "", order["id"]), reverse=True)
+    return orders
+
+@timed_query
+def get_order_counts():
+    """Rows in the hot orders table and in the archive."""
+    with connection() as conn:
+        live = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+    with archive_connection(create=False) as archive:
+        archived = archive.execute("SELECT COUNT(*) FROM orders_archive").fetchone()[0] if archive is not None else 0
+    return {"orders": live, "archived": archived}
+
+# --- Stripe Event Ledger ---
+
+@timed_query
+def claim_stripe_event(event_id, event_type, stale_after_seconds=600):
+    """
+    Record that processing of a Stripe event has started.
+    Returns None if this call claimed the event, otherwise the existing
+    {"status", "outcome"} entry. Failed events, and events stuck in
+    'processing' for longer than `stale_after_seconds`, can be claimed again.
+    """
+    with connection() as conn:
+        with conn:
+            cur = conn.execute('''
+                INSERT INTO stripe_events (event_id, event_type, status) VALUES (?, ?, 'processing')
+                ON CONFLICT (event_id) DO UPDATE SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+                WHERE stripe_events.status = 'failed'
+                OR (stripe_events.status = 'processing' AND stripe_events.updated_at < datetime('now', ?))
+            ''', (event_id, event_type, f"-{int(stale_after_seconds)} seconds"))
+            if cur.rowcount:
+                return None
+            row = conn.execute("SELECT status, outcome FROM stripe_events WHERE event_id = ?", (event_id,)).fetchone()
+    return {"status": row[0], "outcome": json.loads(row[1]) if row[1] else None}
+
+@timed_query
+def finish_stripe_event(event_id, status, outcome):
+    """Store the final status ('processed' / 'failed') and outcome of a Stripe event."""
+    with connection() as conn:
+        with conn:
+            conn.execute(
+                "UPDATE stripe_events SET status = ?, outcome = ?, updated_at = CURRENT_TIMESTAMP WHERE event_id = ?",
+                (status, json.dumps(outcome), event_id)
+            )
+
+# --- WooCommerce Cleanup State ---
+
+@timed_query
+def get_cleanup_state():
+    """Return {(order_id, tv_username): {...}} for every tracked cleanup entry."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT order_id, tv_username, status, warning_sent_date, removed_date FROM cleanup_state
+        ''').fetchall()
+    return {
+        (row[0], row[1]): {"status": row[2], "warning_sent_date": row[3], "removed_date": row[4]}
+        for row in rows
+    }
+
+@timed_query
+def save_cleanup_state(entries):
+    """Insert or update cleanup entries given as dicts with order_id, tv_username, product_name, email, status, warning_sent_date, removed_date."""
+    if not entries:
+        return
+    with connection() as conn:
+        with conn:
+            conn.executemany('''
+                INSERT INTO cleanup_state (order_id, tv_username, product_name, email, status, warning_sent_date, removed_date)
+                VALUES (:order_id, :tv_username, :product_name, :email, :status, :warning_sent_date, :removed_date)
+                ON CONFLICT (order_id, tv_username) DO UPDATE SET
+                    product_name = excluded.product_name,
+                    email = excluded.email,
+                    status = excluded.status,
+                    warning_sent_date = excluded.warning_sent_date,
+                    removed_date = excluded.removed_date,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', entries)
+
+@timed_query
+def delete_cleanup_state(keys):
+    """Forget cleanup entries, given as (order_id, tv_username) pairs."""
+    if not keys:
+        return
+    with connection() as conn:
+        with conn:
+            conn.executemany("DELETE FROM cleanup_state WHERE order_id = ? AND tv_username = ?", keys)
+
+@timed_query
+def get_due_cleanup_removals(warned_on_or_before):
+    """Users warned on or before the given 'YYYY-MM-DD' date who still haven't been removed."""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT order_id, tv_username, product_name FROM cleanup_state
+            WHERE removed_date IS NULL
+            AND warning_sent_date <= ?
+        ''', (warned_on_or_before,)).fetchall()
+    return [{"order_id": row[0], "tv_username": row[1], "product_name": row[2]} for row in rows]
+
+@timed_query
+def mark_cleanup_removed(keys, removed_date):
+    """Record the removal date for (order_id, tv_username) pairs."""
+    if not keys:
+        return
+    with connection() as conn:
+        with conn:
+            conn.executemany(
+                "UPDATE cleanup_state SET removed_date = ?, updated_at = CURRENT_TIMESTAMP WHERE order_id = ? AND tv_username = ?",
+                [(removed_date, order_id, tv_username) for order_id, tv_username in keys]
+            )
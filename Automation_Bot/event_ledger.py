@@ -0,0 +1,56 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import database
+
+
+class EventLedger:
+    """
+    Deduplicates Stripe webhook deliveries by event ID.
+    Finished events are remembered in a bounded in-memory map, so a repeat
+    delivery is answered without touching the database; everything else goes
+    through the stripe_events table, which survives restarts.
+    """
+
+    def __init__(self, max_memory_events=50000):
+        self.max_memory_events = max_memory_events
+        self._seen = OrderedDict()  # event_id -> {"status", "outcome"}
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def begin(self, event_id, event_type):
+        """Claim an event for processing. Returns None if it is new, else its recorded entry."""
+        if not event_id:
+            return None
+        with self._lock:
+            entry = self._seen.get(event_id)
+            if entry is not None:
+                self._seen.move_to_end(event_id)
+                self.duplicates += 1
+                return entry
+
+        entry = database.claim_stripe_event(event_id, event_type)
+        if entry is not None:
+            with self._lock:
+                self.duplicates += 1
+            if entry["status"] == "processed":
+                self._remember(event_id, entry)
+        return entry
+
+    def finish(self, event_id, status, outcome):
+        if not event_id:
+            return
+        try:
+            database.finish_stripe_event(event_id, status, outcome)
+        except Exception as e:
+            logging.error(f"Could not record outcome of {event_id}: {e}")
+        if status == "processed":
+            self._remember(event_id, {"status": status, "outcome": outcome})
+
+    def _remember(self, event_id, entry):
+        with self._lock:
+            self._seen[event_id] = entry
+            self._seen.move_to_end(event_id)
+            while len(self._seen) > self.max_memory_events:
+                self._seen.popitem(last=False)
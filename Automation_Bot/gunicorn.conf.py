@@ -0,0 +1,40 @@
+# Gunicorn settings for the server (run from the Automation_Bot folder):
+#   gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:4242')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 4))
+timeout = int(os.getenv('WEB_TIMEOUT', 30))
+keepalive = 5
+
+# Gunicorn installs its own root handler, so server.py's logging.basicConfig() is a no-op
+# under it; keep the app's INFO logs (job queue, automation owner, ...) visible.
+logconfig_dict = {
+    "root": {"level": os.getenv('LOG_LEVEL', 'INFO'), "handlers": ["console"]},
+}
+
+# Load the app in every worker after forking: SQLite connections, job queue
+# threads and Chrome sessions must never be inherited from the master process.
+preload_app = False
+
+
+def on_starting(server):
+    # Apply schema migrations once, in the master, before any worker starts
+    import database
+    database.init_db()
+    database.close_pool()
+
+
+def post_worker_init(worker):
+    # Warm the license cache before the worker accepts requests.
+    # One worker also becomes the automation owner (job queue + browsers).
+    import server
+    server.init_worker()
+
+
+def worker_exit(server, worker):
+    import server as app_server
+    app_server.shutdown_worker()
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import logging
+import threading
+
+import database
+
+JOBS_DB_FILENAME = "jobs.db"
+
+# Job States
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"  # Dead-lettered: gave up after max_attempts
+
+
+def default_jobs_db_path():
+    """The job queue lives next to orders.db."""
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_NAME)), JOBS_DB_FILENAME)
+
+
+class JobQueue:
+    """
+    Durable background job queue backed by SQLite.
+    Handlers are registered per job kind and run on a pool of worker threads.
+    A handler signals failure by raising; the job is then retried with
+    exponential backoff and dead-lettered after `max_attempts` tries.
+    Jobs enqueued by this process wake a worker at once. Jobs enqueued by other
+    processes sharing jobs.db are picked up within `poll_interval` seconds.
+    """
+
+    def __init__(self, db_path=None, workers=1, max_attempts=5, base_delay=5, max_delay=600, poll_interval=1):
+        self.db_path = db_path or default_jobs_db_path()
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._handlers = {}
+        self._threads = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Condition()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                next_run_at REAL NOT NULL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, next_run_at)")
+
+    def register(self, kind, handler):
+        """Register handler(payload) for a job kind."""
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind, payload, delay=0):
+        """Persist a job and wake a worker. Returns the job ID."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, status, max_attempts, next_run_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), PENDING, self.max_attempts, time.time() + delay)
+            )
+            job_id = cur.lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        logging.info(f"Queued job {job_id} ({kind})")
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, payload, status, attempts, last_error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row:
+            return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "status": row[3], "attempts": row[4], "last_error": row[5]}
+        return None
+
+    def stats(self):
+        """Job counts per status (pending/running/done/dead)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {PENDING: 0, RUNNING: 0, DONE: 0, DEAD: 0}
+        counts.update(dict(rows))
+        return counts
+
+    def pending_count(self, kind):
+        """Number of jobs of one kind waiting to run."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE kind = ? AND status = ?", (kind, PENDING)).fetchone()[0]
+
+    def _claim(self):
+        """Atomically move the next due job to RUNNING. Returns (job, seconds_until_next_due)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload, attempts, max_attempts, next_run_at FROM jobs WHERE status = ? ORDER BY next_run_at, id LIMIT 1",
+                    (PENDING,)
+                ).fetchone()
+                if row is None or row[5] > now:
+                    self._conn.execute("COMMIT")
+                    return None, (row[5] - now if row else None)
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (RUNNING, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "attempts": row[3] + 1, "max_attempts": row[4]}, 0
+
+    def _finish(self, job, error=None):
+        with self._lock:
+            if error is None:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, last_error = NULL, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (DONE, job["id"])
+                )
+                return
+            if job["attempts"] >= job["max_attempts"]:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, last_error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (DEAD, error, job["id"])
+                )
+                logging.error(f"Job {job['id']} ({job['kind']}) dead-lettered after {job['attempts']} attempts: {error}")
+                return
+            delay = min(self.max_delay, self.base_delay * (2 ** (job["attempts"] - 1)))
+            delay += random.uniform(0, delay * 0.1)  # Jitter so retries don't stampede
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, next_run_at = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (PENDING, error, time.time() + delay, job["id"])
+            )
+            logging.warning(f"Job {job['id']} ({job['kind']}) failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {error}")
+
+    def run_job(self, job):
+        handler = self._handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+            handler(job["payload"])
+        except Exception as e:
+            self._finish(job, error=str(e) or e.__class__.__name__)
+            return False
+        self._finish(job)
+        return True
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                job, wait = self._claim()
+            except sqlite3.Error as e:
+                logging.error(f"Job queue claim failed: {e}")
+                job, wait = None, 1
+            if job:
+                self.run_job(job)
+                continue
+            with self._wakeup:
+                self._wakeup.wait(timeout=min(wait, self.poll_interval) if wait is not None else self.poll_interval)
+
+    def start(self):
+        """Recover jobs interrupted by a crash and start the worker threads."""
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ? WHERE status = ?", (PENDING, RUNNING))
+        self._stopping.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info(f"Job queue started with {self.workers} worker(s) ({self.db_path})")
+
+    def stop(self, timeout=10):
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
@@ -0,0 +1,218 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+import database
+
+
+class LicenseCache:
+    """
+    In-process cache of MT5 license answers keyed by (mt5_account_number, product_id).
+    Hits are answered from memory without touching orders.db.
+    Valid licenses expire after `ttl` seconds and the least recently used entry is
+    evicted once `max_size` is reached.
+    "Invalid" answers live in a separate, smaller LRU (`max_negative_size`, `negative_ttl`),
+    so a flood of made-up accounts can never push real licenses out of the cache.
+    Every change notification bumps a generation counter; an answer read from the
+    database is only cached if no change arrived while it was being read.
+    Changes made by other processes (gunicorn workers, woo_cleanup.py) are read
+    from the license_changes table every `refresh_seconds` and drop the affected
+    entries, valid or not, so no process serves a stale answer for longer than that.
+    """
+
+    def __init__(self, max_size=100000, ttl=300, max_negative_size=50000, negative_ttl=60, refresh_seconds=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_negative_size = max_negative_size
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()   # (account, product) -> expires_at, valid licenses
+        self._negative = OrderedDict()  # (account, product) -> expires_at, invalid answers
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped on every change; guards database reads made outside the lock
+        self.refresh_seconds = refresh_seconds
+        self.last_seq = 0  # Last license change applied
+        self._stopping = threading.Event()
+        self._thread = None
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _store(self, key, is_valid, now):
+        if is_valid:
+            entries, limit, ttl = self._entries, self.max_size, self.ttl
+            self._negative.pop(key, None)
+        else:
+            entries, limit, ttl = self._negative, self.max_negative_size, self.negative_ttl
+            self._entries.pop(key, None)
+        entries[key] = now + ttl
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def _lookup(self, key, now):
+        """Cached answer for a key (True/False), or None on a miss. Caller holds the lock."""
+        for entries, is_valid in ((self._entries, True), (self._negative, False)):
+            expires_at = entries.get(key)
+            if expires_at is None:
+                continue
+            if expires_at > now:
+                entries.move_to_end(key)
+                if is_valid:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return is_valid
+            del entries[key]
+        self.misses += 1
+        return None
+
+    def warm(self):
+        """Pre-load every active license from the database (up to max_size)."""
+        now = time.monotonic()
+        loaded = 0
+        # Changes committed from here on are applied by the next refresh
+        self.last_seq = database.get_license_change_range()[1] or 0
+        with self._lock:
+            for mt5_account, product_id in database.get_active_licenses():
+                if loaded >= self.max_size:
+                    break
+                self._store((str(mt5_account), str(product_id)), True, now)
+                loaded += 1
+        logging.info(f"License cache warmed with {loaded} active licenses.")
+        return loaded
+
+    def check(self, mt5_account, product_id):
+        """Return the license state, falling back to the database on a miss."""
+        key = (str(mt5_account), str(product_id))
+        with self._lock:
+            cached = self._lookup(key, time.monotonic())
+            generation = self._generation
+        if cached is not None:
+            return cached
+
+        is_valid = database.check_mt5_license(mt5_account, product_id)
+        with self._lock:
+            # A change during the read may have made it stale; the next check re-reads it
+            if self._generation == generation:
+                self._store(key, is_valid, time.monotonic())
+        return is_valid
+
+    def check_many(self, pairs):
+        """Answer many (account, product) pairs; all misses are resolved with one set-based query."""
+        keys = [(str(account), str(product_id)) for account, product_id in pairs]
+        results = {}
+        misses = []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                if key in results:
+                    continue
+                cached = self._lookup(key, now)
+                if cached is None:
+                    misses.append(key)
+                    cached = False
+                results[key] = cached
+            generation = self._generation
+
+        if misses:
+            active = database.check_mt5_licenses(misses)
+            with self._lock:
+                now = time.monotonic()
+                store = self._generation == generation
+                for key in misses:
+                    results[key] = key in active
+                    if store:
+                        self._store(key, results[key], now)
+        return [results[key] for key in keys]
+
+    def invalidate(self, mt5_account, product_id):
+        key = (str(mt5_account), str(product_id))
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+            self._negative.pop(key, None)
+
+    def on_order_change(self, mt5_account, product_id, status):
+        """Database listener: keep the cached answer in step with orders.db."""
+        if not mt5_account or not product_id:
+            return
+        key = (str(mt5_account), str(product_id))
+        with self._lock:
+            self._generation += 1
+            if status == "active":
+                self._store(key, True, time.monotonic())
+            else:
+                # Another active order may still cover this pair, so let the next check re-read it.
+                self._entries.pop(key, None)
+                self._negative.pop(key, None)
+
+    def refresh(self):
+        """Drop entries for license changes committed since the last refresh. Returns how many were read."""
+        first_seq, last_seq = database.get_license_change_range()
+        if last_seq is None or last_seq <= self.last_seq:
+            return 0
+        if first_seq > self.last_seq + 1:
+            # Changes this process had not seen yet were pruned; forget everything
+            self.clear()
+            self.last_seq = last_seq
+            return 0
+        count = 0
+        while True:
+            changes = database.get_license_changes(self.last_seq)
+            if not changes:
+                return count
+            with self._lock:
+                self._generation += 1
+                for seq, mt5_account, product_id, active in changes:
+                    key = (str(mt5_account), str(product_id))
+                    self._entries.pop(key, None)
+                    self._negative.pop(key, None)
+            self.last_seq = changes[-1][0]
+            count += len(changes)
+
+    def _refresh_loop(self):
+        while not self._stopping.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"License cache refresh failed: {e}")
+
+    def start(self):
+        """Warm the cache and keep applying other processes' license changes in the background."""
+        self.warm()
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="license-cache-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._negative.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.negative_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "negative_size": len(self._negative),
+                "max_negative_size": self.max_negative_size,
+                "negative_ttl": self.negative_ttl,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.negative_hits) / total, 4) if total else 0.0,
+            }
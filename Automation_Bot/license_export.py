@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import struct
+import logging
+import argparse
+import threading
+
+import database
+from license_snapshot import account_key
+
+# Snapshot file layout (little-endian):
+#   b"LICSNAP1" | uint32 header length | JSON header, space-padded to 8 bytes | records
+# Records are fixed-width (account int64, product index uint32, expires_at uint32), sorted
+# by (account, product index), so readers can mmap the file and binary-search it in place.
+# expires_at is a unix time, 0 = no expiry (orders.db has no expiry column, so all are 0 today).
+# Accounts that are not plain integers (leading zeros, letters) are listed in the header.
+MAGIC = b"LICSNAP1"
+FORMAT_VERSION = 1
+HEADER_LENGTH = struct.Struct("<I")
+RECORD = struct.Struct("<qII")
+
+# Deltas go to "<snapshot>.delta": a JSON header line {"base_version": N}, then one
+# {"seq", "account", "product_id", "active"} line per change with seq > N.
+DELTA_SUFFIX = ".delta"
+
+
+def write_snapshot(path, licenses, version):
+    """
+    Atomically write a snapshot of (account, product_id, expires_at) entries.
+    `version` is the last license change it includes (see database.get_license_export).
+    """
+    licenses = list(licenses)
+    products = sorted({str(product_id) for _, product_id, _ in licenses})
+    product_index = {product_id: i for i, product_id in enumerate(products)}
+    records, text_entries = [], []
+    for account, product_id, expires_at in licenses:
+        key = account_key(account)
+        if isinstance(key, int):
+            records.append((key, product_index[str(product_id)], int(expires_at or 0)))
+        else:
+            text_entries.append([key, str(product_id), int(expires_at or 0)])
+    records.sort()
+
+    header = json.dumps({
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": int(time.time()),
+        "products": products,
+        "count": len(records),
+        "text_entries": text_entries,
+    }).encode("utf-8")
+    header += b" " * (-(len(MAGIC) + HEADER_LENGTH.size + len(header)) % 8)
+
+    data = bytearray(RECORD.size * len(records))
+    for i, record in enumerate(records):
+        RECORD.pack_into(data, i * RECORD.size, *record)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records) + len(text_entries)
+
+
+def start_delta_log(path, base_version):
+    """Atomically replace the delta log with an empty one that follows `base_version`."""
+    tmp_path = f"{path}{DELTA_SUFFIX}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps({"base_version": base_version}) + "\n")
+    os.replace(tmp_path, path + DELTA_SUFFIX)
+
+
+def append_deltas(path, changes):
+    """Append (seq, account, product_id, active) changes to the delta log."""
+    lines = "".join(
+        json.dumps({"seq": seq, "account": account, "product_id": product_id, "active": bool(active)}) + "\n"
+        for seq, account, product_id, active in changes
+    )
+    with open(path + DELTA_SUFFIX, "a") as f:
+        f.write(lines)  # Whole lines only; readers ignore a trailing partial line
+
+
+class LicensePublisher:
+    """
+    Keeps a snapshot file and its delta log in step with orders.db for read-only
+    verifiers (license_verifier.py). Every `delta_seconds` new rows of the
+    license_changes table are appended to the delta log; after `compact_after`
+    deltas (or `full_seconds`) a fresh snapshot replaces both files. If changes it
+    has not published were pruned from the table, it publishes a full snapshot.
+    Run it in one process only (the server runs it in the automation owner).
+    """
+
+    def __init__(self, path, delta_seconds=2, full_seconds=3600, compact_after=10000):
+        self.path = path
+        self.delta_seconds = delta_seconds
+        self.full_seconds = full_seconds
+        self.compact_after = compact_after
+        self.version = 0
+        self.last_seq = 0
+        self.pending_deltas = 0
+        self._last_full = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def publish_full(self):
+        start = time.perf_counter()
+        version, pairs = database.get_license_export()
+        count = write_snapshot(self.path, ((account, product_id, 0) for account, product_id in pairs), version)
+        start_delta_log(self.path, version)
+        self.version = self.last_seq = version
+        self.pending_deltas = 0
+        self._last_full = time.monotonic()
+        logging.info(f"License export v{version}: {count} active licenses written to {self.path} in {time.perf_counter() - start:.2f}s.")
+
+    def publish_deltas(self):
+        """Append new license changes to the delta log; returns how many were published."""
+        first_seq, _ = database.get_license_change_range()
+        if first_seq is not None and first_seq > self.last_seq + 1:
+            logging.warning(f"License changes after {self.last_seq} were pruned before export; publishing a full snapshot.")
+            self.publish_full()
+            return 0
+        changes = database.get_license_changes(self.last_seq)
+        if not changes:
+            return 0
+        append_deltas(self.path, changes)
+        self.last_seq = changes[-1][0]
+        self.pending_deltas += len(changes)
+        return len(changes)
+
+    def _loop(self):
+        while not self._stopping.wait(self.delta_seconds):
+            try:
+                if self.pending_deltas >= self.compact_after or time.monotonic() - self._last_full >= self.full_seconds:
+                    self.publish_full()
+                else:
+                    self.publish_deltas()
+            except Exception as e:
+                logging.error(f"License export failed: {e}")
+
+    def start(self):
+        """Publish a full snapshot now, then keep publishing deltas in the background."""
+        self.publish_full()
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._loop, name="license-export", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Write a snapshot of active licenses for license_verifier.py.")
+    parser.add_argument("--out", default=os.getenv("LICENSE_EXPORT_FILE", "licenses.bin"), help="Snapshot file (default: licenses.bin)")
+    args = parser.parse_args()
+
+    database.init_db()
+    LicensePublisher(args.out).publish_full()
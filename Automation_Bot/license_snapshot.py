@@ -0,0 +1,186 @@
+import time
+import bisect
+import logging
+import threading
+from array import array
+from collections import namedtuple
+
+import database
+
+# Overlay entries kept before the per-product arrays are rebuilt
+COMPACT_THRESHOLD = 1024
+
+# Published state. Never modified after it is built, so readers need no lock.
+# bases: product_id -> (sorted array('q') of numeric accounts, frozenset of other accounts)
+# added / removed: frozensets of (product_id, account key) changed since the bases were built
+_Snapshot = namedtuple("_Snapshot", "bases added removed size")
+
+_EMPTY = _Snapshot({}, frozenset(), frozenset(), 0)
+
+
+def account_key(account):
+    """
+    MT5 logins are integers, stored as 8-byte ints in the arrays. Anything else
+    (leading zeros, letters, very long numbers) stays text so it only matches itself.
+    """
+    text = str(account).strip()
+    if text.isdigit() and len(text) <= 18 and (text == "0" or text[0] != "0"):
+        return int(text)
+    return text
+
+
+def _build_base(keys):
+    numbers = array("q", sorted(key for key in keys if isinstance(key, int)))
+    others = frozenset(key for key in keys if not isinstance(key, int))
+    return numbers, others
+
+
+def _base_contains(base, key):
+    numbers, others = base
+    if isinstance(key, int):
+        i = bisect.bisect_left(numbers, key)
+        return i < len(numbers) and numbers[i] == key
+    return key in others
+
+
+class LicenseSnapshot:
+    """
+    Immutable in-memory copy of every active (mt5_account_number, product_id) pair.
+    contains() reads the current snapshot without taking a lock; writers (the order
+    listener and reloads) build a new snapshot and publish it with one assignment.
+    Per product, numeric accounts are kept in a sorted array (8 bytes each) and
+    looked up by binary search. Recent changes sit in a small overlay until it is
+    compacted into the arrays.
+    Changes made by other processes (gunicorn workers, woo_cleanup) are picked up
+    every `refresh_seconds` from the license_changes table: only rows newer than the
+    last seen seq are read and applied. A full reload only happens when rows this
+    process still needed were pruned.
+    """
+
+    def __init__(self, refresh_seconds=30):
+        self.refresh_seconds = refresh_seconds
+        self._snapshot = _EMPTY
+        self._write_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.last_seq = 0  # Last license change included in the snapshot
+        self.ready = False
+        self.reloads = 0
+
+    def contains(self, mt5_account, product_id):
+        snapshot = self._snapshot
+        pair = (str(product_id), account_key(mt5_account))
+        if pair in snapshot.added:
+            return True
+        if pair in snapshot.removed:
+            return False
+        base = snapshot.bases.get(pair[0])
+        return base is not None and _base_contains(base, pair[1])
+
+    def contains_many(self, pairs):
+        return [self.contains(account, product_id) for account, product_id in pairs]
+
+    def __len__(self):
+        return self._snapshot.size
+
+    def load(self):
+        """Rebuild the snapshot from orders.db and publish it."""
+        start = time.perf_counter()
+        last_seq, pairs = database.get_license_export()
+        grouped = {}
+        for mt5_account, product_id in pairs:
+            grouped.setdefault(str(product_id), set()).add(account_key(mt5_account))
+        bases = {product_id: _build_base(keys) for product_id, keys in grouped.items()}
+        with self._write_lock:
+            self._snapshot = _Snapshot(bases, frozenset(), frozenset(), sum(len(keys) for keys in grouped.values()))
+            self.last_seq = last_seq
+            # Changes committed while the rows were read (including ones the listener
+            # applied to the old snapshot) are re-applied from the change log
+            self._apply_changes(database.get_license_changes(last_seq))
+        self.ready = True
+        self.reloads += 1
+        logging.info(f"License snapshot loaded: {self._snapshot.size} active licenses in {time.perf_counter() - start:.2f}s.")
+
+    def on_order_change(self, mt5_account, product_id, status):
+        """Database listener: publish a snapshot that includes this change."""
+        if not mt5_account or not product_id:
+            return
+        pair = (str(product_id), account_key(mt5_account))
+        # Another active order may still cover the pair, so ask the database before dropping it
+        active = status == "active" or database.check_mt5_license(mt5_account, product_id)
+        with self._write_lock:
+            self._snapshot = self._set_active(self._snapshot, pair, active)
+
+    def _set_active(self, snapshot, pair, active):
+        """A snapshot with `pair` (product_id, account key) active or not. Caller holds the write lock."""
+        was_active = pair in snapshot.added or (pair not in snapshot.removed and pair[0] in snapshot.bases and _base_contains(snapshot.bases[pair[0]], pair[1]))
+        if active == was_active:
+            return snapshot
+        if active:
+            snapshot = snapshot._replace(added=snapshot.added | {pair}, removed=snapshot.removed - {pair}, size=snapshot.size + 1)
+        else:
+            snapshot = snapshot._replace(added=snapshot.added - {pair}, removed=snapshot.removed | {pair}, size=snapshot.size - 1)
+        if len(snapshot.added) + len(snapshot.removed) > COMPACT_THRESHOLD:
+            snapshot = self._compact(snapshot)
+        return snapshot
+
+    def _apply_changes(self, changes):
+        """Apply (seq, account, product_id, active) rows from license_changes. Caller holds the write lock."""
+        snapshot = self._snapshot
+        for seq, mt5_account, product_id, active in changes:
+            if seq <= self.last_seq:
+                continue
+            snapshot = self._set_active(snapshot, (str(product_id), account_key(mt5_account)), bool(active))
+            self.last_seq = seq
+        self._snapshot = snapshot
+
+    def refresh(self):
+        """Apply license changes committed since the last refresh. Returns how many were read."""
+        first_seq, last_seq = database.get_license_change_range()
+        if last_seq is None or last_seq <= self.last_seq:
+            return 0
+        if first_seq > self.last_seq + 1:
+            # Changes this process had not seen yet were pruned; start over
+            self.load()
+            return 0
+        count = 0
+        while True:
+            changes = database.get_license_changes(self.last_seq)
+            if not changes:
+                return count
+            with self._write_lock:
+                self._apply_changes(changes)
+            count += len(changes)
+
+    def _compact(self, snapshot):
+        """Fold the overlay into the per-product arrays (only the products it touches)."""
+        bases = dict(snapshot.bases)
+        touched = {product_id for product_id, _ in snapshot.added | snapshot.removed}
+        for product_id in touched:
+            numbers, others = bases.get(product_id, (array("q"), frozenset()))
+            keys = set(numbers) | others
+            keys |= {key for p, key in snapshot.added if p == product_id}
+            keys -= {key for p, key in snapshot.removed if p == product_id}
+            bases[product_id] = _build_base(keys)
+        return _Snapshot(bases, frozenset(), frozenset(), snapshot.size)
+
+    def _refresh_loop(self):
+        while not self._stopping.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"License snapshot refresh failed: {e}")
+
+    def start(self):
+        """Load now and keep applying new license changes in the background."""
+        self.load()
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="license-snapshot-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,84 @@
+import os
+import hmac
+import time
+import hashlib
+import logging
+import argparse
+
+# Token layout: "v2.<account>.<product_id>.<expires_unix>.<hex HMAC-SHA256 of the first four fields>"
+# Plain dotted fields keep it trivial to split and check in MQL5 (see MQL5_License_Example.mq5).
+#
+# Tokens are signed with a per-product key derived from LICENSE_TOKEN_SECRET, and each EA
+# build only contains its own product's key. HMAC is symmetric: anyone who extracts the key
+# from an .ex5 can mint tokens for that product (any account), but not for other products
+# and without learning LICENSE_TOKEN_SECRET. Rotate a product's key by changing the secret
+# (which rotates all of them) and shipping new builds.
+TOKEN_VERSION = "v2"
+SEPARATOR = "."
+
+
+def _sign(key, message):
+    return hmac.new(key.encode("utf-8"), message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def product_key(secret, product_id):
+    """The signing key for one product's tokens: compile this (not the secret) into that product's EA."""
+    if not secret:
+        raise ValueError("A signing secret is required")
+    return _sign(secret, f"license-token{SEPARATOR}{product_id}")
+
+
+def issue_token(secret, account, product_id, ttl_seconds, now=None):
+    """Returns (token, expires_at) for an (account, product) pair, valid for ttl_seconds."""
+    account = str(account)
+    product_id = str(product_id)
+    key = product_key(secret, product_id)
+    if SEPARATOR in account or SEPARATOR in product_id:
+        raise ValueError(f"Account and product ID must not contain '{SEPARATOR}'")
+
+    expires_at = int((now if now is not None else time.time()) + ttl_seconds)
+    message = SEPARATOR.join((TOKEN_VERSION, account, product_id, str(expires_at)))
+    return f"{message}{SEPARATOR}{_sign(key, message)}", expires_at
+
+
+def verify_token(secret, token, account=None, product_id=None, now=None):
+    """
+    Checks a license token offline.
+    Returns {"account", "product_id", "expires_at"} when the signature is valid,
+    the token has not expired and it matches the given account/product; otherwise None.
+    """
+    if not secret or not token:
+        return None
+    parts = str(token).split(SEPARATOR)
+    if len(parts) != 5 or parts[0] != TOKEN_VERSION:
+        logging.debug("License token rejected: malformed")
+        return None
+
+    version, token_account, token_product, expires, signature = parts
+    message = SEPARATOR.join((version, token_account, token_product, expires))
+    if not hmac.compare_digest(_sign(product_key(secret, token_product), message), signature):
+        logging.debug("License token rejected: bad signature")
+        return None
+
+    try:
+        expires_at = int(expires)
+    except ValueError:
+        return None
+    if expires_at <= (now if now is not None else time.time()):
+        logging.debug("License token rejected: expired")
+        return None
+    if account is not None and str(account) != token_account:
+        return None
+    if product_id is not None and str(product_id) != token_product:
+        return None
+
+    return {"account": token_account, "product_id": token_product, "expires_at": expires_at}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Print the token signing key to compile into a product's EA (LICENSE_TOKEN_KEY).")
+    parser.add_argument("product_id", help="Stripe product ID, e.g. prod_Qwerty123")
+    args = parser.parse_args()
+    print(product_key(os.getenv("LICENSE_TOKEN_SECRET"), args.product_id))
@@ -0,0 +1,234 @@
+import os
+import json
+import mmap
+import time
+import logging
+import threading
+from collections import namedtuple
+
+from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+
+from license_export import MAGIC, FORMAT_VERSION, HEADER_LENGTH, RECORD, DELTA_SUFFIX
+from license_snapshot import account_key
+from rate_limit import KeyedRateLimiter
+
+# Published view. Replaced as a whole on every refresh, so lookups need no lock.
+# overlay: {(product_id, account key): active} from the delta log, newer than the mapped file
+_View = namedtuple("_View", "mm count data_offset products text_entries version overlay applied_seq file_id")
+
+
+def _file_id(path):
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class SnapshotReader:
+    """
+    Read-only license lookups against a snapshot written by license_export.py.
+    The file is memory-mapped and binary-searched in place (records are read with
+    struct.unpack_from, nothing is loaded up front), so a verifier starts instantly
+    and its memory is shared page cache. Changes published to the delta log after
+    the snapshot are kept in a small overlay. refresh() remaps the file when a new
+    snapshot is published and applies new deltas.
+    """
+
+    def __init__(self, path, refresh_seconds=1):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self._view = None
+        self._delta_id = None
+        self._delta_offset = 0
+        self._refresh_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _map(self):
+        with open(self.path, "rb") as f:
+            file_id = _file_id(self.path)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a license snapshot")
+        header_length = HEADER_LENGTH.unpack_from(mm, len(MAGIC))[0]
+        data_offset = len(MAGIC) + HEADER_LENGTH.size + header_length
+        header = json.loads(mm[len(MAGIC) + HEADER_LENGTH.size:data_offset])
+        if header["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported license snapshot format {header['format']}")
+        return _View(
+            mm, header["count"], data_offset,
+            {product_id: i for i, product_id in enumerate(header["products"])},
+            {(product_id, account): expires_at for account, product_id, expires_at in header["text_entries"]},
+            header["version"], {}, header["version"], file_id
+        )
+
+    def _find(self, view, account, product_index):
+        """Binary search over the mapped records; returns expires_at or None."""
+        target = (account, product_index)
+        lo, hi = 0, view.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = RECORD.unpack_from(view.mm, view.data_offset + mid * RECORD.size)
+            if record[:2] < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < view.count:
+            record = RECORD.unpack_from(view.mm, view.data_offset + lo * RECORD.size)
+            if record[:2] == target:
+                return record[2]
+        return None
+
+    def contains(self, mt5_account, product_id, now=None):
+        view = self._view
+        if view is None:
+            return False
+        product_id = str(product_id)
+        key = account_key(mt5_account)
+        active = view.overlay.get((product_id, key))
+        if active is not None:
+            return active
+        if isinstance(key, int):
+            product_index = view.products.get(product_id)
+            expires_at = None if product_index is None else self._find(view, key, product_index)
+        else:
+            expires_at = view.text_entries.get((product_id, key))
+        if expires_at is None:
+            return False
+        return expires_at == 0 or expires_at > (now or time.time())
+
+    def refresh(self):
+        """Map a newly published snapshot and apply new deltas. Returns True if anything changed."""
+        with self._refresh_lock:
+            view = self._view
+            changed = False
+            if view is None and not os.path.exists(self.path):
+                logging.warning(f"License snapshot {self.path} not published yet.")
+                return False
+            if view is None or _file_id(self.path) != view.file_id:
+                view = self._map()
+                self._delta_id = None
+                changed = True
+
+            delta_path = self.path + DELTA_SUFFIX
+            try:
+                delta_id = _file_id(delta_path)[0]
+                with open(delta_path, "rb") as f:
+                    if delta_id != self._delta_id:  # New log: read it from the start
+                        self._delta_id, self._delta_offset = delta_id, 0
+                    f.seek(self._delta_offset)
+                    data = f.read()
+            except FileNotFoundError:
+                data = b""
+
+            complete = data[:data.rfind(b"\n") + 1]  # A line being written stays for the next refresh
+            self._delta_offset += len(complete)
+            overlay, applied_seq = None, view.applied_seq
+            for line in complete.splitlines():
+                entry = json.loads(line)
+                if "base_version" in entry:
+                    if entry["base_version"] > view.version:
+                        # The log already follows a snapshot we haven't mapped; catch up next time
+                        self._delta_id = None
+                        break
+                    continue
+                if entry["seq"] <= applied_seq:
+                    continue
+                if overlay is None:
+                    overlay = dict(view.overlay)
+                overlay[(str(entry["product_id"]), account_key(entry["account"]))] = entry["active"]
+                applied_seq = entry["seq"]
+            if overlay is not None:
+                view = view._replace(overlay=overlay, applied_seq=applied_seq)
+                changed = True
+            self._view = view
+            return changed
+
+    def info(self):
+        view = self._view
+        if view is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": view.version,
+            "applied_seq": view.applied_seq,
+            "licenses": view.count + len(view.text_entries),
+            "overlay": len(view.overlay),
+        }
+
+    def _refresh_loop(self):
+        while not self._stopping.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"License snapshot refresh failed: {e}")
+
+    def start(self):
+        self.refresh()
+        if self.refresh_seconds > 0 and self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._refresh_loop, name="license-verifier-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+# Read-Only Verifier App
+# ---------------------------------------------------------
+# Serves /api/verify_license from a published snapshot, without orders.db.
+# Run as many as needed (e.g. `gunicorn license_verifier:app`) next to a copy of the files.
+load_dotenv()
+
+app = Flask(__name__)
+
+reader = SnapshotReader(
+    os.getenv("LICENSE_EXPORT_FILE", "licenses.bin"),
+    refresh_seconds=float(os.getenv("LICENSE_VERIFIER_REFRESH", 1))
+)
+_reader_started = False
+_reader_lock = threading.Lock()
+
+RATE_LIMIT_ACCOUNT_PER_SECOND = float(os.getenv('RATE_LIMIT_ACCOUNT_PER_SECOND', 1))
+account_limiter = KeyedRateLimiter(RATE_LIMIT_ACCOUNT_PER_SECOND, burst=int(os.getenv('RATE_LIMIT_ACCOUNT_BURST', 10)))
+
+@app.before_request
+def ensure_reader_started():
+    global _reader_started
+    if _reader_started:
+        return
+    with _reader_lock:
+        if not _reader_started:
+            reader.start()
+            _reader_started = True
+
+@app.route('/api/verify_license', methods=['GET', 'POST'])
+def verify_license():
+    """Same contract as the main server's /api/verify_license."""
+    data = request.form if request.method == 'POST' else request.args
+    account = data.get('account_number')
+    product_id = data.get('product_id')
+
+    if not account or not product_id:
+        return jsonify(valid=False, message="Missing parameters"), 400
+
+    if RATE_LIMIT_ACCOUNT_PER_SECOND and not account_limiter.allow(str(account)):
+        response = jsonify(valid=False, message="Too many requests")
+        response.status_code = 429
+        response.headers['Retry-After'] = '1'
+        return response
+
+    if reader.contains(account, product_id):
+        return jsonify(valid=True, message="License Active")
+    return jsonify(valid=False, message="License Invalid or Expired")
+
+@app.route('/api/license_snapshot_info')
+def license_snapshot_info():
+    return jsonify(reader.info())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    app.run(port=int(os.getenv("LICENSE_VERIFIER_PORT", 4243)))
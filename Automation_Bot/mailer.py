@@ -0,0 +1,133 @@
+import time
+import string
+import smtplib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+from rate_limit import TokenBucket
+
+# SMTP errors that mean the connection is gone and should be re-opened. Every other
+# SMTPException (refused recipient, rejected message, ...) is an answer from a live server.
+# SMTPException subclasses OSError, so it has to be told apart from socket errors.
+_DISCONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)
+
+
+class Mailer:
+    """
+    Sends email over persistent, authenticated SMTP connections.
+    Each of the `workers` sender threads keeps its own connection open between
+    messages (one TLS handshake + login per thread, not per email) and
+    reconnects if the server drops it. A shared token bucket caps the send rate.
+    """
+
+    def __init__(self, host, port, user=None, password=None, sender=None, workers=4, rate_per_second=5.0, starttls=True, timeout=30):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.sender = sender or user
+        self.workers = workers
+        self.starttls = starttls
+        self.timeout = timeout
+        self._limiter = TokenBucket(rate_per_second, burst=workers)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        with self._lock:
+            self._connections.append(server)
+        return server
+
+    def _connection(self, reconnect=False):
+        server = getattr(self._local, "server", None)
+        if reconnect and server is not None:
+            self._discard(server)
+            server = None
+        if server is None:
+            server = self._connect()
+            self._local.server = server
+        return server
+
+    def _discard(self, server):
+        with self._lock:
+            if server in self._connections:
+                self._connections.remove(server)
+        try:
+            server.close()
+        except Exception:
+            pass
+        self._local.server = None
+
+    def send(self, message):
+        """Send one prepared message on this thread's connection. Returns True on success."""
+        if not message.get("From"):
+            message["From"] = self.sender
+        self._limiter.acquire()
+        for attempt in (1, 2):
+            try:
+                self._connection(reconnect=attempt > 1).send_message(message)
+                return True
+            except OSError as e:
+                if attempt == 2 or (isinstance(e, smtplib.SMTPException) and not isinstance(e, _DISCONNECT_ERRORS)):
+                    logging.error(f"Failed to send email to {message['To']}: {e}")
+                    return False
+                logging.warning(f"SMTP connection lost ({e}). Reconnecting...")
+        return False
+
+    def send_batch(self, messages):
+        """Send messages concurrently on the sender pool. Returns one True/False per message, in order."""
+        if not messages:
+            return []
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="mailer")
+        start = time.perf_counter()
+        results = list(self._executor.map(self.send, messages))
+        elapsed = time.perf_counter() - start
+        sent = sum(results)
+        logging.info(f"Email batch: {sent}/{len(messages)} sent in {elapsed:.2f}s ({sent / elapsed if elapsed else 0:.1f}/s)")
+        return results
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for server in connections:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+
+def _compile(template):
+    """Split a str.format template into (literal, field_name) pairs once, up front."""
+    return [(literal, field) for literal, field, _, _ in string.Formatter().parse(template)]
+
+def _render(parts, fields):
+    return "".join(literal + (str(fields[field]) if field is not None else "") for literal, field in parts)
+
+
+class EmailTemplate:
+    """An HTML email whose subject and body are {field} templates, parsed once and rendered per recipient."""
+
+    def __init__(self, subject, html_body):
+        self._subject = _compile(subject)
+        self._body = _compile(html_body)
+
+    def render(self, to_email, **fields):
+        msg = MIMEMultipart()
+        msg['To'] = to_email
+        msg['Subject'] = _render(self._subject, fields)
+        msg.attach(MIMEText(_render(self._body, fields), 'html'))
+        return msg
@@ -0,0 +1,198 @@
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Latency buckets in seconds: sub-millisecond cache hits up to multi-second browser steps
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_value(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, one series per label combination."""
+
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(_label_value(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram (Prometheus `histogram` type).
+    observe() is a bisect plus a few additions under a lock, cheap enough for every request.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(_label_value(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))]), cumulative
+            yield f"{self.name}_bucket", _format_labels(self.labelnames, key, [("le", "+Inf")]), series[-1]
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), series[-2]
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), series[-1]
+
+
+class CallbackGauge:
+    """
+    Value read at scrape time, e.g. queue depth or cache size.
+    `fn` returns a number, or a dict of {label value (or tuple of values): number}.
+    """
+
+    def __init__(self, name, help, fn, labelnames=(), type="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            yield self.name, "", value
+            return
+        for key, number in value.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, _format_labels(self.labelnames, key), number
+
+
+class Registry:
+    """Holds the metrics of this process and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn, labelnames=(), type="gauge"):
+        return self.register(CallbackGauge(name, help, fn, labelnames, type))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = list(metric.samples())
+            except Exception as e:  # A failing callback must not break the whole scrape
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# Trace IDs
+# ---------------------------------------------------------
+# A trace ID follows one piece of work across threads and processes: the webhook
+# stores it in the job payload and the job worker restores it before driving the browser.
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+def current_trace_id():
+    return _trace_id.get()
+
+def set_trace_id(trace_id):
+    """Set the current trace; returns a token for reset_trace_id()."""
+    return _trace_id.set(trace_id)
+
+def reset_trace_id(token):
+    try:
+        _trace_id.reset(token)
+    except ValueError:  # Token from another context (e.g. a different thread)
+        _trace_id.set(None)
+
+@contextmanager
+def trace(trace_id):
+    """Make `trace_id` the current trace for the duration of a `with` block."""
+    token = _trace_id.set(trace_id)
+    try:
+        yield trace_id
+    finally:
+        _trace_id.reset(token)
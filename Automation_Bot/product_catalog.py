@@ -0,0 +1,67 @@
+import os
+import re
+import json
+import functools
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Product -> TradingView script mapping shared by the webhook, reconcile.py and woo_cleanup.py
+CATALOG_FILE = os.getenv("PRODUCT_CATALOG_FILE", os.path.join(SCRIPT_DIR, "products.json"))
+
+
+class ProductCatalog:
+    """
+    Resolves products to TradingView script URLs.
+    - Stripe product IDs (webhooks, reconcile.py) are exact keys in `stripe_products`.
+    - WooCommerce product names (woo_cleanup.py) match when they contain a key of
+      `product_names`. All keys are compiled into one regex; the key found earliest
+      in the name wins, and the longest key wins at the same position.
+    Unknown Stripe products resolve to `default_script`. Unknown product names
+    resolve to None: woo_cleanup.py removes users, so it must never guess a script.
+    """
+
+    def __init__(self, stripe_products, product_names, default_script=None):
+        self.stripe_products = dict(stripe_products)
+        self.product_names = dict(product_names)
+        self.default_script = default_script or next(iter(self.stripe_products.values()), None)
+        keys = sorted(self.product_names, key=len, reverse=True)
+        self._pattern = re.compile("|".join(re.escape(key) for key in keys)) if keys else None
+        # Exports repeat the same few product names, so each distinct name is matched once
+        self.script_for_name = functools.lru_cache(maxsize=4096)(self._match_name)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls(config.get("stripe_products", {}), config.get("product_names", {}), config.get("default_script"))
+
+    def knows_product_id(self, product_id):
+        return product_id in self.stripe_products
+
+    def script_for_product_id(self, product_id):
+        return self.stripe_products.get(product_id) or self.default_script
+
+    def _match_name(self, product_name):
+        match = self._pattern.search(product_name) if self._pattern and product_name else None
+        return self.product_names[match.group(0)] if match else None
+
+    def scripts_for_names(self, names):
+        """
+        Vectorized script_for_name() for a pandas Series of product names (None where unmapped).
+        The column is factorized, so the regex only runs once per distinct name.
+        """
+        import pandas as pd
+        codes, uniques = pd.factorize(names)
+        urls = pd.Series([self.script_for_name(name) for name in uniques] + [None], dtype=object)
+        return pd.Series(urls.to_numpy()[codes], index=names.index, dtype=object)  # NaN names (code -1) take the trailing None
+
+    def script_urls(self):
+        """Every distinct script URL, in catalog order."""
+        urls = list(self.stripe_products.values()) + list(self.product_names.values()) + [self.default_script]
+        return [url for url in dict.fromkeys(urls) if url]
+
+
+@functools.lru_cache(maxsize=None)
+def load_catalog(path=CATALOG_FILE):
+    """The catalog from products.json, read once per process."""
+    return ProductCatalog.from_file(path)
@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second, up to `burst`.
+    try_acquire() answers immediately; acquire() blocks until a token is free.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """
+    One token bucket per key (client IP, account number, ...), `rate` tokens per second up to `burst`.
+    At most `max_keys` buckets are kept; the least recently used key is dropped first,
+    which only ever makes a dropped key start again with a full bucket.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=100000):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, rate))
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated]
+        self._lock = threading.Lock()
+
+    def allow(self, key, tokens=1):
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= tokens:
+                bucket[0] -= tokens
+                return True
+            return False
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,184 @@
+import os
+import json
+import logging
+import argparse
+
+from dotenv import load_dotenv
+
+import database
+
+# Stripe subscription status -> order status. Statuses not listed (e.g. 'incomplete') are left alone.
+STRIPE_STATUS_MAP = {
+    "active": "active",
+    "trialing": "active",
+    "past_due": "past_due",
+    "unpaid": "past_due",
+    "canceled": "cancelled",
+    "incomplete_expired": "cancelled",
+    "paused": "cancelled",
+}
+
+# Order statuses that keep TradingView access (past_due is still inside its grace period)
+ACCESS_STATUSES = ("active", "past_due")
+
+# Local statuses that Stripe's past_due/unpaid never undo: the order already ended here,
+# so only an active subscription brings it back. 'lapsed' = the payment grace period ran out
+# (server.run_scheduled_revokes) while Stripe was still retrying the invoice.
+ENDED_STATUSES = ("cancelled", "lapsed")
+
+
+class StripeSubscriptions:
+    """Pages through every Stripe subscription, `page_size` per API call."""
+
+    def __init__(self, api_key=None, page_size=100):
+        self.api_key = api_key or os.getenv("STRIPE_SECRET_KEY")
+        self.page_size = page_size
+
+    def list_subscriptions(self):
+        """Yields (subscription_id, stripe_status) for every subscription, including cancelled ones."""
+        import stripe  # Slow to import; the server only needs it when a reconcile actually runs
+        page = stripe.Subscription.list(status="all", limit=self.page_size, api_key=self.api_key)
+        for subscription in page.auto_paging_iter():
+            yield subscription.id, subscription.status
+
+
+def build_plan(orders, subscriptions, access_lists, catalog, archived_users=()):
+    """
+    Diffs Stripe, orders.db and the TradingView access lists with set operations.
+    - orders: database.get_all_orders() rows
+    - subscriptions: {subscription_id: stripe_status}
+    - access_lists: {script_url: set of usernames, or None if the list could not be read}
+    - catalog: product_catalog.ProductCatalog (same product -> script resolution as the webhook)
+    - archived_users: (tv_username, product_id) of archived orders (database.get_archived_access_users())
+    Users on an access list who never appear in orders.db or its archive (manual grants) are never removed.
+    Ended orders (ENDED_STATUSES) are not moved back to past_due.
+    """
+    plan = {"status_changes": [], "missing_orders": [], "unknown_subscriptions": [], "access": {}, "unreadable_scripts": []}
+
+    # 1. Stripe vs orders.db
+    order_subs = {order["stripe_subscription_id"] for order in orders if order["stripe_subscription_id"]}
+    stripe_subs = set(subscriptions)
+    live_subs = {sub_id for sub_id, status in subscriptions.items() if STRIPE_STATUS_MAP.get(status) in ACCESS_STATUSES}
+    plan["missing_orders"] = sorted(live_subs - order_subs)
+    plan["unknown_subscriptions"] = sorted(order_subs - stripe_subs)
+
+    new_status = {}
+    for order in orders:
+        sub_id = order["stripe_subscription_id"]
+        target = STRIPE_STATUS_MAP.get(subscriptions.get(sub_id))
+        if target == "past_due" and order["status"] in ENDED_STATUSES:
+            continue  # Grace period already over; reviving it would re-grant access every run
+        if target and target != order["status"] and sub_id not in new_status:
+            new_status[sub_id] = target
+            plan["status_changes"].append({"stripe_subscription_id": sub_id, "from": order["status"], "to": target})
+
+    # 2. orders.db (after the status changes) vs each script's access list
+    # TradingView usernames are compared case-insensitively
+    desired = {}  # script_url -> {lower name: name}
+    managed = {}  # script_url -> lower names that orders.db knows about
+    for order in orders:
+        username = (order["tv_username"] or "").strip()
+        if not username:
+            continue
+        script_url = catalog.script_for_product_id(order["product_id"])
+        managed.setdefault(script_url, set()).add(username.lower())
+        status = new_status.get(order["stripe_subscription_id"], order["status"])
+        if status in ACCESS_STATUSES:
+            desired.setdefault(script_url, {})[username.lower()] = username
+    # Archived orders have all ended; their users keep access only through a live order
+    for username, product_id in archived_users:
+        username = (username or "").strip()
+        if username:
+            managed.setdefault(catalog.script_for_product_id(product_id), set()).add(username.lower())
+
+    for script_url, current in access_lists.items():
+        if current is None:
+            plan["unreadable_scripts"].append(script_url)
+            continue
+        current_by_key = {username.lower(): username for username in current}
+        wanted = desired.get(script_url, {})
+        add = [wanted[key] for key in sorted(wanted.keys() - current_by_key.keys())]
+        remove = [current_by_key[key] for key in sorted((current_by_key.keys() & managed.get(script_url, set())) - wanted.keys())]
+        if add or remove:
+            plan["access"][script_url] = {"add": add, "remove": remove}
+
+    return plan
+
+
+def apply_plan(plan, access, on_status_change=None):
+    """
+    Applies a plan: order status updates, then one access batch per script. Returns a summary.
+    on_status_change(subscription_id, old_status, new_status) runs after each status update
+    (the server uses it to start or cancel the payment grace period timer).
+    """
+    summary = {"status_changes": 0, "added": 0, "removed": 0, "failed": []}
+    for change in plan["status_changes"]:
+        database.update_order_status(change["stripe_subscription_id"], change["to"])
+        if on_status_change:
+            on_status_change(change["stripe_subscription_id"], change["from"], change["to"])
+        summary["status_changes"] += 1
+
+    for script_url, changes in plan["access"].items():
+        results = access.manage_access_batch(script_url, add=changes["add"], remove=changes["remove"])
+        for username in changes["add"]:
+            if results.get(username):
+                summary["added"] += 1
+            else:
+                summary["failed"].append({"script_url": script_url, "username": username, "action": "add"})
+        for username in changes["remove"]:
+            if results.get(username):
+                summary["removed"] += 1
+            else:
+                summary["failed"].append({"script_url": script_url, "username": username, "action": "remove"})
+    return summary
+
+
+def reconcile(subscriptions, access, catalog, dry_run=False, on_status_change=None):
+    """
+    One full resync. `subscriptions` needs list_subscriptions() (StripeSubscriptions or a fake);
+    `access` needs list_access() and manage_access_batch() (TradingViewBot, BrowserPool or a fake).
+    `on_status_change` is passed on to apply_plan().
+    Each script's access list is read once. Returns {"plan": ..., "applied": summary or None}.
+    """
+    database.init_db()
+    orders = database.get_all_orders()
+    stripe_statuses = dict(subscriptions.list_subscriptions())
+    access_lists = {script_url: access.list_access(script_url) for script_url in catalog.script_urls()}
+
+    plan = build_plan(orders, stripe_statuses, access_lists, catalog, archived_users=database.get_archived_access_users())
+    changes = sum(len(c["add"]) + len(c["remove"]) for c in plan["access"].values())
+    logging.info(
+        f"Reconcile plan: {len(orders)} orders, {len(stripe_statuses)} Stripe subscriptions, "
+        f"{len(plan['status_changes'])} status change(s), {changes} access change(s) on {len(plan['access'])} script(s)."
+    )
+    for sub_id in plan["missing_orders"]:
+        logging.warning(f"Stripe subscription {sub_id} is live but has no order (missed checkout webhook?).")
+    for script_url in plan["unreadable_scripts"]:
+        logging.error(f"Could not read the access list of {script_url}. Skipping it.")
+
+    if dry_run:
+        return {"plan": plan, "applied": None}
+    summary = apply_plan(plan, access, on_status_change=on_status_change)
+    logging.info(f"Reconcile applied: {summary['status_changes']} status change(s), {summary['added']} added, {summary['removed']} removed, {len(summary['failed'])} failed.")
+    return {"plan": plan, "applied": summary}
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Resync orders.db and TradingView access lists with Stripe.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the plan without changing anything")
+    args = parser.parse_args()
+
+    from product_catalog import load_catalog
+    from tv_bot import TradingViewBot
+    # Grace period timers are written to scheduled_actions; the running server picks them up
+    from server import on_reconciled_status
+
+    bot = TradingViewBot(os.getenv("TV_USERNAME"), os.getenv("TV_PASSWORD"), headless=os.getenv("BROWSER_HEADLESS", "1") == "1")
+    try:
+        result = reconcile(StripeSubscriptions(), bot, load_catalog(), dry_run=args.dry_run, on_status_change=on_reconciled_status)
+    finally:
+        bot.close_driver()
+    print(json.dumps(result, indent=2))
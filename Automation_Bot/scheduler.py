@@ -0,0 +1,173 @@
+import time
+import heapq
+import logging
+import threading
+
+import database
+
+
+class Scheduler:
+    """
+    Runs timed actions such as "revoke sub_X at T".
+    Actions live in the scheduled_actions table and, in the process running the
+    scheduler, in an in-memory heap ordered by due time. The scheduler thread
+    sleeps on a Condition until the earliest action is due, or until a sooner
+    one is scheduled, so idle time costs nothing and the table is never scanned.
+    Actions scheduled by other processes (gunicorn workers) are picked up every
+    `pickup_seconds` with an id range query.
+    Due actions are passed to their handler in batches: handler(entries) returns
+    {id: None on success, or an error message}. Failed actions are retried with
+    backoff up to `max_attempts` times. start() reloads pending actions from the
+    database, so timers survive restarts.
+    """
+
+    def __init__(self, handlers, batch_size=50, batch_window=5, pickup_seconds=30, max_attempts=5, retry_delay=60, max_retry_delay=3600):
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.batch_window = batch_window  # Actions due this many seconds early join the current batch
+        self.pickup_seconds = pickup_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._heap = []     # (due_at, id, entry)
+        self._known = set() # ids in the heap or being run
+        self._last_id = 0   # Highest id seen by load / pickup
+        self._cond = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.wakeups = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _push(self, entry):
+        """Caller holds the condition."""
+        if entry["id"] in self._known:
+            return False
+        self._known.add(entry["id"])
+        heapq.heappush(self._heap, (entry["due_at"], entry["id"], entry))
+        return True
+
+    def schedule(self, action, stripe_subscription_id, delay):
+        """
+        Schedule `action` in `delay` seconds (an already open one is kept, so repeated
+        payment failures don't push the deadline back). Returns the due time (unix).
+        """
+        action_id, due_at, created = database.schedule_action(action, stripe_subscription_id, time.time() + delay)
+        if created and self._thread is not None:
+            with self._cond:
+                self._push({"id": action_id, "action": action, "stripe_subscription_id": stripe_subscription_id, "due_at": due_at, "attempts": 0})
+                self._cond.notify()
+        return due_at
+
+    def cancel(self, action, stripe_subscription_id):
+        """Cancel a pending action. Its heap entry is dropped when it comes due (the claim fails)."""
+        return database.cancel_scheduled_actions(action, stripe_subscription_id) > 0
+
+    def _pickup(self):
+        entries = database.get_pending_actions(after_id=self._last_id)
+        with self._cond:
+            added = sum(self._push(entry) for entry in entries)
+            if entries:
+                self._last_id = max(self._last_id, entries[-1]["id"])
+        return added
+
+    def load(self):
+        """(Re)load every pending action, including ones interrupted by a restart."""
+        database.requeue_running_actions()
+        self._last_id = 0
+        added = self._pickup()
+        logging.info(f"Scheduler loaded {added} pending action(s).")
+        return added
+
+    def _pop_due(self):
+        """Caller holds the condition."""
+        due = []
+        horizon = time.time() + self.batch_window
+        if self._heap and self._heap[0][0] <= time.time():
+            while self._heap and self._heap[0][0] <= horizon and len(due) < self.batch_size:
+                due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def run_due(self, entries):
+        """Claim and run a batch of due actions, grouped by action."""
+        claimed = database.claim_scheduled_actions([entry["id"] for entry in entries])
+        by_action = {}
+        for entry in entries:
+            if entry["id"] in claimed:
+                by_action.setdefault(entry["action"], []).append(entry)
+            else:
+                self._known.discard(entry["id"])  # Cancelled (or run) elsewhere
+
+        for action, batch in by_action.items():
+            self.batches += 1
+            handler = self.handlers.get(action)
+            try:
+                if handler is None:
+                    raise ValueError(f"No handler registered for scheduled action '{action}'")
+                results = handler(batch)
+            except Exception as e:
+                results = {entry["id"]: str(e) or e.__class__.__name__ for entry in batch}
+            for entry in batch:
+                self._finish(entry, results.get(entry["id"], "No result from handler"))
+
+    def _finish(self, entry, error):
+        if error is None:
+            database.finish_scheduled_action(entry["id"], "done")
+            self._known.discard(entry["id"])
+            return
+        attempts = entry["attempts"] + 1
+        if attempts >= self.max_attempts:
+            database.finish_scheduled_action(entry["id"], "failed", error=error)
+            self._known.discard(entry["id"])
+            logging.error(f"Scheduled {entry['action']} for {entry['stripe_subscription_id']} failed after {attempts} attempts: {error}")
+            return
+        retry_at = time.time() + min(self.max_retry_delay, self.retry_delay * (2 ** (attempts - 1)))
+        database.finish_scheduled_action(entry["id"], "pending", error=error, retry_at=retry_at)
+        logging.warning(f"Scheduled {entry['action']} for {entry['stripe_subscription_id']} failed (attempt {attempts}), retrying at {time.ctime(retry_at)}: {error}")
+        with self._cond:
+            self._known.discard(entry["id"])
+            self._push(dict(entry, due_at=retry_at, attempts=attempts))
+
+    def _loop(self):
+        next_pickup = time.monotonic() + self.pickup_seconds
+        while not self._stopping.is_set():
+            due = []
+            try:
+                if time.monotonic() >= next_pickup:
+                    self._pickup()
+                    next_pickup = time.monotonic() + self.pickup_seconds
+                with self._cond:
+                    due = self._pop_due()
+                    if not due:
+                        timeout = next_pickup - time.monotonic()
+                        if self._heap:
+                            timeout = min(timeout, self._heap[0][0] - time.time())
+                        self._cond.wait(max(timeout, 0))
+                        self.wakeups += 1
+                        continue
+                self.run_due(due)
+            except Exception as e:
+                logging.error(f"Scheduler error: {e}")
+                with self._cond:  # Put an unfinished batch back for the next attempt
+                    for entry in due:
+                        self._known.discard(entry["id"])
+                        self._push(entry)
+                self._stopping.wait(1)
+
+    def start(self):
+        """Reload pending actions and start the scheduler thread."""
+        self.load()
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -1,9 +1,29 @@
 import os
-import stripe
-from flask import Flask, request, jsonify
-from tv_bot import TradingViewBot
+import json
+import time
+import functools
+import hmac
+import collections
+import threading
+from flask import Flask, request, jsonify, g, Response
+from werkzeug.middleware.proxy_fix import ProxyFix
+from browser_pool import BrowserPool
+from tv_bot import log_step_timing
 from dotenv import load_dotenv
 import database
+from license_cache import LicenseCache
+from license_snapshot import LicenseSnapshot
+from license_export import LicensePublisher
+from scheduler import Scheduler
+from job_queue import JobQueue
+from automation_owner import AutomationOwner, LOCK_FILENAME
+from product_catalog import load_catalog
+from event_ledger import EventLedger
+from rate_limit import KeyedRateLimiter
+import license_tokens
+import reconcile
+import archive
+import metrics
 import logging
 
 # Setup Logging
@@ -13,23 +33,283 @@ load_dotenv()
 
 app = Flask(__name__)
 
-# Initialize Database
-database.init_db()
+# Behind ngrok or a reverse proxy, trust this many X-Forwarded-For hops for the client IP
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+if TRUSTED_PROXY_COUNT:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+# Admin endpoints (job status, /metrics, license cache stats) need "Authorization: Bearer <ADMIN_TOKEN>".
+# Without ADMIN_TOKEN they only answer direct requests from this machine (not through ngrok).
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if ADMIN_TOKEN:
+            allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {ADMIN_TOKEN}")
+        else:
+            allowed = request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+        if not allowed:
+            return jsonify(error="Unauthorized"), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+# Metrics (served at /metrics in the Prometheus text format; each worker process reports its own)
+HTTP_REQUEST_SECONDS = metrics.registry.histogram('http_request_duration_seconds', 'HTTP request latency by route.', ['route', 'method', 'status'])
+WEBHOOK_EVENT_SECONDS = metrics.registry.histogram('stripe_webhook_duration_seconds', 'Stripe event processing time by event type and outcome.', ['event_type', 'outcome'])
+DB_QUERY_SECONDS = metrics.registry.histogram('db_query_duration_seconds', 'Duration of database.py functions.', ['query', 'success'])
+BROWSER_STEP_SECONDS = metrics.registry.histogram('tv_bot_step_duration_seconds', 'Duration of TradingView browser steps.', ['step', 'action', 'success'])
+JOB_SECONDS = metrics.registry.histogram('job_duration_seconds', 'Background job run time by kind and result.', ['kind', 'result'])
+
+def record_query(query, seconds, success):
+    DB_QUERY_SECONDS.observe(seconds, query=query, success=success)
+
+def record_browser_step(step, seconds, success, labels):
+    BROWSER_STEP_SECONDS.observe(seconds, step=step, action=labels.get('action', ''), success=success)
+    log_step_timing(step, seconds, success, dict(labels, trace_id=metrics.current_trace_id()))
+
+# License Cache (answers EA polls from memory; kept in sync by database listeners in this
+# process and by the license_changes log for changes made by other workers)
+license_cache = LicenseCache(
+    max_size=int(os.getenv('LICENSE_CACHE_SIZE', 100000)),
+    ttl=int(os.getenv('LICENSE_CACHE_TTL', 300)),
+    max_negative_size=int(os.getenv('LICENSE_NEGATIVE_CACHE_SIZE', 50000)),
+    negative_ttl=int(os.getenv('LICENSE_NEGATIVE_CACHE_TTL', 60)), # Upper bound; purchases in any worker drop it on the next refresh
+    refresh_seconds=float(os.getenv('LICENSE_CACHE_REFRESH', 2))
+)
+
+# License Snapshot (every active license in memory; when enabled it answers all checks,
+# valid or not, without the database and the cache above is not used)
+USE_LICENSE_SNAPSHOT = os.getenv('USE_LICENSE_SNAPSHOT', '1') == '1'
+license_snapshot = LicenseSnapshot(refresh_seconds=float(os.getenv('LICENSE_SNAPSHOT_REFRESH', 5)))
+
+def check_license(account, product_id):
+    if USE_LICENSE_SNAPSHOT:
+        return license_snapshot.contains(account, product_id)
+    return license_cache.check(account, product_id)
+
+def check_licenses(pairs):
+    if USE_LICENSE_SNAPSHOT:
+        return license_snapshot.contains_many(pairs)
+    return license_cache.check_many(pairs)
+
+# License Export for read-only verifiers (license_verifier.py); off unless LICENSE_EXPORT_FILE is set
+LICENSE_EXPORT_FILE = os.getenv('LICENSE_EXPORT_FILE')
+license_publisher = LicensePublisher(
+    LICENSE_EXPORT_FILE,
+    delta_seconds=float(os.getenv('LICENSE_EXPORT_DELTA_SECONDS', 2)),
+    full_seconds=float(os.getenv('LICENSE_EXPORT_FULL_SECONDS', 3600))
+) if LICENSE_EXPORT_FILE else None
+
+# License Change Log Retention
+# license_changes feeds every worker's snapshot refresh and the export deltas; the automation
+# owner drops rows older than this whether or not the export is enabled.
+LICENSE_CHANGES_RETENTION_HOURS = float(os.getenv('LICENSE_CHANGES_RETENTION_HOURS', 24))
+_prune_stopping = threading.Event()
+
+def prune_license_changes_loop(interval=3600):
+    while True:
+        try:
+            removed = database.prune_license_changes(LICENSE_CHANGES_RETENTION_HOURS * 3600)
+            if removed:
+                logging.info(f"Pruned {removed} license changes older than {LICENSE_CHANGES_RETENTION_HOURS:g}h.")
+        except Exception as e:
+            logging.error(f"License change pruning failed: {e}")
+        if _prune_stopping.wait(interval):
+            return
+
+# License Endpoint Rate Limits (token bucket per client IP and per account; rate 0 = off)
+RATE_LIMIT_IP_PER_SECOND = float(os.getenv('RATE_LIMIT_IP_PER_SECOND', 20))
+RATE_LIMIT_ACCOUNT_PER_SECOND = float(os.getenv('RATE_LIMIT_ACCOUNT_PER_SECOND', 1))
+ip_limiter = KeyedRateLimiter(RATE_LIMIT_IP_PER_SECOND, burst=int(os.getenv('RATE_LIMIT_IP_BURST', 60)))
+account_limiter = KeyedRateLimiter(RATE_LIMIT_ACCOUNT_PER_SECOND, burst=int(os.getenv('RATE_LIMIT_ACCOUNT_BURST', 10)))
+LICENSE_REJECTIONS = metrics.registry.counter('license_requests_rejected_total', 'License requests refused by the rate limiter.', ['reason'])
+
+_proxy_warned = False
+
+def rate_limited(*accounts):
+    """
+    Returns a 429 response if this client IP or one of the accounts is over its limit, else None.
+    Each account is charged once per time it is passed (one token per checked pair).
+    """
+    global _proxy_warned
+    if not TRUSTED_PROXY_COUNT and not _proxy_warned and request.headers.get('X-Forwarded-For'):
+        _proxy_warned = True
+        logging.error("Requests arrive through a proxy but TRUSTED_PROXY_COUNT is 0: every client shares the proxy's IP rate limit. Set TRUSTED_PROXY_COUNT=1 (ngrok).")
+    reason = None
+    if RATE_LIMIT_IP_PER_SECOND and not ip_limiter.allow(request.remote_addr or 'unknown'):
+        reason = "ip"
+    elif RATE_LIMIT_ACCOUNT_PER_SECOND:
+        for account, count in collections.Counter(str(account) for account in accounts if account).items():
+            # A batch larger than the burst is charged a full bucket, so it can still pass
+            if not account_limiter.allow(account, min(count, account_limiter.burst)):
+                reason = "account"
+                break
+    if reason is None:
+        return None
+    LICENSE_REJECTIONS.inc(reason=reason)
+    response = jsonify(valid=False, message="Too many requests")
+    response.status_code = 429
+    response.headers['Retry-After'] = '1'
+    return response
+
+# Stripe Event Ledger (deduplicates webhook deliveries by event ID)
+event_ledger = EventLedger(max_memory_events=int(os.getenv('EVENT_LEDGER_MEMORY', 50000)))
+
+# Offline License Tokens (EAs verify these locally and only renew them occasionally)
+LICENSE_TOKEN_SECRET = os.getenv('LICENSE_TOKEN_SECRET')
+LICENSE_TOKEN_TTL = int(os.getenv('LICENSE_TOKEN_TTL', 86400)) # 24 hours
 
 # Stripe Configuration
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
+STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY')
 endpoint_secret = os.getenv('STRIPE_WEBHOOK_SECRET')
 
+def load_stripe():
+    """stripe is slow to import and only the webhook needs it, so it is loaded on first use."""
+    import stripe
+    stripe.api_key = STRIPE_SECRET_KEY
+    return stripe
+
 # TradingView Bot Configuration
 TV_USERNAME = os.getenv('TV_USERNAME')
 TV_PASSWORD = os.getenv('TV_PASSWORD')
-# Map Product IDs to Script URLs
-PRODUCT_SCRIPT_MAP = {
-    "prod_Qwerty123": "https://www.tradingview.com/script/Example1-StateEngine/",
-    "prod_Asdfgh456": "https://www.tradingview.com/script/Example2-Scanner/"
-}
+# Map Product IDs to Script URLs (products.json, shared with woo_cleanup.py and reconcile.py)
+catalog = load_catalog()
+
+# Pool of warm, logged-in browsers (one access job per browser at a time)
+# Built on first use, normally by the automation owner only: building it copies the
+# Chrome profiles, which workers must not all do at once while booting.
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+browsers = None
+_browsers_lock = threading.Lock()
+
+def get_browsers():
+    global browsers
+    with _browsers_lock:
+        if browsers is None:
+            browsers = BrowserPool(
+                TV_USERNAME,
+                TV_PASSWORD,
+                size=BROWSER_POOL_SIZE,
+                max_operations=int(os.getenv('BROWSER_MAX_OPERATIONS', 50)),
+                headless=os.getenv('BROWSER_HEADLESS', '1') == '1',
+                metrics_sink=record_browser_step
+            )
+        return browsers
+
+# Background Jobs
+# TradingView access changes take several seconds of browser automation, so the
+# webhook only queues them. Set USE_JOB_QUEUE=0 to run them inline instead.
+USE_JOB_QUEUE = os.getenv('USE_JOB_QUEUE', '1') == '1'
+jobs = None # Created per process by init_worker()
+
+# Per-Process Startup
+# Nothing touches the database or starts threads at import time, so the app can be
+# loaded by a multi-worker server (see wsgi.py / gunicorn.conf.py). Each worker runs
+# init_worker() once; only the automation owner runs the job queue and browsers.
+automation_owner = None
+_worker_ready = False
+_worker_lock = threading.Lock()
+
+def init_worker():
+    """Set up this process's database, license cache and job queue (runs once per process)."""
+    global jobs, automation_owner, _worker_ready
+    if _worker_ready:
+        return
+    with _worker_lock:
+        if _worker_ready:
+            return
+        database.init_db()
+        database.add_query_listener(record_query)
+        if USE_LICENSE_SNAPSHOT:
+            database.add_order_listener(license_snapshot.on_order_change)
+            license_snapshot.start()
+        else:
+            database.add_order_listener(license_cache.on_order_change)
+            license_cache.start()
+
+        jobs = JobQueue(
+            workers=int(os.getenv('JOB_WORKERS', BROWSER_POOL_SIZE)), # One worker per pooled browser
+            max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 5)),
+            poll_interval=float(os.getenv('JOB_POLL_SECONDS', 1)) # Picks up jobs queued by the other workers
+        )
+        for kind in JOB_HANDLERS:
+            jobs.register(kind, functools.partial(run_traced_job, kind))
+
+        lock_path = os.path.join(os.path.dirname(os.path.abspath(database.DB_NAME)), LOCK_FILENAME)
+        automation_owner = AutomationOwner(lock_path, on_acquired=start_automation)
+        automation_owner.start()
+        _worker_ready = True
+
+def start_automation():
+    """Runs in the one process that owns the browsers: build the browser pool, start the job workers, scheduler and license export, and warm the pool."""
+    pool = get_browsers()
+    if USE_JOB_QUEUE:
+        jobs.start()
+        schedule_reconcile()
+        schedule_archive()
+    scheduler.start()
+    _prune_stopping.clear()
+    threading.Thread(target=prune_license_changes_loop, name="license-changes-prune", daemon=True).start()
+    if license_publisher:
+        threading.Thread(target=license_publisher.start, name="license-export-start", daemon=True).start()
+    if os.getenv('BROWSER_POOL_WARM', '1') == '1':
+        threading.Thread(target=pool.warm, name="browser-pool-warm", daemon=True).start()
 
-bot = TradingViewBot(TV_USERNAME, TV_PASSWORD)
+def shutdown_worker():
+    """Stop this process's background work (gunicorn calls this when a worker exits)."""
+    license_snapshot.stop()
+    license_cache.stop()
+    if automation_owner is not None and automation_owner.is_owner:
+        if USE_JOB_QUEUE:
+            jobs.stop()
+        scheduler.stop()
+        _prune_stopping.set()
+        if browsers is not None:
+            browsers.close()
+        if license_publisher:
+            license_publisher.stop()
+        automation_owner.release()
+    database.close_pool()
+
+@app.before_request
+def ensure_worker_ready():
+    init_worker()
+
+# Queue depth, cache and ownership are read when /metrics is scraped
+metrics.registry.gauge('job_queue_jobs', 'Jobs in the queue by status.', lambda: jobs.stats() if jobs else {}, ['status'])
+metrics.registry.gauge('license_cache_entries', 'Entries in the in-memory license cache.', lambda: license_cache.stats()['size'])
+metrics.registry.gauge('license_cache_hits_total', 'License checks answered from memory, by answer.', lambda: {'valid': license_cache.hits, 'invalid': license_cache.negative_hits}, ['answer'], type='counter')
+metrics.registry.gauge('license_snapshot_size', 'Active licenses in the license snapshot.', lambda: len(license_snapshot))
+metrics.registry.gauge('license_cache_misses_total', 'License checks that went to the database.', lambda: license_cache.misses, type='counter')
+metrics.registry.gauge('browser_automation_owner', '1 if this process runs the job queue and browsers.', lambda: int(bool(automation_owner and automation_owner.is_owner)))
+
+# --- Request Metrics & Tracing ---
+# Every request gets a trace ID (the caller's X-Trace-Id header or a new one), returned in
+# the X-Trace-Id response header. Webhooks use the Stripe event ID and pass it on to their jobs.
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    g.trace_token = metrics.set_trace_id(request.headers.get('X-Trace-Id') or metrics.new_trace_id())
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, route=route, method=request.method, status=response.status_code)
+    response.headers['X-Trace-Id'] = metrics.current_trace_id() or ''
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        metrics.reset_trace_id(token)
+
+@app.route('/metrics')
+@admin_required
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/verify_license', methods=['GET', 'POST'])
 def verify_license():
@@ -47,14 +327,84 @@ def verify_license():
     
     if not account or not product_id:
         return jsonify(valid=False, message="Missing parameters"), 400
+
+    limited = rate_limited(account)
+    if limited:
+        return limited
         
-    is_valid = database.check_mt5_license(account, product_id)
+    is_valid = check_license(account, product_id)
     
     if is_valid:
         return jsonify(valid=True, message="License Active")
     else:
         return jsonify(valid=False, message="License Invalid or Expired")
 
+# Most (account, product) pairs accepted by one bulk license request
+MAX_LICENSE_BATCH = int(os.getenv('MAX_LICENSE_BATCH', 500))
+
+@app.route('/api/verify_licenses', methods=['POST'])
+def verify_licenses():
+    """
+    Bulk license check for terminals running several accounts/products.
+    Expected JSON body: {"pairs": [["<account_number>", "<product_id>"], ...]}
+    Returns {"valid": [true, false, ...]} in the same order as the pairs.
+    """
+    data = request.get_json(silent=True) or {}
+    pairs = data.get('pairs')
+
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify(valid=[], message="Missing parameters"), 400
+    if len(pairs) > MAX_LICENSE_BATCH:
+        return jsonify(valid=[], message=f"At most {MAX_LICENSE_BATCH} pairs per request"), 400
+    if not all(isinstance(pair, (list, tuple)) and len(pair) == 2 and pair[0] and pair[1] for pair in pairs):
+        return jsonify(valid=[], message="Each pair must be [account_number, product_id]"), 400
+
+    limited = rate_limited(*(account for account, _ in pairs))
+    if limited:
+        return limited
+
+    return jsonify(valid=check_licenses(pairs))
+
+@app.route('/api/license_token', methods=['GET', 'POST'])
+def license_token():
+    """
+    Issues a short-lived signed license token for an active (account, product).
+    The EA caches it, verifies it offline on every start and renews it before it expires.
+    Expected params: account_number, product_id
+    """
+    if not LICENSE_TOKEN_SECRET:
+        return jsonify(valid=False, message="License tokens are not configured"), 503
+
+    if request.method == 'POST':
+        data = request.form
+    else:
+        data = request.args
+
+    account = data.get('account_number')
+    product_id = data.get('product_id')
+
+    if not account or not product_id:
+        return jsonify(valid=False, message="Missing parameters"), 400
+
+    limited = rate_limited(account)
+    if limited:
+        return limited
+
+    if not check_license(account, product_id):
+        return jsonify(valid=False, message="License Invalid or Expired")
+
+    try:
+        token, expires_at = license_tokens.issue_token(LICENSE_TOKEN_SECRET, account, product_id, LICENSE_TOKEN_TTL)
+    except ValueError as e:
+        return jsonify(valid=False, message=str(e)), 400
+    return jsonify(valid=True, message="License Active", token=token, expires_at=expires_at)
+
+@app.route('/api/license_cache_stats')
+@admin_required
+def license_cache_stats():
+    """Hit/miss counters for the in-memory license cache."""
+    return jsonify(license_cache.stats())
+
 @app.route('/download/<product_key>')
 def download_file(product_key):
     """
@@ -81,6 +431,7 @@ def webhook():
     payload = request.get_data()
     sig_header = request.headers.get('Stripe-Signature')
     event = None
+    stripe = load_stripe()
 
     try:
         event = stripe.Webhook.construct_event(
@@ -91,20 +442,46 @@ def webhook():
     except stripe.error.SignatureVerificationError as e:
         return 'Invalid signature', 400
 
-    # Handle the event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        handle_checkout_completed(session)
-    
-    elif event['type'] == 'customer.subscription.deleted':
-        subscription = event['data']['object']
-        handle_subscription_ended(subscription)
+    # Work on the verified payload as plain dicts (newer stripe-python objects are not dicts)
+    event = json.loads(payload)
+    event_id = event.get('id')
+
+    # The event ID is the trace ID: it is stored with any job this event queues
+    metrics.set_trace_id(event_id)
+    start = time.perf_counter()
+
+    # Stripe retries and duplicate deliveries are answered from the ledger without redoing the work
+    previous = event_ledger.begin(event_id, event['type'])
+    if previous is not None:
+        logging.info(f"Duplicate delivery of {event_id} ({previous['status']}). Skipping.")
+        WEBHOOK_EVENT_SECONDS.observe(time.perf_counter() - start, event_type=event['type'], outcome="duplicate")
+        return jsonify(success=True, duplicate=True, status=previous['status'], outcome=previous['outcome'])
+
+    try:
+        # Handle the event
+        outcome = {"action": "ignored"}
+        if event['type'] == 'checkout.session.completed':
+            session = event['data']['object']
+            outcome = handle_checkout_completed(session)
         
-    elif event['type'] == 'invoice.payment_failed':
-        invoice = event['data']['object']
-        handle_payment_failed(invoice)
+        elif event['type'] == 'customer.subscription.deleted':
+            subscription = event['data']['object']
+            outcome = handle_subscription_ended(subscription)
+            
+        elif event['type'] == 'invoice.payment_failed':
+            invoice = event['data']['object']
+            outcome = handle_payment_failed(invoice)
+        elif event['type'] == 'invoice.paid':
+            outcome = handle_invoice_paid(event['data']['object'])
+    except Exception as e:
+        # Marked failed so Stripe's retry is processed again
+        event_ledger.finish(event_id, "failed", {"error": str(e)})
+        WEBHOOK_EVENT_SECONDS.observe(time.perf_counter() - start, event_type=event['type'], outcome="failed")
+        raise
 
-    return jsonify(success=True)
+    event_ledger.finish(event_id, "processed", outcome)
+    WEBHOOK_EVENT_SECONDS.observe(time.perf_counter() - start, event_type=event['type'], outcome=outcome.get('action', 'unknown'))
+    return jsonify(success=True, outcome=outcome)
 
 def handle_checkout_completed(session):
     """
@@ -133,7 +510,7 @@ def handle_checkout_completed(session):
 
     if not tv_username and not mt5_account:
         logging.error("No TradingView username OR MT5 Account found in checkout session.")
-        return
+        return {"action": "skipped", "reason": "No TradingView username or MT5 account"}
 
     # Extract Stripe IDs
     stripe_customer_id = session.get('customer')
@@ -142,33 +519,39 @@ def handle_checkout_completed(session):
     # Determine product key
     product_key = session.get('metadata', {}).get('product_key', 'default')
     
-    # --- Action 1: TradingView ---
-    tv_success = True # Default to true if not applicable
+    order = {
+        "stripe_customer_id": stripe_customer_id,
+        "stripe_subscription_id": stripe_subscription_id,
+        "tv_username": tv_username,
+        "mt5_account": mt5_account,
+        "product_key": product_key,
+    }
+
+    # --- Action 1: TradingView (background job, saves the order once access is granted) ---
     if tv_username:
-        script_url = PRODUCT_SCRIPT_MAP.get(product_key)
-        if not script_url:
-            script_url = list(PRODUCT_SCRIPT_MAP.values())[0]
+        script_url = catalog.script_for_product_id(product_key)
+        if not catalog.knows_product_id(product_key):
             logging.warning(f"Product key '{product_key}' not found. using default script.")
-    
-        logging.info(f"Granting access for {tv_username} to {script_url}")
-        tv_success = bot.manage_access(script_url, tv_username, action="add")
-        if not tv_success:
-            logging.error(f"Failed to add {tv_username} to TradingView.")
-
-    # --- Action 2: Save to Database (MT5 & TV) ---
-    # We save if at least one action was valid/successful
-    if tv_success:
-        if mt5_account:
-            logging.info(f"Registering MT5 License for Account {mt5_account} (Product: {product_key})")
-            
-        database.add_order(
-            stripe_customer_id, 
-            stripe_subscription_id, 
-            tv_username, 
-            mt5_account, 
-            product_key, 
-            status="active"
-        )
+
+        job_id = dispatch_job("grant_access", dict(order, script_url=script_url))
+        return {"action": "grant_access", "job_id": job_id}
+
+    # --- Action 2: MT5 only, just save to Database ---
+    save_order(order)
+    return {"action": "order_saved"}
+
+def save_order(order):
+    if order['mt5_account']:
+        logging.info(f"Registering MT5 License for Account {order['mt5_account']} (Product: {order['product_key']})")
+
+    database.add_order(
+        order['stripe_customer_id'],
+        order['stripe_subscription_id'],
+        order['tv_username'],
+        order['mt5_account'],
+        order['product_key'],
+        status="active"
+    )
 
 def handle_subscription_ended(subscription):
     """
@@ -181,22 +564,23 @@ def handle_subscription_ended(subscription):
     
     if not order:
         logging.error(f"Subscription {sub_id} ended, but no matching order found in DB.")
-        return
+        return {"action": "skipped", "reason": "Unknown subscription"}
 
     tv_username = order['tv_username']
     product_key = order['product_id']
     
-    script_url = PRODUCT_SCRIPT_MAP.get(product_key)
-    if not script_url:
-        script_url = list(PRODUCT_SCRIPT_MAP.values())[0]
+    script_url = catalog.script_for_product_id(product_key)
 
-    logging.info(f"Revoking access for {tv_username} (Sub: {sub_id})")
-    
-    # 2. Remove from TradingView
-    success = bot.manage_access(script_url, tv_username, action="remove")
-    
-    # 3. Update Database Status
+    # 2. Update Database Status (licenses stop validating immediately)
     database.update_order_status(sub_id, "cancelled")
+    scheduler.cancel("revoke", sub_id) # Revoked now, not at the end of a payment grace period
+
+    # 3. Remove from TradingView (background job)
+    job_id = None
+    if tv_username:
+        logging.info(f"Revoking access for {tv_username} (Sub: {sub_id})")
+        job_id = dispatch_job("revoke_access", {"script_url": script_url, "tv_username": tv_username, "stripe_subscription_id": sub_id})
+    return {"action": "cancelled", "job_id": job_id}
 
 def handle_payment_failed(invoice):
     """
@@ -204,16 +588,167 @@ def handle_payment_failed(invoice):
     """
     sub_id = invoice.get('subscription')
     if not sub_id:
-        return
+        return {"action": "skipped", "reason": "No subscription on invoice"}
 
-    logging.info(f"Payment failed for Subscription {sub_id}. Treating as cancellation.")
-    
-    # Reuse logic for ending subscription (or you might want a different logic for 'past_due')
-    # For now, let's just log and update status to 'past_due' without immediate removal 
-    # (usually you give a grace period). 
-    # If you want immediate removal, call handle_subscription_ended(invoice)
-    
+    # Licenses stop validating now; TradingView access is revoked when the grace period
+    # runs out, unless the invoice is paid first (handle_invoice_paid)
     database.update_order_status(sub_id, "past_due")
+    revoke_at = schedule_revoke(sub_id)
+    logging.info(f"Payment failed for Subscription {sub_id}. Access will be revoked at {time.ctime(revoke_at)} unless it is paid.")
+    return {"action": "past_due", "revoke_at": int(revoke_at)}
+
+def handle_invoice_paid(invoice):
+    """
+    Triggered when an invoice is paid, including a retried one after a failed payment.
+    """
+    sub_id = invoice.get('subscription')
+    order = database.get_user_by_subscription(sub_id) if sub_id else None
+    if not order or order['status'] != 'past_due':
+        return {"action": "skipped", "reason": "Not in a payment grace period"}
+
+    scheduler.cancel("revoke", sub_id)
+    database.update_order_status(sub_id, "active")
+    logging.info(f"Subscription {sub_id} paid within its grace period. Revocation cancelled.")
+    return {"action": "reactivated"}
+
+# --- Background Job Handlers ---
+# Handlers raise on failure so the queue retries them with backoff.
+
+def run_grant_access(payload):
+    logging.info(f"Granting access for {payload['tv_username']} to {payload['script_url']} (trace {metrics.current_trace_id()})")
+    if not get_browsers().manage_access(payload['script_url'], payload['tv_username'], action="add"):
+        raise RuntimeError(f"Failed to add {payload['tv_username']} to TradingView.")
+    save_order(payload)
+
+def run_revoke_access(payload):
+    logging.info(f"Revoking access for {payload['tv_username']} from {payload['script_url']} (trace {metrics.current_trace_id()})")
+    if not get_browsers().manage_access(payload['script_url'], payload['tv_username'], action="remove"):
+        raise RuntimeError(f"Failed to remove {payload['tv_username']} from TradingView.")
+
+# Grace-Period Scheduler
+# Timed actions (e.g. revoke access when a payment grace period ends) kept in the
+# scheduled_actions table. Only the automation owner runs them; any worker can schedule.
+PAYMENT_GRACE_HOURS = float(os.getenv('PAYMENT_GRACE_HOURS', 48))
+
+def run_scheduled_revokes(entries):
+    """
+    Revoke a batch of lapsed subscriptions: one status update each, one access batch per script.
+    Orders are marked 'lapsed', not 'cancelled': Stripe still reports them past_due/unpaid while
+    it retries the invoice, and reconcile must see that the grace period here already ran out.
+    """
+    results = {}
+    removals = {} # script_url -> [(action id, username)]
+    for entry in entries:
+        sub_id = entry['stripe_subscription_id']
+        order = database.get_user_by_subscription(sub_id)
+        if not order or order['status'] == 'active': # Unknown, or paid again in time
+            results[entry['id']] = None
+            continue
+        if order['status'] not in reconcile.ENDED_STATUSES:
+            database.update_order_status(sub_id, "lapsed")
+        if order['tv_username']:
+            removals.setdefault(catalog.script_for_product_id(order['product_id']), []).append((entry['id'], order['tv_username']))
+        else:
+            results[entry['id']] = None
+
+    for script_url, users in removals.items():
+        logging.info(f"Grace period over: revoking {len(users)} user(s) from {script_url}")
+        removed = get_browsers().manage_access_batch(script_url, remove=[username for _, username in users])
+        for action_id, username in users:
+            results[action_id] = None if removed.get(username) else f"Failed to remove {username} from TradingView."
+    return results
+
+scheduler = Scheduler(
+    {"revoke": run_scheduled_revokes},
+    batch_size=int(os.getenv('SCHEDULER_BATCH_SIZE', 50)),
+    pickup_seconds=float(os.getenv('SCHEDULER_PICKUP_SECONDS', 30))
+)
+metrics.registry.gauge('scheduler_pending_actions', 'Timed actions waiting in this process.', lambda: len(scheduler))
+
+def schedule_revoke(sub_id):
+    """Start a subscription's payment grace period: its access is revoked when it runs out. Returns the revoke time."""
+    return scheduler.schedule("revoke", sub_id, delay=PAYMENT_GRACE_HOURS * 3600)
+
+def on_reconciled_status(sub_id, old_status, new_status):
+    """Keep the grace period timer in step with status changes made by reconcile (missed payment webhooks)."""
+    if new_status == "past_due":
+        schedule_revoke(sub_id)
+    elif old_status == "past_due":
+        scheduler.cancel("revoke", sub_id)
+
+# Periodic Reconciliation
+# Resyncs orders.db and the TradingView access lists with Stripe in case a webhook was missed.
+RECONCILE_INTERVAL_HOURS = float(os.getenv('RECONCILE_INTERVAL_HOURS', 0)) # 0 = off
+
+def run_reconcile(payload):
+    try:
+        reconcile.reconcile(reconcile.StripeSubscriptions(), get_browsers(), catalog, on_status_change=on_reconciled_status)
+    finally:
+        schedule_reconcile()
+
+def schedule_reconcile():
+    """Queue the next reconciliation run unless one is already waiting."""
+    if RECONCILE_INTERVAL_HOURS > 0 and jobs.pending_count("reconcile") == 0:
+        jobs.enqueue("reconcile", {}, delay=RECONCILE_INTERVAL_HOURS * 3600)
+
+# Order Archiving
+# Moves old cancelled orders to orders_archive.db in small batches (see archive.py).
+ARCHIVE_INTERVAL_HOURS = float(os.getenv('ORDER_ARCHIVE_INTERVAL_HOURS', 0)) # 0 = off
+
+def run_archive(payload):
+    try:
+        archive.archive_orders()
+    finally:
+        schedule_archive()
+
+def schedule_archive():
+    """Queue the next archiving run unless one is already waiting."""
+    if ARCHIVE_INTERVAL_HOURS > 0 and jobs.pending_count("archive_orders") == 0:
+        jobs.enqueue("archive_orders", {}, delay=ARCHIVE_INTERVAL_HOURS * 3600)
+
+JOB_HANDLERS = {
+    "grant_access": run_grant_access,
+    "revoke_access": run_revoke_access,
+    "reconcile": run_reconcile,
+    "archive_orders": run_archive,
+}
+
+def run_traced_job(kind, payload):
+    """Run a job handler under the trace ID of the request that queued it, timing the run."""
+    start = time.perf_counter()
+    result = "failed"
+    with metrics.trace(payload.get('trace_id') or metrics.new_trace_id()):
+        try:
+            JOB_HANDLERS[kind](payload)
+            result = "done"
+        finally:
+            JOB_SECONDS.observe(time.perf_counter() - start, kind=kind, result=result)
+
+def dispatch_job(kind, payload):
+    """Queue an access change, or run it inline when the queue is disabled."""
+    payload = dict(payload, trace_id=metrics.current_trace_id())
+    if USE_JOB_QUEUE:
+        return jobs.enqueue(kind, payload)
+    try:
+        run_traced_job(kind, payload)
+    except Exception as e:
+        logging.error(e)
+    return None
+
+@app.route('/api/jobs/<int:job_id>')
+@admin_required
+def job_status(job_id):
+    job = jobs.get_job(job_id)
+    if not job:
+        return jsonify(error="Job not found"), 404
+    return jsonify(id=job['id'], kind=job['kind'], status=job['status'], attempts=job['attempts'], last_error=job['last_error'], trace_id=job['payload'].get('trace_id'))
+
+@app.route('/api/jobs')
+@admin_required
+def job_stats():
+    return jsonify(jobs.stats())
 
 if __name__ == '__main__':
+    # Development server (single process). For production use: gunicorn -c gunicorn.conf.py wsgi:app
+    init_worker()
     app.run(port=4242)
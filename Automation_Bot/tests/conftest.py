@@ -0,0 +1,49 @@
+"""
+Shared fixtures. Run from the Automation_Bot folder: `python -m pytest tests`.
+"""
+import os
+import sys
+
+import pytest
+
+# Make the bot modules (database, server, ...) importable from here
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BOT_DIR not in sys.path:
+    sys.path.insert(0, BOT_DIR)
+
+os.environ.setdefault("BROWSER_POOL_WARM", "0")
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated orders.db (and archive path) in a temporary folder."""
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "orders.db"))
+    monkeypatch.setenv("ORDER_ARCHIVE_DB", str(tmp_path / "orders_archive.db"))
+    database.init_db()
+    yield database
+    database.close_pool()
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    """A Flask test client for server.py without init_worker's threads and browsers."""
+    import server
+    from job_queue import JobQueue
+    from rate_limit import KeyedRateLimiter
+    monkeypatch.setattr(server, "_worker_ready", True)
+    jobs = JobQueue(str(tmp_path / "jobs.db")) # Not started: queued jobs stay queued
+    for kind in server.JOB_HANDLERS:
+        jobs.register(kind, server.JOB_HANDLERS[kind])
+    monkeypatch.setattr(server, "jobs", jobs)
+    monkeypatch.setattr(server, "ADMIN_TOKEN", None)
+    for name in ("ip_limiter", "account_limiter"): # Fresh buckets, so earlier tests don't cause 429s
+        limiter = getattr(server, name)
+        monkeypatch.setattr(server, name, KeyedRateLimiter(limiter.rate, burst=limiter.burst))
+    server.license_snapshot.load()
+    server.license_cache.clear()
+    monkeypatch.setattr(db, "_order_listeners", [])
+    db.add_order_listener(server.license_snapshot.on_order_change)
+    db.add_order_listener(server.license_cache.on_order_change)
+    return server.app.test_client()
@@ -0,0 +1,111 @@
+import archive
+
+
+def age_orders(db, days, *sub_ids):
+    with db.connection() as conn, conn:
+        conn.executemany(
+            "UPDATE orders SET updated_at = datetime('now', ?) WHERE stripe_subscription_id = ?",
+            [(f"-{days} days", sub_id) for sub_id in sub_ids]
+        )
+
+
+def test_old_cancelled_orders_move_to_the_archive(db):
+    db.add_order("cus_1", "sub_old", "Alice", "1001", "prod_A", status="cancelled")
+    db.add_order("cus_1", "sub_recent", "Alice", "1001", "prod_A", status="cancelled")
+    db.add_order("cus_1", "sub_active", "Alice", "1001", "prod_B")
+    db.add_order("cus_2", "sub_past_due", "Bob", "1002", "prod_A", status="past_due")
+    age_orders(db, 200, "sub_old", "sub_active", "sub_past_due")
+
+    summary = archive.archive_orders(older_than_days=90, pause=0)
+    assert (summary["archived"], summary["kept"]) == (1, 0)
+    assert db.get_order_counts() == {"orders": 3, "archived": 1}
+
+    # Archived orders are still found by subscription and in the customer's history
+    assert db.get_user_by_subscription("sub_old")["status"] == "cancelled"
+    history = db.get_order_history(stripe_customer_id="cus_1")
+    assert sorted((order["stripe_subscription_id"], order["archived"]) for order in history) == [
+        ("sub_active", False), ("sub_old", True), ("sub_recent", False)
+    ]
+    assert archive.archive_orders(older_than_days=90, pause=0)["archived"] == 0
+
+
+def test_runs_in_batches(db):
+    for i in range(7):
+        db.add_order(f"cus_{i}", f"sub_{i}", None, str(1000 + i), "prod_A", status="cancelled")
+    age_orders(db, 200, *[f"sub_{i}" for i in range(7)])
+
+    summary = archive.archive_orders(older_than_days=90, batch_size=3, pause=0, max_batches=2)
+    assert (summary["archived"], summary["batches"]) == (6, 2)
+    summary = archive.archive_orders(older_than_days=90, batch_size=3, pause=0)
+    assert (summary["archived"], summary["batches"]) == (1, 1)
+    assert db.get_order_counts() == {"orders": 0, "archived": 7}
+
+
+def test_order_reactivated_during_the_copy_stays_live(db, monkeypatch):
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_A", status="cancelled")
+    db.add_order("cus_2", "sub_2", "Bob", "1002", "prod_A", status="cancelled")
+    age_orders(db, 200, "sub_1", "sub_2")
+    copy = archive.database.copy_orders_to_archive
+
+    def copy_then_reactivate(rows):
+        copy(rows)
+        db.update_order_status("sub_1", "active")  # A webhook lands between the two transactions
+
+    monkeypatch.setattr(archive.database, "copy_orders_to_archive", copy_then_reactivate)
+    summary = archive.archive_orders(older_than_days=90, pause=0)
+    assert (summary["archived"], summary["kept"]) == (1, 1)
+    assert db.get_order_counts() == {"orders": 1, "archived": 1}
+    assert db.get_user_by_subscription("sub_1")["status"] == "active"
+    assert [order["archived"] for order in db.get_order_history(stripe_customer_id="cus_1")] == [False]
+
+
+def test_delete_skips_orders_that_changed(db):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A", status="cancelled")
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A", status="cancelled")
+    age_orders(db, 200, "sub_1", "sub_2")
+    rows = db.get_archivable_orders(("cancelled",), "2100-01-01 00:00:00", 10)
+    ids = [row[0] for row in rows]
+    db.update_order_status("sub_2", "active")
+
+    assert db.delete_archived_orders(ids, ("cancelled",), "2100-01-01 00:00:00") == {ids[0]}
+    assert db.delete_archived_orders(ids, ("cancelled",), "2100-01-01 00:00:00") == set()
+
+
+def test_oldest_orders_are_archived_first(db):
+    for i, days in enumerate((100, 300, 200)):
+        db.add_order(f"cus_{i}", f"sub_{i}", None, str(1000 + i), "prod_A", status="cancelled")
+        age_orders(db, days, f"sub_{i}")
+    rows = db.get_archivable_orders(("cancelled",), "2100-01-01 00:00:00", 2)
+    assert [row[2] for row in rows] == ["sub_1", "sub_2"]
+
+
+def test_reconcile_still_removes_users_of_archived_orders(db):
+    import reconcile
+    from product_catalog import ProductCatalog
+
+    class Access:
+        def __init__(self):
+            self.users = {"Alice", "Bob", "ManualGrant"}
+
+        def list_access(self, script_url):
+            return set(self.users)
+
+        def manage_access_batch(self, script_url, add=(), remove=()):
+            self.users = (self.users | set(add)) - set(remove)
+            return {username: True for username in (*add, *remove)}
+
+    class Subscriptions:
+        def list_subscriptions(self):
+            return iter({"sub_1": "canceled", "sub_2": "active", "sub_3": "active"}.items())
+
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_A", status="cancelled")
+    db.add_order("cus_2", "sub_2", "Bob", "1002", "prod_A", status="cancelled")  # Old order...
+    db.add_order("cus_2", "sub_3", "Bob", "1002", "prod_A")                      # ...and a live one
+    age_orders(db, 200, "sub_1", "sub_2")
+    assert archive.archive_orders(older_than_days=90, pause=0)["archived"] == 2
+    assert sorted(db.get_archived_access_users()) == [("Alice", "prod_A"), ("Bob", "prod_A")]
+
+    access = Access()
+    catalog = ProductCatalog({"prod_A": "https://www.tradingview.com/script/Example1/"}, {})
+    reconcile.reconcile(Subscriptions(), access, catalog)
+    assert access.users == {"Bob", "ManualGrant"}
@@ -0,0 +1,88 @@
+import os
+import threading
+
+import browser_pool
+from browser_pool import BrowserPool, prepare_profile
+
+
+def test_prepare_profile_copies_base_profile(tmp_path):
+    base = tmp_path / "chrome_profile"
+    (base / "Default").mkdir(parents=True)
+    (base / "Default" / "Cookies").write_text("session")
+    (base / "SingletonLock").write_text("")
+
+    profile_dir = prepare_profile(0, base_profile=str(base), profiles_dir=str(tmp_path / "profiles"))
+
+    assert (tmp_path / "profiles" / "slot_0" / "Default" / "Cookies").read_text() == "session"
+    assert not os.path.exists(os.path.join(profile_dir, "SingletonLock"))
+
+
+def test_prepare_profile_is_safe_when_processes_race(tmp_path):
+    base = tmp_path / "chrome_profile"
+    base.mkdir()
+    for i in range(50):
+        (base / f"file_{i}").write_text("x" * 1000)
+    profiles = tmp_path / "profiles"
+    errors, results = [], []
+    start = threading.Barrier(8)
+
+    def prepare():
+        start.wait()
+        try:
+            results.append(prepare_profile(0, base_profile=str(base), profiles_dir=str(profiles)))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=prepare) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(set(results)) == 1
+    assert len(os.listdir(results[0])) == 50
+    assert os.listdir(profiles) == ["slot_0"]  # No temporary copies left behind
+
+
+def test_prepare_profile_without_saved_login(tmp_path):
+    profile_dir = prepare_profile(1, base_profile=str(tmp_path / "missing"), profiles_dir=str(tmp_path / "profiles"))
+    assert os.path.isdir(profile_dir)
+
+
+def test_server_import_does_not_build_browser_pool(monkeypatch):
+    built = []
+    monkeypatch.setattr(browser_pool.BrowserPool, "__init__", lambda self, *a, **k: built.append(1))
+    import server
+    monkeypatch.setattr(server, "BrowserPool", BrowserPool)
+    monkeypatch.setattr(server, "browsers", None)
+    assert built == []
+    server.get_browsers()
+    server.get_browsers()
+    assert built == [1]
+
+
+class NotLoggedInBot:
+    def __init__(self):
+        self.driver = None
+        self.closed = 0
+
+    def start_driver(self):
+        self.driver = object()
+
+    def login(self):
+        raise browser_pool.LoginRequiredError("profile not logged in")
+
+    def close_driver(self):
+        self.driver = None
+        self.closed += 1
+
+
+def test_browser_that_cannot_log_in_is_not_handed_out(monkeypatch):
+    monkeypatch.setattr(browser_pool, "get_driver_path", lambda: "chromedriver")
+    bot = NotLoggedInBot()
+    pool = BrowserPool(None, None, size=1, bot_factory=lambda slot: bot)
+    assert pool.manage_access_batch("https://example.com/script", add=["Alice"]) == {"Alice": False}
+    assert bot.driver is None and bot.closed == 1
+    pool.warm()  # Logs the error instead of raising in the warm-up thread
+    assert bot.closed == 2
@@ -0,0 +1,53 @@
+from event_ledger import EventLedger
+
+
+def test_new_event_is_claimed_once(db):
+    ledger = EventLedger()
+    assert ledger.begin("evt_1", "invoice.paid") is None
+    # Still processing (e.g. a concurrent delivery): not claimed again
+    assert ledger.begin("evt_1", "invoice.paid") == {"status": "processing", "outcome": None}
+    assert ledger.duplicates == 1
+
+
+def test_processed_events_are_answered_from_memory(db, monkeypatch):
+    ledger = EventLedger()
+    ledger.begin("evt_1", "invoice.paid")
+    ledger.finish("evt_1", "processed", {"action": "reactivated"})
+
+    def no_database(*args):
+        raise AssertionError("Repeat delivery read the database")
+
+    monkeypatch.setattr(db, "claim_stripe_event", no_database)
+    assert ledger.begin("evt_1", "invoice.paid") == {"status": "processed", "outcome": {"action": "reactivated"}}
+
+
+def test_processed_events_survive_a_restart(db):
+    EventLedger().begin("evt_1", "invoice.paid")
+    EventLedger().finish("evt_1", "processed", {"action": "skipped"})
+    restarted = EventLedger()
+    assert restarted.begin("evt_1", "invoice.paid") == {"status": "processed", "outcome": {"action": "skipped"}}
+    assert "evt_1" in restarted._seen
+
+
+def test_failed_events_can_be_retried(db):
+    ledger = EventLedger()
+    ledger.begin("evt_1", "invoice.paid")
+    ledger.finish("evt_1", "failed", {"error": "boom"})
+    assert ledger.begin("evt_1", "invoice.paid") is None
+
+
+def test_memory_is_bounded(db):
+    ledger = EventLedger(max_memory_events=2)
+    for event_id in ("evt_1", "evt_2", "evt_3"):
+        ledger.begin(event_id, "invoice.paid")
+        ledger.finish(event_id, "processed", {})
+    assert list(ledger._seen) == ["evt_2", "evt_3"]
+    # Forgotten in memory, still known to the database
+    assert ledger.begin("evt_1", "invoice.paid")["status"] == "processed"
+
+
+def test_events_without_id_are_not_tracked(db):
+    ledger = EventLedger()
+    assert ledger.begin(None, "invoice.paid") is None
+    ledger.finish(None, "processed", {})
+    assert len(ledger._seen) == 0
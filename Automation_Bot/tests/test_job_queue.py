@@ -0,0 +1,49 @@
+import time
+import threading
+
+import pytest
+
+from job_queue import DEAD, DONE, JobQueue
+
+
+@pytest.fixture
+def jobs_db(tmp_path):
+    return str(tmp_path / "jobs.db")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_failed_jobs_are_retried_then_dead_lettered(jobs_db):
+    queue = JobQueue(jobs_db, max_attempts=2, base_delay=0)
+    queue.register("fail", lambda payload: 1 / 0)
+    job_id = queue.enqueue("fail", {})
+    job, _ = queue._claim()
+    assert not queue.run_job(job)
+    job, _ = queue._claim()
+    assert not queue.run_job(job)
+    assert queue.get_job(job_id)["status"] == DEAD
+    assert queue.get_job(job_id)["attempts"] == 2
+
+
+def test_jobs_queued_by_another_process_are_picked_up_promptly(jobs_db):
+    # The owner's workers sit idle; another worker process writes to the same jobs.db
+    done = threading.Event()
+    owner = JobQueue(jobs_db, poll_interval=0.1)
+    owner.register("grant", lambda payload: done.set())
+    owner.start()
+    try:
+        time.sleep(0.2)  # Let the worker go idle
+        other = JobQueue(jobs_db)
+        other.register("grant", lambda payload: None)
+        job_id = other.enqueue("grant", {"user": "someone"})
+        assert done.wait(2)
+        assert wait_for(lambda: owner.get_job(job_id)["status"] == DONE)
+    finally:
+        owner.stop()
@@ -0,0 +1,124 @@
+import time
+
+import pytest
+
+import license_cache
+from license_cache import LicenseCache
+
+
+@pytest.fixture
+def cache(db):
+    cache = LicenseCache(max_size=10, max_negative_size=10)
+    db.add_order_listener(cache.on_order_change)
+    yield cache
+    db._order_listeners.remove(cache.on_order_change)
+
+
+def test_hits_misses_and_listener_updates(db, cache):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")  # Cached by the listener
+    assert cache.check("1001", "prod_A")
+    assert not cache.check("1002", "prod_A")
+    assert cache.check(1001, "prod_A")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"], stats["negative_size"]) == (2, 1, 1, 1)
+
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    assert cache.check("1002", "prod_A")  # The listener replaced the negative entry
+    db.update_order_status("sub_1", "cancelled")
+    assert not cache.check("1001", "prod_A")
+
+
+def test_check_many_matches_check(db, cache):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    pairs = [("1001", "prod_A"), ("1002", "prod_A"), ("1001", "prod_A"), ("1001", "prod_B")]
+    assert cache.check_many(pairs) == [True, False, True, False]
+    assert cache.check_many(pairs) == [cache.check(*pair) for pair in pairs]
+
+
+def test_answer_read_before_a_change_is_not_cached(db, cache, monkeypatch):
+    # The order is activated while check() is reading the old "invalid" answer
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.update_order_status("sub_1", "cancelled")
+    read = license_cache.database.check_mt5_license
+
+    def read_then_activate(account, product_id):
+        result = read(account, product_id)
+        db.update_order_status("sub_1", "active")
+        return result
+
+    monkeypatch.setattr(license_cache.database, "check_mt5_license", read_then_activate)
+    assert not cache.check("1001", "prod_A")
+    monkeypatch.setattr(license_cache.database, "check_mt5_license", read)
+    assert cache.check("1001", "prod_A")
+
+
+def test_bulk_answer_read_before_a_change_is_not_cached(db, cache, monkeypatch):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    cache.clear()
+    read = license_cache.database.check_mt5_licenses
+
+    def read_then_cancel(pairs):
+        result = read(pairs)
+        db.update_order_status("sub_1", "cancelled")
+        return result
+
+    monkeypatch.setattr(license_cache.database, "check_mt5_licenses", read_then_cancel)
+    assert cache.check_many([("1001", "prod_A")]) == [True]
+    monkeypatch.setattr(license_cache.database, "check_mt5_licenses", read)
+    assert cache.check_many([("1001", "prod_A")]) == [False]
+
+
+def test_changes_from_other_workers_are_picked_up(db, cache):
+    # `other` stands for a second gunicorn worker: it only sees orders.db, not this process's listeners
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    other = LicenseCache(refresh_seconds=0)
+    other.warm()
+    assert other.check("1001", "prod_A")
+
+    db.update_order_status("sub_1", "cancelled")
+    assert other.check("1001", "prod_A")  # Stale until the next refresh
+    assert other.refresh() == 1
+    assert not other.check("1001", "prod_A")
+    assert other.refresh() == 0
+
+
+def test_refresh_clears_everything_when_changes_were_pruned(db, cache):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    other = LicenseCache(refresh_seconds=0)
+    other.warm()
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    db.update_order_status("sub_1", "cancelled")
+    with db.connection() as conn, conn:
+        conn.execute("DELETE FROM license_changes")  # As if pruned while this worker was behind
+    db.add_order("cus_3", "sub_3", None, "1003", "prod_A")
+
+    other.refresh()
+    assert other.stats()["size"] == 0
+    assert not other.check("1001", "prod_A")
+
+
+def test_purchase_in_another_worker_clears_the_negative_answer(db):
+    worker = LicenseCache(negative_ttl=3600, refresh_seconds=0)
+    worker.warm()
+    assert not worker.check("1001", "prod_A")
+    assert worker.stats()["negative_size"] == 1
+
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")  # Checkout webhook handled by another worker
+    assert not worker.check("1001", "prod_A")
+    worker.refresh()
+    assert worker.check("1001", "prod_A")
+    assert worker.stats()["negative_size"] == 0
+
+
+def test_background_refresh(db):
+    worker = LicenseCache(refresh_seconds=0.02)
+    worker.start()
+    try:
+        assert not worker.check("1001", "prod_A")
+        db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+        deadline = time.monotonic() + 2
+        while worker.stats()["negative_size"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert worker.check("1001", "prod_A")
+    finally:
+        worker.stop()
@@ -0,0 +1,98 @@
+import pytest
+
+from license_export import LicensePublisher
+from license_verifier import SnapshotReader
+
+
+@pytest.fixture
+def published(db, tmp_path):
+    """A publisher and a verifier reading what it publishes."""
+    path = str(tmp_path / "licenses.bin")
+    return LicensePublisher(path), SnapshotReader(path, refresh_seconds=0)
+
+
+def backdate_changes(db, up_to_seq, days=2):
+    with db.connection() as conn, conn:
+        conn.execute("UPDATE license_changes SET changed_at = datetime('now', ?) WHERE seq <= ?", (f"-{days} days", up_to_seq))
+
+
+def test_full_snapshot_round_trip(db, published):
+    publisher, reader = published
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.add_order("cus_2", "sub_2", None, "00042", "prod_B")  # Not a plain integer: stored as text
+    db.add_order("cus_3", "sub_3", None, "1003", "prod_A")
+    db.update_order_status("sub_3", "cancelled")
+    publisher.publish_full()
+
+    assert reader.refresh()
+    assert reader.contains(1001, "prod_A")
+    assert reader.contains("00042", "prod_B")
+    assert not reader.contains("42", "prod_B")
+    assert not reader.contains("1001", "prod_B")
+    assert not reader.contains("1003", "prod_A")
+    assert reader.info()["licenses"] == 2
+
+
+def test_deltas_are_applied_after_the_snapshot(db, published):
+    publisher, reader = published
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    publisher.publish_full()
+    reader.refresh()
+
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    db.update_order_status("sub_1", "cancelled")
+    assert publisher.publish_deltas() == 2
+    assert reader.refresh()
+    assert reader.contains("1002", "prod_A")
+    assert not reader.contains("1001", "prod_A")
+    assert not reader.refresh()
+
+    # A new full snapshot replaces the overlay
+    publisher.publish_full()
+    assert reader.refresh()
+    assert reader.info()["overlay"] == 0
+    assert reader.contains("1002", "prod_A") and not reader.contains("1001", "prod_A")
+
+
+def test_full_export_keeps_the_change_log(db, published):
+    # Other workers' snapshots refresh from license_changes, so publishing must not prune it
+    publisher, _ = published
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    publisher.publish_full()
+    assert db.get_license_changes(0)
+
+
+def test_prune_drops_only_old_changes(db):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    first_seq, last_seq = db.get_license_change_range()
+    backdate_changes(db, first_seq)
+    assert db.prune_license_changes(86400) == 1
+    assert db.get_license_change_range() == (last_seq, last_seq)
+
+
+def test_publisher_republishes_when_unpublished_changes_were_pruned(db, published):
+    publisher, reader = published
+    publisher.publish_full()
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    backdate_changes(db, db.get_license_change_range()[0])
+    db.prune_license_changes(86400)
+
+    assert publisher.publish_deltas() == 0
+    assert publisher.version == db.get_license_change_range()[1]
+    reader.refresh()
+    assert reader.contains("1001", "prod_A") and reader.contains("1002", "prod_A")
+
+
+def test_reader_ignores_a_partial_delta_line(db, published):
+    publisher, reader = published
+    publisher.publish_full()
+    reader.refresh()
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    publisher.publish_deltas()
+    with open(publisher.path + ".delta", "a") as f:
+        f.write('{"seq": 99, "account": "1002"')
+    reader.refresh()
+    assert reader.contains("1001", "prod_A")
+    assert not reader.contains("1002", "prod_A")
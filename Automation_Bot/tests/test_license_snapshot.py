@@ -0,0 +1,90 @@
+import pytest
+
+import license_snapshot
+from license_snapshot import LicenseSnapshot, account_key
+
+
+@pytest.fixture
+def snapshot(db):
+    snapshot = LicenseSnapshot(refresh_seconds=0)
+    db.add_order_listener(snapshot.on_order_change)
+    yield snapshot
+    db._order_listeners.remove(snapshot.on_order_change)
+
+
+def test_account_key():
+    assert account_key(" 12345 ") == 12345
+    assert account_key("012345") == "012345"
+    assert account_key("ABC1") == "ABC1"
+
+
+def test_load_and_listener_updates(db, snapshot):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    snapshot.load()
+    assert snapshot.contains("1001", "prod_A")
+    assert not snapshot.contains("1001", "prod_B")
+
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    db.update_order_status("sub_1", "cancelled")
+    assert snapshot.contains(1002, "prod_A")
+    assert not snapshot.contains("1001", "prod_A")
+    assert len(snapshot) == 1
+
+
+def test_pair_stays_active_while_another_order_covers_it(db, snapshot):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.add_order("cus_1", "sub_2", None, "1001", "prod_A")
+    snapshot.load()
+    db.update_order_status("sub_1", "cancelled")
+    assert snapshot.contains("1001", "prod_A")
+
+
+def test_refresh_applies_changes_from_other_processes_without_reloading(db):
+    snapshot = LicenseSnapshot(refresh_seconds=0)  # No listener: changes come only from the change log
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    snapshot.load()
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    db.update_order_status("sub_1", "cancelled")
+    db.save_cleanup_state([{"order_id": "1", "tv_username": "x", "product_name": "p", "email": "e", "status": "cancelled", "warning_sent_date": None, "removed_date": None}])
+
+    assert snapshot.refresh() == 2
+    assert snapshot.contains("1002", "prod_A") and not snapshot.contains("1001", "prod_A")
+    assert snapshot.refresh() == 0
+    assert snapshot.reloads == 1
+
+
+def test_change_committed_during_load_is_not_lost(db, snapshot, monkeypatch):
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    read_export = db.get_license_export
+
+    def export_then_change():
+        result = read_export()
+        db.update_order_status("sub_1", "cancelled")  # Listener runs against the old snapshot
+        return result
+
+    monkeypatch.setattr(license_snapshot.database, "get_license_export", export_then_change)
+    snapshot.load()
+    assert not snapshot.contains("1001", "prod_A")
+
+
+def test_refresh_reloads_when_needed_changes_were_pruned(db):
+    snapshot = LicenseSnapshot(refresh_seconds=0)
+    snapshot.load()
+    db.add_order("cus_1", "sub_1", None, "1001", "prod_A")
+    db.add_order("cus_2", "sub_2", None, "1002", "prod_A")
+    with db.connection() as conn, conn:
+        conn.execute("UPDATE license_changes SET changed_at = datetime('now', '-2 days') WHERE seq = ?", (db.get_license_change_range()[0],))
+    assert db.prune_license_changes(86400) == 1
+
+    snapshot.refresh()
+    assert snapshot.reloads == 2
+    assert snapshot.contains("1001", "prod_A") and snapshot.contains("1002", "prod_A")
+
+
+def test_overlay_is_compacted(db, snapshot, monkeypatch):
+    monkeypatch.setattr(license_snapshot, "COMPACT_THRESHOLD", 3)
+    snapshot.load()
+    for i in range(10):
+        db.add_order(f"cus_{i}", f"sub_{i}", None, str(2000 + i), "prod_A")
+    assert all(snapshot.contains(str(2000 + i), "prod_A") for i in range(10))
+    assert len(snapshot._snapshot.added) <= 3
@@ -0,0 +1,73 @@
+import pytest
+
+import license_tokens
+from license_tokens import issue_token, product_key, verify_token
+
+SECRET = "test-secret"
+NOW = 1_700_000_000
+
+
+def test_round_trip():
+    token, expires_at = issue_token(SECRET, 12345, "prod_A", 3600, now=NOW)
+    assert expires_at == NOW + 3600
+    assert token.startswith(f"{license_tokens.TOKEN_VERSION}.12345.prod_A.{expires_at}.")
+    assert verify_token(SECRET, token, "12345", "prod_A", now=NOW) == {"account": "12345", "product_id": "prod_A", "expires_at": expires_at}
+    assert verify_token(SECRET, token, now=NOW)["account"] == "12345"
+
+
+def test_expired_token_is_rejected():
+    token, expires_at = issue_token(SECRET, "12345", "prod_A", 60, now=NOW)
+    assert verify_token(SECRET, token, now=expires_at - 1) is not None
+    assert verify_token(SECRET, token, now=expires_at) is None
+
+
+def test_tampered_mac_is_rejected():
+    token, _ = issue_token(SECRET, "12345", "prod_A", 3600, now=NOW)
+    flipped = token[:-1] + ("0" if token[-1] != "0" else "1")
+    assert verify_token(SECRET, flipped, now=NOW) is None
+    assert verify_token("other-secret", token, now=NOW) is None
+
+
+def test_tampered_fields_are_rejected():
+    token, expires_at = issue_token(SECRET, "12345", "prod_A", 3600, now=NOW)
+    signature = token.rsplit(".", 1)[1]
+    for fields in (("99999", "prod_A", expires_at), ("12345", "prod_B", expires_at), ("12345", "prod_A", expires_at + 86400)):
+        forged = ".".join((license_tokens.TOKEN_VERSION, *map(str, fields), signature))
+        assert verify_token(SECRET, forged, now=NOW) is None
+
+
+def test_account_and_product_mismatch():
+    token, _ = issue_token(SECRET, "12345", "prod_A", 3600, now=NOW)
+    assert verify_token(SECRET, token, account="54321", now=NOW) is None
+    assert verify_token(SECRET, token, product_id="prod_B", now=NOW) is None
+    assert verify_token(SECRET, token, account=12345, product_id="prod_A", now=NOW) is not None
+
+
+def test_product_keys_do_not_sign_other_products():
+    # What an EA holds is product_key(); a token forged with it for another product must fail
+    key_a = product_key(SECRET, "prod_A")
+    assert key_a != product_key(SECRET, "prod_B")
+    message = f"{license_tokens.TOKEN_VERSION}.12345.prod_B.{NOW + 3600}"
+    forged = f"{message}.{license_tokens._sign(key_a, message)}"
+    assert verify_token(SECRET, forged, now=NOW) is None
+
+    message = f"{license_tokens.TOKEN_VERSION}.12345.prod_A.{NOW + 3600}"
+    assert verify_token(SECRET, f"{message}.{license_tokens._sign(key_a, message)}", now=NOW) is not None
+
+
+@pytest.mark.parametrize("token", ["", None, "garbage", "v2.12345.prod_A.123", "v2.a.b.c.d.e", "v2.12345.prod_A.soon.abc"])
+def test_malformed_tokens_are_rejected(token):
+    assert verify_token(SECRET, token, now=NOW) is None
+
+
+def test_v1_tokens_are_rejected():
+    message = f"v1.12345.prod_A.{NOW + 3600}"
+    assert verify_token(SECRET, f"{message}.{license_tokens._sign(SECRET, message)}", now=NOW) is None
+
+
+def test_issue_requires_secret_and_plain_fields():
+    with pytest.raises(ValueError):
+        issue_token("", "12345", "prod_A", 3600)
+    with pytest.raises(ValueError):
+        issue_token(SECRET, "123.45", "prod_A", 3600)
+    assert verify_token(None, "v2.a.b.c.d") is None
@@ -0,0 +1,116 @@
+import smtplib
+
+import pytest
+
+import mailer
+import rate_limit
+from mailer import EmailTemplate, Mailer
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP: records logins and sent messages, and fails on request."""
+    instances = []
+
+    def __init__(self, host, port, timeout=None):
+        self.logins = []
+        self.sent = []
+        self.fail_next = []  # Exceptions raised by the next send_message calls
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        self.logins.append(user)
+
+    def send_message(self, message):
+        if self.fail_next:
+            raise self.fail_next.pop(0)
+        self.sent.append(message["To"])
+
+    def close(self):
+        self.closed = True
+
+    def quit(self):
+        self.closed = True
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.instances = []
+    monkeypatch.setattr(mailer.smtplib, "SMTP", FakeSMTP)
+    return FakeSMTP
+
+
+def message(to="alice@example.com"):
+    return EmailTemplate("Hi {name}", "<p>{name}</p>").render(to, name="Alice")
+
+
+def test_connection_is_reused_between_messages(smtp):
+    m = Mailer("smtp.example.com", 587, user="bot", password="pw", rate_per_second=1000)
+    assert m.send(message("a@example.com")) and m.send(message("b@example.com"))
+    assert len(smtp.instances) == 1
+    assert smtp.instances[0].logins == ["bot"]
+    assert smtp.instances[0].sent == ["a@example.com", "b@example.com"]
+
+
+def test_reconnects_after_server_disconnect(smtp):
+    m = Mailer("smtp.example.com", 587, user="bot", password="pw", rate_per_second=1000)
+    assert m.send(message("a@example.com"))
+    smtp.instances[0].fail_next.append(smtplib.SMTPServerDisconnected("Connection unexpectedly closed"))
+
+    assert m.send(message("b@example.com")) is True
+    first, second = smtp.instances
+    assert first.closed and first.sent == ["a@example.com"]
+    assert second.logins == ["bot"] and second.sent == ["b@example.com"]
+
+
+def test_gives_up_when_the_reconnect_fails_too(smtp):
+    m = Mailer("smtp.example.com", 587, rate_per_second=1000)
+    m._connection().fail_next.append(smtplib.SMTPServerDisconnected("gone"))
+    original_connect = m._connect
+
+    def connect_and_fail():
+        server = original_connect()
+        server.fail_next.append(smtplib.SMTPServerDisconnected("gone again"))
+        return server
+    m._connect = connect_and_fail
+    assert m.send(message()) is False
+
+
+def test_refused_recipient_returns_false_without_reconnecting(smtp):
+    m = Mailer("smtp.example.com", 587, rate_per_second=1000)
+    m._connection().fail_next.append(smtplib.SMTPRecipientsRefused({"bad@example.com": (550, b"No such user")}))
+
+    assert m.send(message("bad@example.com")) is False
+    assert m.send(message("good@example.com")) is True
+    assert len(smtp.instances) == 1
+    assert smtp.instances[0].sent == ["good@example.com"]
+
+
+def test_send_rate_is_capped(smtp, monkeypatch):
+    clock = {"now": 1000.0}
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock["now"] += seconds
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(rate_limit.time, "sleep", sleep)
+
+    m = Mailer("smtp.example.com", 587, workers=1, rate_per_second=2)
+    results = [m.send(message(f"user{i}@example.com")) for i in range(5)]
+    assert results == [True] * 5
+    assert sum(sleeps) == pytest.approx(2.0)  # Burst of 1, then one message every 0.5s
+
+
+def test_send_batch_keeps_message_order(smtp):
+    m = Mailer("smtp.example.com", 587, workers=3, rate_per_second=1000)
+    recipients = [f"user{i}@example.com" for i in range(10)]
+    try:
+        assert m.send_batch([message(to) for to in recipients]) == [True] * 10
+    finally:
+        m.close()
+    assert sorted(to for server in smtp.instances for to in server.sent) == sorted(recipients)
+    assert all(server.closed for server in smtp.instances)
@@ -0,0 +1,103 @@
+import sqlite3
+
+import pytest
+
+import database
+
+# orders.db as the first release of the bot created it (no user_version, no indexes)
+BASELINE_ORDERS = '''
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        stripe_customer_id TEXT,
+        stripe_subscription_id TEXT UNIQUE,
+        tv_username TEXT,
+        mt5_account_number TEXT,
+        product_id TEXT,
+        status TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+# ...and before MT5 licensing existed
+PRE_MT5_ORDERS = BASELINE_ORDERS.replace("mt5_account_number TEXT,", "")
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = tmp_path / "orders.db"
+    monkeypatch.setattr(database, "DB_NAME", str(path))
+    monkeypatch.setenv("ORDER_ARCHIVE_DB", str(tmp_path / "orders_archive.db"))
+    yield path
+    database.close_pool()
+
+
+def create_baseline(path, schema=BASELINE_ORDERS):
+    conn = sqlite3.connect(path)
+    conn.execute(schema)
+    conn.execute(
+        "INSERT INTO orders (stripe_customer_id, stripe_subscription_id, tv_username, product_id, status) VALUES (?, ?, ?, ?, ?)",
+        ("cus_1", "sub_1", "alice", "prod_a", "active"),
+    )
+    conn.commit()
+    conn.close()
+
+
+def schema_objects(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'")}
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("schema", [BASELINE_ORDERS, PRE_MT5_ORDERS], ids=["baseline", "pre_mt5"])
+def test_baseline_database_upgrades_to_latest(db_path, schema):
+    create_baseline(db_path, schema)
+
+    assert database.migrate() == database.SCHEMA_VERSION == 7
+    assert database.get_schema_version() == 7
+    assert {
+        "orders", "idx_orders_license", "idx_orders_customer_status", "cleanup_state", "idx_cleanup_state_due",
+        "stripe_events", "license_changes", "scheduled_actions", "idx_scheduled_actions_open",
+        "idx_scheduled_actions_status", "idx_orders_status_updated",
+    } <= schema_objects(db_path)
+
+    # Existing orders survive and work with the new code
+    with database.connection() as conn:
+        assert conn.execute("SELECT tv_username, status FROM orders WHERE stripe_subscription_id = 'sub_1'").fetchone() == ("alice", "active")
+        conn.execute("UPDATE orders SET mt5_account_number = '1001' WHERE stripe_subscription_id = 'sub_1'")
+        conn.commit()
+    assert database.check_mt5_license("1001", "prod_a")
+
+
+def test_migrating_an_up_to_date_database_does_nothing(db_path, caplog):
+    create_baseline(db_path)
+    database.migrate()
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        assert database.migrate() == 7
+    assert not any("Applied schema migration" in record.message for record in caplog.records)
+
+
+def test_migrations_can_stop_at_a_version(db_path):
+    create_baseline(db_path)
+    assert database.migrate(target_version=4) == 4
+    assert "stripe_events" in schema_objects(db_path)
+    assert "license_changes" not in schema_objects(db_path)
+    assert database.migrate() == 7
+
+
+def test_failed_migration_leaves_schema_and_version_unchanged(db_path, monkeypatch):
+    create_baseline(db_path)
+    database.migrate()
+    broken = (8, "Half-applied migration", [
+        "CREATE TABLE widgets (id INTEGER PRIMARY KEY)",
+        "CREATE INDEX idx_widgets ON no_such_table (id)",
+    ])
+    monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS + [broken])
+
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate(target_version=8)
+
+    assert database.get_schema_version() == 7
+    assert "widgets" not in schema_objects(db_path)
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from product_catalog import ProductCatalog, load_catalog
+
+STATE_ENGINE = "https://www.tradingview.com/script/Example1-StateEngine/"
+SCANNER = "https://www.tradingview.com/script/Example2-Scanner/"
+
+
+def make_catalog():
+    return ProductCatalog(
+        {"prod_1": STATE_ENGINE, "prod_2": SCANNER},
+        {"BTMM State Engine": STATE_ENGINE, "BTMM Multi-Pair Scanner": SCANNER, "Scanner": SCANNER},
+        default_script=STATE_ENGINE,
+    )
+
+
+def test_stripe_products_fall_back_to_default_script():
+    catalog = make_catalog()
+    assert catalog.script_for_product_id("prod_2") == SCANNER
+    assert catalog.script_for_product_id("prod_unknown") == STATE_ENGINE
+    assert not catalog.knows_product_id("prod_unknown")
+
+
+def test_product_names_match_earliest_then_longest_key():
+    catalog = make_catalog()
+    assert catalog.script_for_name("BTMM State Engine - Monthly") == STATE_ENGINE
+    assert catalog.script_for_name("BTMM Multi-Pair Scanner (Yearly)") == SCANNER
+
+
+def test_unmapped_product_names_have_no_script():
+    catalog = make_catalog()
+    assert catalog.script_for_name("Other Product") is None
+    assert catalog.script_for_name("") is None
+
+
+def test_scripts_for_names_matches_per_row_lookup():
+    catalog = make_catalog()
+    names = pd.Series(["BTMM State Engine", "Other Product", None, "BTMM Multi-Pair Scanner", "BTMM State Engine"], dtype=object)
+    assert catalog.scripts_for_names(names).tolist() == [STATE_ENGINE, None, None, SCANNER, STATE_ENGINE]
+
+
+def test_bundled_catalog_maps_template_products():
+    catalog = load_catalog()
+    assert catalog.script_for_name("BTMM State Engine") == STATE_ENGINE
+    assert catalog.script_for_name("BTMM Multi-Pair Scanner") == SCANNER
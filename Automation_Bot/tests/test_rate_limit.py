@@ -0,0 +1,94 @@
+import pytest
+
+import rate_limit
+from rate_limit import KeyedRateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_at_rate(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.5
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 60
+    assert bucket.try_acquire(3)
+    assert not bucket.try_acquire()
+
+
+def test_keyed_limiter_keeps_one_bucket_per_key(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=2)
+    assert limiter.allow("a") and limiter.allow("a")
+    assert not limiter.allow("a")
+    assert limiter.allow("b")
+    clock.now += 1
+    assert limiter.allow("a")
+    assert not limiter.allow("a")
+
+
+def test_keyed_limiter_charges_several_tokens(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=5)
+    assert limiter.allow("a", 3)
+    assert not limiter.allow("a", 3)
+    assert limiter.allow("a", 2)
+
+
+def test_keyed_limiter_drops_least_recently_used_key(clock):
+    limiter = KeyedRateLimiter(rate=1, burst=1, max_keys=2)
+    assert limiter.allow("a") and limiter.allow("b")
+    assert not limiter.allow("a")  # "a" is now the most recently used
+    assert limiter.allow("c")      # Evicts "b"
+    assert len(limiter) == 2
+    assert limiter.allow("b")      # Starts again with a full bucket
+    assert not limiter.allow("c")
+
+
+@pytest.fixture
+def server_limits(monkeypatch, clock):
+    import server
+    monkeypatch.setattr(server, "RATE_LIMIT_IP_PER_SECOND", 100.0)
+    monkeypatch.setattr(server, "RATE_LIMIT_ACCOUNT_PER_SECOND", 1.0)
+    monkeypatch.setattr(server, "ip_limiter", KeyedRateLimiter(100, burst=100))
+    monkeypatch.setattr(server, "account_limiter", KeyedRateLimiter(1, burst=4))
+    return server
+
+
+def test_bulk_checks_charge_each_account_per_pair(server_limits):
+    server = server_limits
+    with server.app.test_request_context("/api/verify_licenses", method="POST"):
+        assert server.rate_limited("1001", "1001", "1001") is None
+        assert server.rate_limited("1002") is None
+        response = server.rate_limited("1001", "1001")
+        assert response.status_code == 429
+        assert server.rate_limited("1001") is None
+
+
+def test_bulk_checks_larger_than_the_burst_can_pass(server_limits):
+    server = server_limits
+    with server.app.test_request_context("/api/verify_licenses", method="POST"):
+        assert server.rate_limited(*["1001"] * 10) is None
+        assert server.rate_limited("1001").status_code == 429
+
+
+def test_proxied_requests_without_trusted_proxy_count_are_reported(server_limits, monkeypatch, caplog):
+    server = server_limits
+    monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", 0)
+    monkeypatch.setattr(server, "_proxy_warned", False)
+    with server.app.test_request_context("/api/verify_license", headers={"X-Forwarded-For": "203.0.113.7"}):
+        server.rate_limited("1001")
+        server.rate_limited("1001")
+    assert sum("TRUSTED_PROXY_COUNT" in record.message for record in caplog.records) == 1
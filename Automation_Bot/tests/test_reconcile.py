@@ -0,0 +1,147 @@
+import time
+
+import pytest
+
+import reconcile
+from product_catalog import ProductCatalog
+
+STATE_ENGINE = "https://www.tradingview.com/script/Example1-StateEngine/"
+SCANNER = "https://www.tradingview.com/script/Example2-Scanner/"
+
+
+class FakeSubscriptions:
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def list_subscriptions(self):
+        return iter(self.statuses.items())
+
+
+class FakeAccess:
+    """Access lists per script; manage_access_batch applies and records every change."""
+
+    def __init__(self, lists):
+        self.lists = {script_url: set(users) for script_url, users in lists.items()}
+        self.batches = []
+
+    def list_access(self, script_url):
+        users = self.lists.get(script_url)
+        return None if users is None else set(users)
+
+    def manage_access_batch(self, script_url, add=(), remove=()):
+        self.batches.append((script_url, list(add), list(remove)))
+        self.lists[script_url] |= set(add)
+        self.lists[script_url] -= set(remove)
+        return {username: True for username in (*add, *remove)}
+
+
+@pytest.fixture
+def catalog():
+    return ProductCatalog({"prod_1": STATE_ENGINE, "prod_2": SCANNER}, {}, default_script=STATE_ENGINE)
+
+
+def order(sub_id, username, product_id="prod_1", status="active"):
+    return {"stripe_subscription_id": sub_id, "tv_username": username, "product_id": product_id, "status": status}
+
+
+def test_build_plan_diffs_stripe_orders_and_access_lists(catalog):
+    orders = [
+        order("sub_1", "Alice"),
+        order("sub_2", "Bob", status="cancelled"),
+        order("sub_3", "Carol", product_id="prod_2"),
+        order("sub_4", "Dave"),
+    ]
+    subscriptions = {"sub_1": "active", "sub_2": "active", "sub_3": "canceled", "sub_4": "past_due", "sub_9": "active"}
+    access_lists = {STATE_ENGINE: {"alice", "ManualGrant"}, SCANNER: {"Carol"}}
+
+    plan = reconcile.build_plan(orders, subscriptions, access_lists, catalog)
+    assert plan["status_changes"] == [
+        {"stripe_subscription_id": "sub_2", "from": "cancelled", "to": "active"},
+        {"stripe_subscription_id": "sub_3", "from": "active", "to": "cancelled"},
+        {"stripe_subscription_id": "sub_4", "from": "active", "to": "past_due"},
+    ]
+    assert plan["missing_orders"] == ["sub_9"]
+    # "alice" already has access (names are case-insensitive); manual grants are never removed
+    assert plan["access"] == {STATE_ENGINE: {"add": ["Bob", "Dave"], "remove": []}, SCANNER: {"add": [], "remove": ["Carol"]}}
+
+
+def test_unknown_subscriptions_and_unreadable_scripts(catalog):
+    plan = reconcile.build_plan([order("sub_1", "Alice")], {}, {STATE_ENGINE: None}, catalog)
+    assert plan["unknown_subscriptions"] == ["sub_1"]
+    assert plan["unreadable_scripts"] == [STATE_ENGINE]
+    assert plan["status_changes"] == [] and plan["access"] == {}
+
+
+def test_reconcile_applies_the_plan_and_reports_status_changes(db, catalog):
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_1")
+    db.add_order("cus_2", "sub_2", "Bob", "1002", "prod_1")
+    db.add_order("cus_3", "sub_3", "Carol", "1003", "prod_2", status="past_due")
+    access = FakeAccess({STATE_ENGINE: {"Alice", "Bob"}, SCANNER: {"Carol"}})
+    subscriptions = FakeSubscriptions({"sub_1": "active", "sub_2": "past_due", "sub_3": "canceled"})
+    seen = []
+
+    result = reconcile.reconcile(subscriptions, access, catalog, on_status_change=lambda *change: seen.append(change))
+    assert seen == [("sub_2", "active", "past_due"), ("sub_3", "past_due", "cancelled")]
+    assert result["applied"] == {"status_changes": 2, "added": 0, "removed": 1, "failed": []}
+    assert db.get_user_by_subscription("sub_2")["status"] == "past_due"
+    assert access.lists == {STATE_ENGINE: {"Alice", "Bob"}, SCANNER: set()}
+
+    # A second run finds nothing to do
+    again = reconcile.reconcile(subscriptions, access, catalog, on_status_change=lambda *change: seen.append(change))
+    assert again["applied"]["status_changes"] == 0 and len(access.batches) == 1
+
+
+def test_dry_run_changes_nothing(db, catalog):
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_1")
+    access = FakeAccess({STATE_ENGINE: set(), SCANNER: set()})
+    result = reconcile.reconcile(FakeSubscriptions({"sub_1": "canceled"}), access, catalog, dry_run=True)
+    assert result["applied"] is None
+    assert len(result["plan"]["status_changes"]) == 1
+    assert db.get_user_by_subscription("sub_1")["status"] == "active"
+    assert access.batches == []
+
+
+def test_server_starts_and_cancels_grace_period_for_reconciled_orders(db):
+    import server
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_1")
+    start = time.time()
+    server.on_reconciled_status("sub_1", "active", "past_due")
+    pending = db.get_pending_actions()
+    assert [(entry["action"], entry["stripe_subscription_id"]) for entry in pending] == [("revoke", "sub_1")]
+    assert pending[0]["due_at"] >= start + server.PAYMENT_GRACE_HOURS * 3600
+
+    server.on_reconciled_status("sub_1", "past_due", "active")
+    assert db.get_pending_actions() == []
+
+
+@pytest.fixture
+def server_access(db, monkeypatch):
+    """The server module with FakeAccess in place of the browser pool."""
+    import server
+    access = FakeAccess({script_url: set() for script_url in server.catalog.script_urls()})
+    monkeypatch.setattr(server, "browsers", access)
+    return server, access
+
+
+@pytest.mark.parametrize("stripe_status", ["past_due", "unpaid"])
+def test_reconcile_does_not_undo_an_expired_grace_period(db, server_access, stripe_status):
+    server, access = server_access
+    script_url = server.catalog.script_for_product_id("prod_1")
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_1")
+    access.lists[script_url].add("Alice")
+
+    server.handle_payment_failed({"subscription": "sub_1"})
+    server.scheduler.run_due(db.get_pending_actions())  # The grace period runs out
+    assert db.get_user_by_subscription("sub_1")["status"] == "lapsed"
+    assert "Alice" not in access.lists[script_url]
+
+    # Stripe still retries the invoice; reconcile must not bring the user back
+    result = reconcile.reconcile(FakeSubscriptions({"sub_1": stripe_status}), access, server.catalog, on_status_change=server.on_reconciled_status)
+    assert result["plan"]["status_changes"] == [] and result["plan"]["access"] == {}
+    assert "Alice" not in access.lists[script_url]
+    assert db.get_pending_actions() == []
+
+    # Paying later is what restores access
+    reconcile.reconcile(FakeSubscriptions({"sub_1": "active"}), access, server.catalog, on_status_change=server.on_reconciled_status)
+    assert db.get_user_by_subscription("sub_1")["status"] == "active"
+    assert "Alice" in access.lists[script_url]
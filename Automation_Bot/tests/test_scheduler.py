@@ -0,0 +1,169 @@
+import time
+import threading
+
+from scheduler import Scheduler
+
+
+def action_status(db, action_id):
+    with db.connection() as conn:
+        return conn.execute("SELECT status, attempts, last_error FROM scheduled_actions WHERE id = ?", (action_id,)).fetchone()
+
+
+def test_schedule_keeps_the_first_deadline(db):
+    scheduler = Scheduler({"revoke": lambda entries: {}})
+    due_at = scheduler.schedule("revoke", "sub_1", 3600)
+    assert scheduler.schedule("revoke", "sub_1", 7200) == due_at
+    assert len(db.get_pending_actions()) == 1
+
+
+def test_due_actions_run_in_batches(db):
+    batches = []
+
+    def revoke(entries):
+        batches.append(sorted(entry["stripe_subscription_id"] for entry in entries))
+        return {entry["id"]: None for entry in entries}
+
+    scheduler = Scheduler({"revoke": revoke}, batch_size=2)
+    for i in range(3):
+        scheduler.schedule("revoke", f"sub_{i}", -1)
+    scheduler.load()
+    with scheduler._cond:
+        first = scheduler._pop_due()
+    scheduler.run_due(first)
+    with scheduler._cond:
+        second = scheduler._pop_due()
+    scheduler.run_due(second)
+    assert batches == [["sub_0", "sub_1"], ["sub_2"]]
+    assert db.get_pending_actions() == []
+    assert len(scheduler) == 0
+
+
+def test_cancelled_actions_do_not_run(db):
+    ran = []
+    scheduler = Scheduler({"revoke": lambda entries: ran.extend(entries) or {}})
+    scheduler.schedule("revoke", "sub_1", -1)
+    scheduler.load()
+    assert scheduler.cancel("revoke", "sub_1")
+    with scheduler._cond:
+        due = scheduler._pop_due()
+    scheduler.run_due(due)
+    assert ran == []
+    assert not scheduler.cancel("revoke", "sub_1")
+
+
+def test_failures_are_retried_then_given_up(db):
+    scheduler = Scheduler({"revoke": lambda entries: {entry["id"]: "TradingView error" for entry in entries}}, max_attempts=2, retry_delay=0)
+    scheduler.schedule("revoke", "sub_1", -1)
+    scheduler.load()
+    action_id = db.get_pending_actions()[0]["id"]
+
+    with scheduler._cond:
+        due = scheduler._pop_due()
+    scheduler.run_due(due)
+    assert action_status(db, action_id) == ("pending", 1, "TradingView error")
+    with scheduler._cond:
+        due = scheduler._pop_due()
+    scheduler.run_due(due)
+    assert action_status(db, action_id) == ("failed", 2, "TradingView error")
+    assert len(scheduler) == 0
+
+
+def test_pending_actions_survive_a_restart(db):
+    scheduler = Scheduler({"revoke": lambda entries: {}})
+    scheduler.schedule("revoke", "sub_1", 3600)
+    scheduler.schedule("revoke", "sub_2", -1)
+    db.claim_scheduled_actions([db.get_pending_actions()[-1]["id"]])  # Interrupted while running
+
+    restarted = Scheduler({"revoke": lambda entries: {}})
+    assert restarted.load() == 2
+    assert sorted(entry["stripe_subscription_id"] for _, _, entry in restarted._heap) == ["sub_1", "sub_2"]
+
+
+def test_running_scheduler_wakes_for_a_sooner_action(db):
+    done = threading.Event()
+
+    def revoke(entries):
+        done.set()
+        return {entry["id"]: None for entry in entries}
+
+    scheduler = Scheduler({"revoke": revoke}, pickup_seconds=60, batch_window=0)
+    scheduler.schedule("revoke", "sub_later", 3600)
+    scheduler.start()
+    try:
+        time.sleep(0.05)  # Asleep until the action an hour away
+        scheduler.schedule("revoke", "sub_now", 0.05)
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+    assert [entry["stripe_subscription_id"] for entry in db.get_pending_actions()] == ["sub_later"]
+
+
+def test_actions_scheduled_by_other_processes_are_picked_up(db):
+    done = threading.Event()
+    scheduler = Scheduler({"revoke": lambda entries: done.set() or {entry["id"]: None for entry in entries}}, pickup_seconds=0.05)
+    scheduler.start()
+    try:
+        Scheduler({}).schedule("revoke", "sub_1", 0)  # Another worker: no thread, database only
+        assert done.wait(2)
+    finally:
+        scheduler.stop()
+
+
+class FakeAccess:
+    def __init__(self, users):
+        self.users = set(users)
+
+    def list_access(self, script_url):
+        return set(self.users)
+
+    def manage_access_batch(self, script_url, add=(), remove=()):
+        self.users |= set(add)
+        self.users -= set(remove)
+        return {username: True for username in (*add, *remove)}
+
+
+class FakeSubscriptions:
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def list_subscriptions(self):
+        return iter(self.statuses.items())
+
+
+def test_grace_period_revoke_is_final_for_reconcile(db, monkeypatch):
+    import server
+    import reconcile
+    access = FakeAccess({"Alice", "Bob"})
+    monkeypatch.setattr(server, "browsers", access)
+    monkeypatch.setattr(server.catalog, "script_urls", lambda: [server.catalog.default_script])
+    db.add_order("cus_1", "sub_1", "Alice", "1001", "prod_1")
+    db.add_order("cus_2", "sub_2", "Bob", "1002", "prod_1")
+
+    # Both miss a payment; Bob pays within the grace period
+    server.handle_payment_failed({"subscription": "sub_1"})
+    server.handle_payment_failed({"subscription": "sub_2"})
+    server.handle_invoice_paid({"subscription": "sub_2"})
+    scheduler = Scheduler({"revoke": server.run_scheduled_revokes}, pickup_seconds=0.05)
+    with db.connection() as conn, conn:
+        conn.execute("UPDATE scheduled_actions SET due_at = 0")
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 2
+        while db.get_pending_actions() and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        scheduler.stop()
+    assert db.get_user_by_subscription("sub_1")["status"] == "lapsed"
+    assert access.users == {"Bob"}
+
+    # Stripe is still retrying sub_1's invoice: reconcile keeps the outcome
+    stripe = FakeSubscriptions({"sub_1": "unpaid", "sub_2": "active"})
+    result = reconcile.reconcile(stripe, access, server.catalog, on_status_change=server.on_reconciled_status)
+    assert result["plan"]["status_changes"] == [] and access.users == {"Bob"}
+    assert db.get_pending_actions() == []
+
+    # When Stripe gives up, the order simply ends as cancelled
+    stripe.statuses["sub_1"] = "canceled"
+    reconcile.reconcile(stripe, access, server.catalog, on_status_change=server.on_reconciled_status)
+    assert db.get_user_by_subscription("sub_1")["status"] == "cancelled"
+    assert access.users == {"Bob"}
@@ -0,0 +1,70 @@
+import pytest
+
+
+@pytest.fixture
+def job_id(client):
+    import server
+    return server.jobs.enqueue("grant_access", {"tv_username": "alice", "trace_id": "t-1"})
+
+
+def test_job_endpoints_answer_local_requests_without_a_token(client, job_id):
+    response = client.get(f"/api/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.get_json()["trace_id"] == "t-1"
+    assert client.get("/api/jobs").status_code == 200
+
+
+@pytest.mark.parametrize("environ", [
+    {"REMOTE_ADDR": "203.0.113.5"},
+    {"REMOTE_ADDR": "127.0.0.1", "HTTP_X_FORWARDED_FOR": "203.0.113.5"}, # Through ngrok
+])
+def test_job_endpoints_refuse_remote_requests_without_a_token(client, job_id, environ):
+    assert client.get(f"/api/jobs/{job_id}", environ_base=environ).status_code == 401
+    assert client.get("/api/jobs", environ_base=environ).status_code == 401
+
+
+def test_job_endpoints_need_the_admin_token_when_set(client, job_id, monkeypatch):
+    import server
+    monkeypatch.setattr(server, "ADMIN_TOKEN", "s3cret")
+    remote = {"REMOTE_ADDR": "203.0.113.5"}
+    assert client.get(f"/api/jobs/{job_id}").status_code == 401
+    assert client.get(f"/api/jobs/{job_id}", headers={"Authorization": "Bearer wrong"}, environ_base=remote).status_code == 401
+    response = client.get(f"/api/jobs/{job_id}", headers={"Authorization": "Bearer s3cret"}, environ_base=remote)
+    assert response.status_code == 200
+    assert response.get_json()["id"] == job_id
+
+
+def test_metrics_and_cache_stats_need_admin_access(client):
+    remote = {"REMOTE_ADDR": "203.0.113.5"}
+    assert client.get("/metrics", environ_base=remote).status_code == 401
+    assert client.get("/api/license_cache_stats", environ_base=remote).status_code == 401
+    assert client.get("/api/license_cache_stats").status_code == 200
+
+
+def _sample(text, name, labels):
+    """The value of one sample line in a Prometheus scrape (0 if it is not there yet)."""
+    prefix = f"{name}{{{labels}}} " if labels else f"{name} "
+    values = [float(line[len(prefix):]) for line in text.splitlines() if line.startswith(prefix)]
+    assert len(values) <= 1
+    return values[0] if values else 0.0
+
+
+def test_metrics_scrape_counts_a_license_check(client, db, monkeypatch):
+    import server
+    monkeypatch.setattr(server, "USE_LICENSE_SNAPSHOT", False) # Go through the license cache and its counters
+    db.add_order("cus_1", "sub_1", "alice", "12345", "prod_a")
+    route = 'route="/api/verify_license",method="GET",status="200"'
+    before = client.get("/metrics").get_data(as_text=True)
+
+    response = client.get("/api/verify_license?account_number=12345&product_id=prod_a")
+    assert response.get_json()["valid"] is True
+
+    scrape = client.get("/metrics")
+    assert scrape.status_code == 200
+    assert scrape.content_type.startswith("text/plain")
+    text = scrape.get_data(as_text=True)
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert _sample(text, "http_request_duration_seconds_count", route) == _sample(before, "http_request_duration_seconds_count", route) + 1
+    assert _sample(text, "http_request_duration_seconds_bucket", route + ',le="+Inf"') == _sample(before, "http_request_duration_seconds_bucket", route + ',le="+Inf"') + 1
+    assert "# TYPE license_cache_hits_total counter" in text
+    assert _sample(text, "license_cache_hits_total", 'answer="valid"') == _sample(before, "license_cache_hits_total", 'answer="valid"') + 1
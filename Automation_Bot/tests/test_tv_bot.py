@@ -0,0 +1,242 @@
+import re
+import time
+
+import pytest
+
+import tv_bot
+from tv_bot import user_row, xpath_literal
+
+
+def evaluate_literal(expression):
+    """Evaluate an XPath string literal or concat() of literals, as an XPath 1.0 engine would."""
+    parts = re.fullmatch(r"concat\((.*)\)", expression)
+    items = re.findall(r"""'[^']*'|"[^"]*"|,\s*""", parts.group(1) if parts else expression)
+    literals = [item for item in items if not item.startswith(",")]
+    assert "".join(items).replace(" ", "") == (parts.group(1) if parts else expression).replace(" ", "")
+    assert parts or len(literals) == 1
+    return "".join(literal[1:-1] for literal in literals)
+
+
+@pytest.mark.parametrize("value", ["TraderJoe", "O'Brien", 'Say "hi"', "it's \"both\"", "'", "''\"", "a]b or 1=1"])
+def test_xpath_literal_round_trips(value):
+    assert evaluate_literal(xpath_literal(value)) == value
+
+
+def test_user_row_quotes_the_username():
+    strategy, xpath = user_row("x' or '1'='1")
+    assert strategy == "xpath"
+    assert xpath.startswith('//span[normalize-space(text())="x\' or \'1\'=\'1"]')
+    assert user_row("  Trader   Joe ")[1].startswith("//span[normalize-space(text())='Trader Joe']")
+
+
+class FakeDriver:
+    """Just enough of a WebDriver for the bot's waits: elements are looked up in `present`."""
+
+    def __init__(self, present=()):
+        self.present = set(present)
+        self.visited = []
+        self.quit_called = False
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def execute_script(self, script):
+        return "complete"
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+        if (by, value) not in self.present:
+            raise NoSuchElementException(value)
+        return object()
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture
+def fast_waits(monkeypatch):
+    monkeypatch.setattr(tv_bot, "LOGIN_CHECK_TIMEOUT", 0.05)
+    monkeypatch.setattr(tv_bot, "WAIT_POLL_INTERVAL", 0.01)
+
+
+def make_bot(driver, headless=True, **kwargs):
+    bot = tv_bot.TradingViewBot("user", "pass", user_data_dir="/tmp/profile", headless=headless, **kwargs)
+    bot.driver = driver
+    return bot
+
+
+def test_login_with_saved_session(fast_waits):
+    bot = make_bot(FakeDriver(present=[tv_bot.USER_MENU]))
+    bot.login()
+    assert bot.driver.visited == [tv_bot.TRADINGVIEW_HOME]
+
+
+def test_headless_login_without_session_fails_fast(fast_waits):
+    bot = make_bot(FakeDriver())
+    start = time.perf_counter()
+    with pytest.raises(tv_bot.LoginRequiredError, match="not logged in"):
+        bot.login()
+    assert time.perf_counter() - start < 2
+    assert tv_bot.TRADINGVIEW_SIGNIN not in bot.driver.visited
+
+
+class FakeElement:
+    def __init__(self, on_click=None, children=None, text=""):
+        self.on_click = on_click
+        self.children = children or {}
+        self.text = text
+        self.value = ""
+
+    def is_displayed(self):
+        return True
+
+    def is_enabled(self):
+        return True
+
+    def click(self):
+        if self.on_click:
+            self.on_click()
+
+    def clear(self):
+        self.value = ""
+
+    def send_keys(self, keys):
+        self.value += keys
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+        if (by, value) not in self.children:
+            raise NoSuchElementException(value)
+        return self.children[(by, value)]
+
+
+class FakeAccessPage(FakeDriver):
+    """
+    A script page with a Manage Access modal. Added users show up after `row_delay`
+    seconds; users in `refused` never show up (as when TradingView rejects a name).
+    """
+
+    def __init__(self, users=(), refused=(), row_delay=0, ready_state="complete"):
+        super().__init__()
+        self.users = set(users)
+        self.refused = set(refused)
+        self.row_delay = row_delay
+        self.ready_state = ready_state
+        self.pending = {}  # username -> time its row appears
+        self.modal_open = False
+        self.input = FakeElement()
+
+    def execute_script(self, script, *args):
+        return self.ready_state
+
+    def _click_add(self):
+        username = self.input.value
+        if username not in self.refused:
+            self.pending[username] = time.monotonic() + self.row_delay
+
+    def _rows(self):
+        for username, at in list(self.pending.items()):
+            if time.monotonic() >= at:
+                del self.pending[username]
+                self.users.add(username)
+        return {user_row(username): username for username in self.users}
+
+    def find_element(self, by, value):
+        from selenium.common.exceptions import NoSuchElementException
+        locator = (by, value)
+        if locator == tv_bot.MANAGE_ACCESS_BUTTON and self.visited:
+            return FakeElement(on_click=lambda: setattr(self, "modal_open", True))
+        if self.modal_open:
+            if locator == tv_bot.USERNAME_INPUT:
+                return self.input
+            if locator == tv_bot.ADD_BUTTON:
+                return FakeElement(on_click=self._click_add)
+            if locator == tv_bot.CLOSE_BUTTON:
+                return FakeElement(on_click=lambda: setattr(self, "modal_open", False))
+            username = self._rows().get(locator)
+            if username is not None:
+                delete = FakeElement(on_click=lambda: self.users.discard(username))
+                return FakeElement(children={tv_bot.ROW_DELETE_BUTTON: delete}, text=username)
+        raise NoSuchElementException(value)
+
+
+class StepRecorder:
+    def __init__(self):
+        self.steps = []
+
+    def __call__(self, step, seconds, success, labels):
+        self.steps.append((step, success, labels))
+
+
+@pytest.fixture
+def steps(fast_waits):
+    return StepRecorder()
+
+
+def test_batch_reports_every_step(steps):
+    page = FakeAccessPage(users=["old"])
+    bot = make_bot(page, metrics_sink=steps, wait_timeout=1)
+
+    assert bot.manage_access_batch("https://tv/script/1", add=["new"], remove=["old"]) == {"new": True, "old": True}
+    assert page.users == {"new"} and not page.modal_open
+    assert steps.steps == [
+        ("navigate", True, {}),
+        ("open_modal", True, {}),
+        ("input", True, {}),
+        ("confirm", True, {"action": "add"}),
+        ("confirm", True, {"action": "remove"}),
+        ("close", True, {}),
+    ]
+
+
+def test_waits_return_as_soon_as_the_row_appears(steps):
+    bot = make_bot(FakeAccessPage(row_delay=0.05), metrics_sink=steps, wait_timeout=5)
+    start = time.perf_counter()
+    assert bot.manage_access("https://tv/script/1", "slow_user") is True
+    assert time.perf_counter() - start < 1  # Far below the 5 s timeout
+
+
+def test_row_that_never_appears_times_out_and_is_reported(steps):
+    bot = make_bot(FakeAccessPage(refused=["ghost"]), metrics_sink=steps, wait_timeout=0.1)
+    start = time.perf_counter()
+    assert bot.manage_access("https://tv/script/1", "ghost") is False
+    assert time.perf_counter() - start < 2
+    assert ("confirm", False, {"action": "add"}) in steps.steps
+    assert steps.steps[-1] == ("close", True, {})  # The modal is still closed afterwards
+
+
+def test_page_that_never_loads_fails_the_navigate_step(steps):
+    bot = make_bot(FakeAccessPage(ready_state="loading"), metrics_sink=steps, wait_timeout=0.1)
+    assert bot.manage_access_batch("https://tv/script/1", add=["a", "b"]) == {"a": False, "b": False}
+    assert steps.steps == [("navigate", False, {})]
+
+
+def test_failing_metrics_sink_does_not_break_the_operation(fast_waits):
+    def broken_sink(step, seconds, success, labels):
+        raise RuntimeError("sink down")
+    bot = make_bot(FakeAccessPage(), metrics_sink=broken_sink, wait_timeout=1)
+    assert bot.manage_access("https://tv/script/1", "alice") is True
+
+
+def test_batch_returns_a_result_per_user(steps):
+    page = FakeAccessPage(users=["already_there", "leaving"], refused=["bad_name"])
+    bot = make_bot(page, metrics_sink=steps, wait_timeout=0.1)
+
+    results = bot.manage_access_batch(
+        "https://tv/script/1",
+        add=["new_1", "already_there", "bad_name", "new_2", "new_1"],
+        remove=["leaving", "never_added"],
+    )
+
+    assert results == {
+        "new_1": True,  # Listed twice, added once
+        "already_there": True,
+        "bad_name": False,
+        "new_2": True,
+        "leaving": True,
+        "never_added": False,
+    }
+    assert page.users == {"already_there", "new_1", "new_2"}
+    assert page.visited == ["https://tv/script/1"]  # One page load for the whole batch
+    assert [step for step, _, _ in steps.steps].count("open_modal") == 1
+    assert bot.operations == 1
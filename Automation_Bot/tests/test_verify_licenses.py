@@ -0,0 +1,65 @@
+import pytest
+
+
+@pytest.fixture(params=[True, False], ids=["snapshot", "cache"])
+def licenses(request, client, db, monkeypatch):
+    """The test client with two active licenses and one cancelled one, checked through the snapshot or the cache."""
+    import server
+    monkeypatch.setattr(server, "USE_LICENSE_SNAPSHOT", request.param)
+    db.add_order("cus_1", "sub_1", "alice", "1001", "prod_a")
+    db.add_order("cus_2", "sub_2", "bob", "1002", "prod_b")
+    db.add_order("cus_3", "sub_3", "carol", "1003", "prod_a", status="cancelled")
+    return client
+
+
+def test_mixed_batch_answers_each_pair_in_order(licenses):
+    pairs = [
+        ["1001", "prod_a"],  # Active
+        ["1001", "prod_b"],  # Known account, product not bought
+        ["1003", "prod_a"],  # Cancelled
+        ["9999", "prod_a"],  # Unknown account
+        ["1002", "prod_b"],  # Active
+    ]
+    response = licenses.post("/api/verify_licenses", json={"pairs": pairs})
+    assert response.status_code == 200
+    assert response.get_json()["valid"] == [True, False, False, False, True]
+
+
+def test_numeric_account_numbers_are_accepted(licenses):
+    response = licenses.post("/api/verify_licenses", json={"pairs": [[1001, "prod_a"]]})
+    assert response.get_json()["valid"] == [True]
+
+
+def test_batch_size_limit(licenses, monkeypatch):
+    import server
+    monkeypatch.setattr(server, "MAX_LICENSE_BATCH", 3)
+    assert licenses.post("/api/verify_licenses", json={"pairs": [["1001", "prod_a"]] * 3}).status_code == 200
+
+    response = licenses.post("/api/verify_licenses", json={"pairs": [["1001", "prod_a"]] * 4})
+    assert response.status_code == 400
+    assert response.get_json() == {"valid": [], "message": "At most 3 pairs per request"}
+
+
+@pytest.mark.parametrize("body", [
+    "{not json",
+    "[]",
+    '{"pairs": []}',
+    '{"pairs": "1001,prod_a"}',
+    '{"pairs": [["1001"]]}',
+    '{"pairs": [["1001", ""]]}',
+    '{"pairs": [["1001", "prod_a"], null]}',
+])
+def test_malformed_bodies_are_rejected(client, body):
+    response = client.post("/api/verify_licenses", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json()["valid"] == []
+
+
+def test_rate_limited_batch_is_refused_before_any_lookup(client, monkeypatch):
+    import server
+    from rate_limit import KeyedRateLimiter
+    monkeypatch.setattr(server, "account_limiter", KeyedRateLimiter(0.001, burst=2))
+    assert client.post("/api/verify_licenses", json={"pairs": [["1001", "prod_a"], ["1001", "prod_b"]]}).status_code == 200
+
+    monkeypatch.setattr(server, "check_licenses", lambda pairs: pytest.fail("looked up a rate-limited batch"))
+    assert client.post("/api/verify_licenses", json={"pairs": [["1001", "prod_a"]]}).status_code == 429
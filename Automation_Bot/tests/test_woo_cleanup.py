@@ -0,0 +1,75 @@
+import csv
+import datetime
+
+import pytest
+
+import woo_cleanup
+
+STATE_ENGINE = "https://www.tradingview.com/script/Example1-StateEngine/"
+
+
+@pytest.fixture
+def export(db, tmp_path, monkeypatch):
+    """Write a WooCommerce export; returns a function taking the data rows."""
+    path = tmp_path / "export.csv"
+    monkeypatch.setattr(woo_cleanup, "CSV_FILE", str(path))
+
+    def write(rows):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([woo_cleanup.COL_ORDER_ID, woo_cleanup.COL_STATUS, woo_cleanup.COL_PRODUCT, woo_cleanup.COL_USERNAME, woo_cleanup.COL_EMAIL])
+            writer.writerows(rows)
+    return write
+
+
+def warned(db, order_id, username, product_name, days_ago):
+    db.save_cleanup_state([{
+        "order_id": order_id, "tv_username": username, "product_name": product_name, "email": f"{username}@example.com",
+        "status": "cancelled", "warning_sent_date": str(datetime.date.today() - datetime.timedelta(days=days_ago)), "removed_date": None,
+    }])
+
+
+def test_new_lapsed_users_get_warnings(export):
+    export([
+        ["101", "cancelled", "BTMM State Engine", "TraderJoe", "joe@example.com"],
+        ["102", "active", "BTMM State Engine", "StillPaying", "paying@example.com"],
+        ["103", "cancelled", "BTMM State Engine", "NoEmail", ""],
+    ])
+    plan = woo_cleanup.build_cleanup_plan()
+    assert [entry["tv_username"] for entry in plan["warnings"]] == ["TraderJoe"]
+    assert [skip["tv_username"] for skip in plan["skips"]] == ["NoEmail"]
+    assert plan["removals"] == {}
+
+
+def test_removals_after_grace_period_are_grouped_by_script(db, export):
+    export([["101", "cancelled", "BTMM State Engine", "TraderJoe", "joe@example.com"]])
+    warned(db, "101", "TraderJoe", "BTMM State Engine", woo_cleanup.GRACE_PERIOD_DAYS + 1)
+    warned(db, "104", "Recent", "BTMM State Engine", 0)
+    plan = woo_cleanup.build_cleanup_plan()
+    assert plan["removals"] == {STATE_ENGINE: [{"order_id": "101", "tv_username": "TraderJoe"}]}
+
+
+def test_unmapped_products_are_skipped_not_removed(db, export):
+    export([["105", "cancelled", "Other Product", "OtherUser", "other@example.com"]])
+    warned(db, "105", "OtherUser", "Other Product", woo_cleanup.GRACE_PERIOD_DAYS + 1)
+    plan = woo_cleanup.build_cleanup_plan()
+    assert plan["removals"] == {}
+    assert plan["skips"] == [{"order_id": "105", "tv_username": "OtherUser", "reason": "No script mapped for product 'Other Product'"}]
+
+
+def test_reactivated_users_are_forgotten(db, export):
+    export([["101", "active", "BTMM State Engine", "TraderJoe", "joe@example.com"]])
+    warned(db, "101", "TraderJoe", "BTMM State Engine", woo_cleanup.GRACE_PERIOD_DAYS + 1)
+    plan = woo_cleanup.build_cleanup_plan()
+    assert plan["forget"] == [{"order_id": "101", "tv_username": "TraderJoe"}]
+    assert plan["removals"] == {}
+
+
+def test_grace_period_is_measured_from_the_plan_date(db, export):
+    export([["101", "cancelled", "BTMM State Engine", "TraderJoe", "joe@example.com"]])
+    warned(db, "101", "TraderJoe", "BTMM State Engine", 0)
+    later = datetime.date.today() + datetime.timedelta(days=woo_cleanup.GRACE_PERIOD_DAYS)
+    assert woo_cleanup.build_cleanup_plan(today=later - datetime.timedelta(days=1))["removals"] == {}
+    plan = woo_cleanup.build_cleanup_plan(today=later)
+    assert plan["date"] == str(later)
+    assert plan["removals"] == {STATE_ENGINE: [{"order_id": "101", "tv_username": "TraderJoe"}]}
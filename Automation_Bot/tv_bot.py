@@ -1,68 +1,186 @@
 import time
 import os
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
+import threading
+from contextlib import contextmanager
+# selenium and webdriver_manager are imported where a browser is actually driven:
+# they are slow to import, and the server and woo_cleanup often never need them.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROFILE_DIR = os.path.join(SCRIPT_DIR, "chrome_profile")
+
+# The resolved chromedriver path is remembered here so later runs skip ChromeDriverManager
+DRIVER_PATH_CACHE = os.path.join(SCRIPT_DIR, ".chromedriver_path")
+
+# Page Locators
+# Note: Selectors are fragile and may need updates if TV updates UI.
+# Keeping them here also lets the bot run against a local stand-in of the Manage Access page.
+# Strategies are the string values of selenium's By constants (By.CSS_SELECTOR is "css selector", By.XPATH is "xpath").
+TRADINGVIEW_HOME = "https://www.tradingview.com/"
+TRADINGVIEW_SIGNIN = "https://www.tradingview.com/accounts/signin/"
+USER_MENU = ("css selector", "button[aria-label='Open user menu']")
+MANAGE_ACCESS_BUTTON = ("xpath", "//button[contains(text(), 'Manage Access')]")
+USERNAME_INPUT = ("css selector", "input[placeholder='Username']")
+ADD_BUTTON = ("xpath", "//button[contains(text(), 'Add')]")
+CLOSE_BUTTON = ("css selector", "button[data-name='close']")
+ROW_DELETE_BUTTON = ("xpath", ".//button[contains(@class, 'delete')]")
+ACCESS_LIST_USERNAMES = ("xpath", "//div[contains(@class, 'row')]/span")
+
+def xpath_literal(value):
+    """Quote a string for XPath 1.0, which has no escapes: a value with both quote kinds is built with concat()."""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return "concat(" + ", \"'\", ".join(f"'{part}'" for part in value.split("'")) + ")"
+
+def user_row(username):
+    """Locator for a user's row in the Manage Access list (exact match, so 'Joe' never matches 'Joe2')."""
+    name = " ".join(str(username).split())  # Same whitespace rules as normalize-space()
+    return ("xpath", f"//span[normalize-space(text())={xpath_literal(name)}]/ancestor::div[contains(@class, 'row')]")
+
+# Waits
+DEFAULT_WAIT_TIMEOUT = 10   # Seconds to wait for any single page condition
+LOGIN_CHECK_TIMEOUT = 5     # Seconds to look for the user menu before assuming we're logged out
+WAIT_POLL_INTERVAL = 0.1
+LIST_SCROLL_TIMEOUT = 1     # Seconds to wait for more rows after scrolling a lazy-loaded access list
+
+def log_step_timing(step, seconds, success, labels):
+    """Default metrics sink: log each browser step's duration."""
+    extra = "".join(f" {key}={value}" for key, value in labels.items())
+    logging.debug(f"tv_bot step={step} seconds={seconds:.3f} success={success}{extra}")
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+def get_driver_path():
+    """
+    Returns the chromedriver binary path, resolving it at most once.
+    Order: CHROMEDRIVER_PATH env var, in-process cache, on-disk cache, ChromeDriverManager download.
+    """
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path and os.path.exists(_driver_path):
+            return _driver_path
+
+        env_path = os.getenv("CHROMEDRIVER_PATH")
+        if env_path and os.path.exists(env_path):
+            _driver_path = env_path
+            return _driver_path
+
+        if os.path.exists(DRIVER_PATH_CACHE):
+            with open(DRIVER_PATH_CACHE) as f:
+                cached = f.read().strip()
+            if cached and os.path.exists(cached):
+                _driver_path = cached
+                return _driver_path
+
+        from webdriver_manager.chrome import ChromeDriverManager
+        _driver_path = ChromeDriverManager().install()
+        try:
+            with open(DRIVER_PATH_CACHE, "w") as f:
+                f.write(_driver_path)
+        except OSError as e:
+            logging.warning(f"Could not cache chromedriver path: {e}")
+        return _driver_path
+
+class LoginRequiredError(RuntimeError):
+    """The browser profile has no TradingView session and nobody can log in (headless browser)."""
+
+
 class TradingViewBot:
-    def __init__(self, tv_username, tv_password):
+    def __init__(self, tv_username, tv_password, user_data_dir=None, headless=False, metrics_sink=None, wait_timeout=DEFAULT_WAIT_TIMEOUT):
         self.tv_username = tv_username
         self.tv_password = tv_password
+        self.user_data_dir = user_data_dir or DEFAULT_PROFILE_DIR
+        self.headless = headless
+        # Called as metrics_sink(step, seconds, success, labels) for every timed browser step
+        self.metrics_sink = metrics_sink or log_step_timing
+        self.wait_timeout = wait_timeout
         self.driver = None
+        self.operations = 0 # Access changes performed by the current driver
 
     def start_driver(self):
         """Initializes the Chrome Driver with persistent profile to avoid constant logins."""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
         options = Options()
-        # options.add_argument("--headless")  # Uncomment for server mode
+        if self.headless:
+            options.add_argument("--headless=new")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
         options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36")
         
         # Use a user-data-dir to save login session (cookies)
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        user_data_dir = os.path.join(script_dir, "chrome_profile")
-        options.add_argument(f"user-data-dir={user_data_dir}")
+        options.add_argument(f"user-data-dir={self.user_data_dir}")
 
-        self.driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+        self.driver = webdriver.Chrome(service=Service(get_driver_path()), options=options)
+        self.operations = 0
         logging.info("Chrome Driver started.")
 
     def close_driver(self):
         if self.driver:
-            self.driver.quit()
+            try:
+                self.driver.quit()
+            except Exception as e:
+                logging.warning(f"Error while closing Chrome Driver: {e}")
+            self.driver = None
             logging.info("Chrome Driver closed.")
 
+    def is_alive(self):
+        """Health check: True if the browser session still responds."""
+        if not self.driver:
+            return False
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
     def login(self):
-        """Logs into TradingView if not already logged in."""
-        self.driver.get("https://www.tradingview.com/")
-        time.sleep(2)
+        """
+        Logs into TradingView if not already logged in.
+        A visible browser waits up to 5 minutes for a manual login; a headless one
+        raises LoginRequiredError at once, since nobody can log in there.
+        """
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
+        with self._step("login_check"):
+            self.driver.get(TRADINGVIEW_HOME)
+            self._wait_page_ready()
 
         # Check if already logged in (look for avatar or profile menu)
         try:
             # This selector often changes, generic check for "Sign In" button
-            sign_in_btn = self.driver.find_elements(By.CSS_SELECTOR, "button[aria-label='Open user menu']")
-            if sign_in_btn:
+            try:
+                WebDriverWait(self.driver, LOGIN_CHECK_TIMEOUT).until(EC.presence_of_element_located(USER_MENU))
                 logging.info("Already logged in.")
                 return
+            except TimeoutException:
+                if self.headless:
+                    raise LoginRequiredError(
+                        f"TradingView profile {self.user_data_dir} is not logged in; "
+                        "run `python tv_bot.py` once non-headless and log in manually."
+                    )
             
             # If not logged in, perform login flow (This is tricky due to Captcha, hence user-data-dir is preferred)
             logging.warning("Not logged in. Please log in manually in the browser window once, and it will be saved for future runs.")
             # Navigate to login page
-            self.driver.get("https://www.tradingview.com/accounts/signin/")
+            self.driver.get(TRADINGVIEW_SIGNIN)
             
             # Wait for user to log in manually (Hybrid approach is best for Bots to avoid Captcha issues)
             WebDriverWait(self.driver, 300).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "button[aria-label='Open user menu']"))
+                EC.presence_of_element_located(USER_MENU)
             )
             logging.info("Login detected!")
             
+        except LoginRequiredError:
+            raise
         except Exception as e:
             logging.error(f"Login check failed: {e}")
 
@@ -72,68 +190,175 @@ class TradingViewBot:
         action: 'add' or 'remove'
         expiration_date: 'YYYY-MM-DD' (optional)
         """
+        if action == "add":
+            results = self.manage_access_batch(script_url, add=[username])
+        elif action == "remove":
+            results = self.manage_access_batch(script_url, remove=[username])
+        else:
+            logging.error(f"Unknown access action: {action}")
+            return False
+        return results[username]
+
+    def manage_access_batch(self, script_url, add=(), remove=()):
+        """
+        Applies many access changes to one Invite-Only script while opening the
+        script page and its "Manage Access" modal only once.
+        Returns {username: True/False} for every requested user.
+        """
+        add = list(dict.fromkeys(add))
+        remove = list(dict.fromkeys(remove))
+        results = {username: False for username in add + remove}
+        if not results:
+            return results
+
         try:
             if not self.driver:
                 self.start_driver()
                 self.login()
 
-            logging.info(f"Navigating to script: {script_url}")
-            self.driver.get(script_url)
-            time.sleep(3)
+            self.operations += 1
+            logging.info(f"Navigating to script: {script_url} ({len(add)} to add, {len(remove)} to remove)")
+            self._open_manage_access(script_url)
 
-            # Click "Manage Access" button
-            # Note: Selectors are fragile and may need updates if TV updates UI
-            manage_btn = WebDriverWait(self.driver, 10).until(
-                EC.element_to_be_clickable((By.XPATH, "//button[contains(text(), 'Manage Access')]"))
-            )
-            manage_btn.click()
-            time.sleep(2)
+            for username in add:
+                try:
+                    self._add_user(username)
+                    results[username] = True
+                except Exception as e:
+                    logging.error(f"Error adding {username}: {e}")
 
-            # Switch to the modal context if necessary (usually it's just a div overlay)
-            
-            if action == "add":
-                # Find input field
-                input_field = self.driver.find_element(By.CSS_SELECTOR, "input[placeholder='Username']")
-                input_field.clear()
-                input_field.send_keys(username)
-                time.sleep(1)
-
-                # Set expiration if provided (Advanced logic needed here for date picker)
-                # For MVP, we just add permanent access or manage removal via bot later
-                
-                # Click "Add" button
-                add_btn = self.driver.find_element(By.XPATH, "//button[contains(text(), 'Add')]")
-                add_btn.click()
-                logging.info(f"Added user: {username}")
-
-            elif action == "remove":
-                # Search for user in the list (or just scroll/find)
-                # This is complex in UI. 
-                # Alternative: Just use the search box if available in the list section
-                # For MVP: We assume the list is visible.
-                
-                # Find the 'X' button next to the username
-                # pseudo-code xpath: //div[text()='username']/following-sibling::button[@icon='close']
-                delete_btn = self.driver.find_element(By.XPATH, f"//span[contains(text(), '{username}')]/ancestor::div[contains(@class, 'row')]//button[contains(@class, 'delete')]")
-                delete_btn.click()
-                logging.info(f"Removed user: {username}")
-
-            # Save/Close
-            # Some modals autosave, some need "Apply". TV usually autosaves on "Add".
-            # Close modal
-            close_btn = self.driver.find_element(By.CSS_SELECTOR, "button[data-name='close']")
-            close_btn.click()
-            
-            return True
+            for username in remove:
+                try:
+                    self._remove_user(username)
+                    results[username] = True
+                except Exception as e:
+                    logging.error(f"Error removing {username}: {e}")
+
+            self._close_manage_access()
 
         except Exception as e:
             logging.error(f"Error managing access: {e}")
-            return False
         finally:
             # We don't close driver here to keep session alive for next request if high volume
             # But for low volume, maybe close it.
             pass
 
+        return results
+
+    def list_access(self, script_url):
+        """
+        Reads everyone on an Invite-Only script's access list with a single page load.
+        Returns a set of usernames, or None if the list could not be read.
+        """
+        from selenium.common.exceptions import TimeoutException
+        try:
+            if not self.driver:
+                self.start_driver()
+                self.login()
+
+            self.operations += 1
+            self._open_manage_access(script_url)
+
+            with self._step("read_list"):
+                # The list may load more rows as it is scrolled; keep going until it stops growing
+                rows = self.driver.find_elements(*ACCESS_LIST_USERNAMES)
+                while rows:
+                    self.driver.execute_script("arguments[0].scrollIntoView();", rows[-1])
+                    try:
+                        self._wait(LIST_SCROLL_TIMEOUT).until(lambda d: len(d.find_elements(*ACCESS_LIST_USERNAMES)) > len(rows))
+                    except TimeoutException:
+                        break
+                    rows = self.driver.find_elements(*ACCESS_LIST_USERNAMES)
+                usernames = {row.text.strip() for row in rows if row.text.strip()}
+
+            self._close_manage_access()
+            logging.info(f"Read {len(usernames)} user(s) from {script_url}")
+            return usernames
+        except Exception as e:
+            logging.error(f"Error reading access list: {e}")
+            return None
+
+    def _open_manage_access(self, script_url):
+        from selenium.webdriver.support import expected_conditions as EC
+        with self._step("navigate"):
+            self.driver.get(script_url)
+            self._wait_page_ready()
+
+        # Click "Manage Access" button
+        # Note: Selectors are fragile and may need updates if TV updates UI
+        with self._step("open_modal"):
+            manage_btn = self._wait().until(EC.element_to_be_clickable(MANAGE_ACCESS_BUTTON))
+            manage_btn.click()
+            # The modal is ready once its username input is visible
+            self._wait().until(EC.visibility_of_element_located(USERNAME_INPUT))
+
+        # Switch to the modal context if necessary (usually it's just a div overlay)
+
+    def _close_manage_access(self):
+        from selenium.webdriver.support import expected_conditions as EC
+        # Save/Close
+        # Some modals autosave, some need "Apply". TV usually autosaves on "Add".
+        with self._step("close"):
+            close_btn = self.driver.find_element(*CLOSE_BUTTON)
+            close_btn.click()
+            self._wait().until(EC.invisibility_of_element_located(USERNAME_INPUT))
+
+    def _add_user(self, username):
+        from selenium.webdriver.support import expected_conditions as EC
+        with self._step("input"):
+            # Find input field
+            input_field = self._wait().until(EC.element_to_be_clickable(USERNAME_INPUT))
+            input_field.clear()
+            input_field.send_keys(username)
+
+        # Set expiration if provided (Advanced logic needed here for date picker)
+        # For MVP, we just add permanent access or manage removal via bot later
+
+        with self._step("confirm", action="add"):
+            # Click "Add" button, then wait for the user's row to appear in the access list
+            add_btn = self._wait().until(EC.element_to_be_clickable(ADD_BUTTON))
+            add_btn.click()
+            self._wait().until(EC.presence_of_element_located(user_row(username)))
+        logging.info(f"Added user: {username}")
+
+    def _remove_user(self, username):
+        from selenium.webdriver.support import expected_conditions as EC
+        # Search for user in the list (or just scroll/find)
+        # This is complex in UI.
+        # Alternative: Just use the search box if available in the list section
+        # For MVP: We assume the list is visible.
+
+        with self._step("confirm", action="remove"):
+            # Find the 'X' button next to the username, then wait for the row to go away
+            row = self._wait().until(EC.presence_of_element_located(user_row(username)))
+            delete_btn = row.find_element(*ROW_DELETE_BUTTON)
+            delete_btn.click()
+            self._wait().until(EC.invisibility_of_element_located(user_row(username)))
+        logging.info(f"Removed user: {username}")
+
+    # --- Waits & Instrumentation ---
+
+    def _wait(self, timeout=None):
+        from selenium.webdriver.support.ui import WebDriverWait
+        return WebDriverWait(self.driver, timeout or self.wait_timeout, poll_frequency=WAIT_POLL_INTERVAL)
+
+    def _wait_page_ready(self):
+        self._wait().until(lambda d: d.execute_script("return document.readyState") == "complete")
+
+    @contextmanager
+    def _step(self, step, **labels):
+        """Times one step of a browser operation and reports it to the metrics sink."""
+        start = time.perf_counter()
+        success = False
+        try:
+            yield
+            success = True
+        finally:
+            try:
+                self.metrics_sink(step, time.perf_counter() - start, success, labels)
+            except Exception as e:
+                logging.warning(f"Metrics sink failed: {e}")
+
 if __name__ == "__main__":
     # Test Run
     bot = TradingViewBot("your_tv_username", "your_tv_password")
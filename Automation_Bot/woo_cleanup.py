@@ -1,11 +1,15 @@
-import pandas as pd
 import os
+import csv
 import logging
-import smtplib
+import json
+import argparse
 import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from tv_bot import TradingViewBot
+from concurrent.futures import ThreadPoolExecutor
+from browser_pool import BrowserPool
+from tv_bot import SCRIPT_DIR
+import database
+from product_catalog import load_catalog
+from mailer import Mailer, EmailTemplate
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -20,23 +24,18 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 CSV_FILE = "woocommerce_subscriptions_export.csv"
 
 # Column Names in your CSV (Change these to match your export!)
-    COL_ORDER_ID = "Order ID"       # To check if it's a valid order
-    COL_STATUS = "Status"           # e.g., 'status', 'subscription_status'
-    COL_USERNAME = "TV Username"    # The meta field where you captured their ID
-    COL_PRODUCT = "Product Name"    # To know which script to remove them from
-    COL_EMAIL = "Customer Email"    # New: Need email to send warnings
+COL_ORDER_ID = "Order ID"       # To check if it's a valid order
+COL_STATUS = "Status"           # e.g., 'status', 'subscription_status'
+COL_USERNAME = "TV Username"    # The meta field where you captured their ID
+COL_PRODUCT = "Product Name"    # To know which script to remove them from
+COL_EMAIL = "Customer Email"    # New: Need email to send warnings
 
-# Columns for State Tracking (Script will add these if missing)
+# Legacy State Columns
+# Warning/removal state now lives in the `cleanup_state` table of orders.db.
+# If an older export still carries these columns, their dates are imported once.
 COL_WARNING_SENT = "Warning Sent Date"
 COL_REMOVED = "Removed Date"
 
-# Map Product Names (from CSV) to TradingView Script URLs
-PRODUCT_SCRIPT_MAP = {
-    "BTMM State Engine": "https://www.tradingview.com/script/Example1-StateEngine/",
-    "BTMM Multi-Pair Scanner": "https://www.tradingview.com/script/Example2-Scanner/",
-    "Default": "https://www.tradingview.com/script/YOUR_DEFAULT_SCRIPT_ID/"
-}
-
 # Email Configuration
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
@@ -44,161 +43,320 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 SENDER_EMAIL = os.getenv("SENDER_EMAIL", SMTP_USER)
 SUPPORT_EMAIL = "support@g-labs.software"
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"          # Set to 0 for a local test SMTP server
+SMTP_WORKERS = int(os.getenv("SMTP_WORKERS", 4))                 # Parallel sender connections
+SMTP_RATE_PER_SECOND = float(os.getenv("SMTP_RATE_PER_SECOND", 5)) # Stay under your provider's sending limit
 
-# ---------------------------------------------------------
+# Cleanup Rules
+TARGET_STATUSES = ['cancelled', 'expired', 'trash', 'failed', 'on-hold']
+GRACE_PERIOD_DAYS = 2 # Days between the warning email and removal
 
-def send_warning_email(to_email, username, product_name):
-    """Sends a warning email to the user."""
-    if not SMTP_USER or not SMTP_PASS:
-        logging.error("SMTP Credentials not set. Skipping email.")
-        return False
+# Rows held in memory at once while streaming the export
+CHUNK_SIZE = int(os.getenv("CLEANUP_CHUNK_SIZE", 50000))
 
-    try:
-        msg = MIMEMultipart()
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = to_email
-        msg['Subject'] = f"Action Required: Your G-Labs Access is Expiring ({product_name})"
+# Plan Execution
+CLEANUP_BROWSERS = int(os.getenv("CLEANUP_BROWSERS", 2)) # Scripts cleaned at the same time (one browser each)
+CLEANUP_PROFILES_DIR = os.path.join(SCRIPT_DIR, "chrome_profiles_cleanup")
+WARNING_BATCH_SIZE = 500 # Warnings sent (and recorded) per batch
 
-        body = f"""
+# ---------------------------------------------------------
+
+WARNING_EMAIL = EmailTemplate(
+    subject="Action Required: Your G-Labs Access is Expiring ({product_name})",
+    html_body="""
         <html>
           <body>
             <p>Hi {username},</p>
             <p>We noticed your subscription for <strong>{product_name}</strong> has ended or was cancelled.</p>
             <p>Your access to the TradingView indicator will be removed in <strong>48 hours</strong>.</p>
             <p>If you believe this is a mistake, or if you have renewed your subscription, please contact us immediately so we don't cut you off!</p>
-            <p><strong>Contact Support:</strong> <a href="mailto:{SUPPORT_EMAIL}">{SUPPORT_EMAIL}</a></p>
+            <p><strong>Contact Support:</strong> <a href="mailto:{support_email}">{support_email}</a></p>
             <br>
             <p>Regards,<br>The G-Labs Team</p>
           </body>
         </html>
         """
-        msg.attach(MIMEText(body, 'html'))
-
-        server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-        server.starttls()
-        server.login(SMTP_USER, SMTP_PASS)
-        server.send_message(msg)
-        server.quit()
-        
-        logging.info(f"Email sent to {to_email}")
-        return True
-    except Exception as e:
-        logging.error(f"Failed to send email to {to_email}: {e}")
+)
+
+def create_mailer():
+    """Mailer with persistent SMTP connections, or None if credentials are missing."""
+    if not SMTP_USER or not SMTP_PASS:
+        logging.error("SMTP Credentials not set. Skipping email.")
+        return None
+    return Mailer(
+        SMTP_SERVER,
+        SMTP_PORT,
+        SMTP_USER,
+        SMTP_PASS,
+        sender=SENDER_EMAIL,
+        workers=SMTP_WORKERS,
+        rate_per_second=SMTP_RATE_PER_SECOND,
+        starttls=SMTP_STARTTLS
+    )
+
+def build_warning_email(to_email, username, product_name):
+    return WARNING_EMAIL.render(to_email, username=username, product_name=product_name, support_email=SUPPORT_EMAIL)
+
+def send_warning_emails(mailer, recipients):
+    """Sends warnings for (email, username, product_name) tuples in parallel. Returns True/False per recipient."""
+    if mailer is None:
+        return [False] * len(recipients)
+    return mailer.send_batch([build_warning_email(*recipient) for recipient in recipients])
+
+def send_warning_email(to_email, username, product_name):
+    """Sends a single warning email to the user."""
+    mailer = create_mailer()
+    if mailer is None:
         return False
+    try:
+        sent = mailer.send(build_warning_email(to_email, username, product_name))
+    finally:
+        mailer.close()
+    if sent:
+        logging.info(f"Email sent to {to_email}")
+    return sent
+
+def _blank(series):
+    """Vectorized 'is this cell empty' check (NaN, blank or the literal 'nan')."""
+    return series.isna() | series.astype(str).str.strip().str.lower().isin(["", "nan"])
+
+def _column(chunk, name, default=""):
+    if name in chunk.columns:
+        return chunk[name]
+    import pandas as pd
+    return pd.Series(default, index=chunk.index)
+
+def _state_key(order_id, tv_username):
+    return f"{order_id}\x1f{tv_username}"
+
+def _plan_chunk(chunk, state, plan):
+    """
+    Diff one CSV chunk against the stored cleanup state and add the outcome to the plan.
+    Only rows that are newly lapsed or whose lapsed status was reversed end up in it.
+    """
+    plan["rows_scanned"] += len(chunk)
+    order_ids = _column(chunk, COL_ORDER_ID).astype(str).str.strip()
+    usernames = chunk[COL_USERNAME].astype(str).str.strip()
+    keys = order_ids + "\x1f" + usernames
+    status = chunk[COL_STATUS].astype(str).str.strip().str.lower()
+
+    tracked = keys.isin(state)
+    lapsed = status.isin(TARGET_STATUSES) & ~_blank(chunk[COL_USERNAME])
+
+    # Renewed/reactivated: forget the entry so a pending removal is cancelled
+    # and a later lapse starts a fresh warning cycle
+    reactivated = tracked & ~lapsed
+    for key, order_id, user_tv in zip(keys[reactivated], order_ids[reactivated], usernames[reactivated]):
+        if state.pop(key, None) is None: # Duplicate row earlier in this export
+            continue
+        logging.info(f"User {user_tv} is active again. Cancelling pending removal.")
+        plan["forget"].append({"order_id": order_id, "tv_username": user_tv})
+
+    new = lapsed & ~tracked
+    if not new.any():
+        return
+
+    # SAFETY CHECK: If Order ID or Email is missing, assume it's a manual/special user -> SKIP
+    manual = new & (_blank(_column(chunk, COL_ORDER_ID)) | _blank(_column(chunk, COL_EMAIL)))
+    for order_id, user_tv in zip(order_ids[manual], usernames[manual]):
+        logging.info(f"Skipping {user_tv} (Missing Order ID or Email - assumed manual entry).")
+        plan["skips"].append({"order_id": order_id, "tv_username": user_tv, "reason": "Missing Order ID or Email - assumed manual entry"})
 
-def clean_up_cancelled_users():
+    products = _column(chunk, COL_PRODUCT, "Default").fillna("Default").astype(str).str.strip()
+    legacy_warning = _column(chunk, COL_WARNING_SENT)
+    legacy_removed = _column(chunk, COL_REMOVED)
+    legacy_warning_blank = _blank(legacy_warning)
+    legacy_removed_blank = _blank(legacy_removed)
+
+    for index in chunk.index[new & ~manual]:
+        key = keys.at[index]
+        if key in state: # Duplicate row earlier in this export
+            continue
+        entry = {
+            "order_id": order_ids.at[index],
+            "tv_username": usernames.at[index],
+            "product_name": products.at[index],
+            "email": str(chunk.at[index, COL_EMAIL]).strip(),
+            "status": status.at[index],
+            "warning_sent_date": None if legacy_warning_blank.at[index] else str(legacy_warning.at[index]).strip(),
+            "removed_date": None if legacy_removed_blank.at[index] else str(legacy_removed.at[index]).strip(),
+        }
+        state[key] = entry
+        if entry["warning_sent_date"] or entry["removed_date"]:
+            plan["imports"].append(entry) # Dates carried over from an older export
+        else:
+            logging.info(f"User {entry['tv_username']} needs warning.")
+            plan["warnings"].append(entry)
+
+def build_cleanup_plan(today=None, chunk_size=CHUNK_SIZE):
+    """
+    Phase 1: decide everything without sending or changing anything.
+    The export is streamed in chunks of `chunk_size` rows and diffed against the
+    cleanup_state table. Returns a JSON-serialisable plan (warnings to send, removals
+    grouped by script URL, skips with reasons), or None if the export can't be read.
+    """
     if not os.path.exists(CSV_FILE):
         logging.error(f"File {CSV_FILE} not found! Please place your CSV in this folder.")
-        return
+        return None
 
-    logging.info(f"Reading {CSV_FILE}...")
     try:
-        df = pd.read_csv(CSV_FILE)
+        with open(CSV_FILE, newline="") as f:
+            columns = next(csv.reader(f), [])
     except Exception as e:
         logging.error(f"Failed to read CSV: {e}")
-        return
-
-    # Add tracking columns if they don't exist
-    if COL_WARNING_SENT not in df.columns:
-        df[COL_WARNING_SENT] = ""
-    if COL_REMOVED not in df.columns:
-        df[COL_REMOVED] = ""
+        return None
 
-    target_statuses = ['cancelled', 'expired', 'trash', 'failed', 'on-hold']
-    
-    if COL_STATUS not in df.columns or COL_USERNAME not in df.columns:
+    if COL_STATUS not in columns or COL_USERNAME not in columns:
         logging.error(f"Columns '{COL_STATUS}' or '{COL_USERNAME}' not found in CSV.")
-        return
+        return None
+
+    # pandas is slow to import, so it is only loaded once there is an export to read
+    import pandas as pd
+
+    database.init_db()
+    today = today or datetime.date.today()
+    state = {_state_key(*key): entry for key, entry in database.get_cleanup_state().items()}
+    logging.info(f"Reading {CSV_FILE} in chunks of {chunk_size} rows ({len(state)} users tracked)...")
+
+    plan = {"date": str(today), "rows_scanned": 0, "warnings": [], "removals": {}, "skips": [], "forget": [], "imports": []}
+    try:
+        # dtype=str keeps IDs exactly as exported (no 101 -> 101.0 drift)
+        for chunk in pd.read_csv(CSV_FILE, dtype=str, chunksize=chunk_size):
+            _plan_chunk(chunk, state, plan)
+    except Exception as e:
+        logging.error(f"Failed to process CSV: {e}")
+        return None
+
+    # Removals: everyone whose grace period is over, unless they came back in this export
+    cutoff = str(today - datetime.timedelta(days=GRACE_PERIOD_DAYS))
+    forgotten = {(entry["order_id"], entry["tv_username"]) for entry in plan["forget"]}
+    due = [entry for entry in database.get_due_cleanup_removals(cutoff) if (entry["order_id"], entry["tv_username"]) not in forgotten]
+    due += [entry for entry in plan["imports"] if entry["warning_sent_date"] and not entry["removed_date"] and entry["warning_sent_date"] <= cutoff]
+    # Product names map to scripts through products.json (see product_catalog.py).
+    # Unmapped products are skipped: removing the user from some other script would be wrong.
+    script_urls = load_catalog().scripts_for_names(pd.Series([entry["product_name"] for entry in due], dtype=object))
+    for entry, script_url in zip(due, script_urls):
+        if script_url is None:
+            logging.warning(f"Skipping removal of {entry['tv_username']}: no script mapped for product '{entry['product_name']}' in products.json.")
+            plan["skips"].append({"order_id": entry["order_id"], "tv_username": entry["tv_username"], "reason": f"No script mapped for product '{entry['product_name']}'"})
+            continue
+        plan["removals"].setdefault(script_url, []).append({"order_id": entry["order_id"], "tv_username": entry["tv_username"]})
+
+    logging.info(
+        f"Plan: {plan['rows_scanned']} rows, {len(plan['warnings'])} warning(s), "
+        f"{sum(len(users) for users in plan['removals'].values())} removal(s) on {len(plan['removals'])} script(s), {len(plan['skips'])} skipped, "
+        f"{len(plan['forget'])} reactivated."
+    )
+    return plan
 
-    # Initialize Bot only if we need to remove someone
-    bot = None
+def create_browser_pool(size):
+    """Browsers for the removal side of a cleanup, or None if TradingView credentials are missing."""
     tv_username = os.getenv('TV_USERNAME')
     tv_password = os.getenv('TV_PASSWORD')
-    
-    rows_processed = 0
-    removals_count = 0
-    warnings_count = 0
-
-    for index, row in df.iterrows():
-        status = str(row[COL_STATUS]).lower()
-        user_tv = str(row[COL_USERNAME]).strip()
-        user_email = str(row.get(COL_EMAIL, "")).strip()
-        order_id = str(row.get(COL_ORDER_ID, "")).strip()
-        product_name = str(row.get(COL_PRODUCT, "Default")).strip()
-        warning_date_str = str(row[COL_WARNING_SENT]).strip()
-        removed_date_str = str(row[COL_REMOVED]).strip()
-
-        # Skip invalid rows, already removed users, or MANUAL entries (missing Order ID or Email)
-        if status not in target_statuses or not user_tv or user_tv.lower() == 'nan' or removed_date_str:
-            continue
+    if not tv_username or not tv_password:
+        logging.error("TV_USERNAME / TV_PASSWORD are not set. Skipping removals.")
+        return None
+    # Own profile copies, so a running server's browsers are never disturbed
+    return BrowserPool(tv_username, tv_password, size=size, headless=os.getenv('BROWSER_HEADLESS', '1') == '1', profiles_dir=CLEANUP_PROFILES_DIR)
 
-        # SAFETY CHECK: If Order ID or Email is missing, assume it's a manual/special user -> SKIP
-        if not order_id or order_id.lower() == 'nan' or not user_email or user_email.lower() == 'nan':
-            logging.info(f"Skipping {user_tv} (Missing Order ID or Email - assumed manual entry).")
-            continue
-        
-        rows_processed += 1
-        today = datetime.date.today()
-        
-        # Determine Script URL
-        script_url = PRODUCT_SCRIPT_MAP.get("Default")
-        for key, url in PRODUCT_SCRIPT_MAP.items():
-            if key in product_name:
-                script_url = url
-                break
-
-        # Check if warning has been sent
-        if not warning_date_str or warning_date_str == 'nan':
-            # CASE 1: Send Warning
-            logging.info(f"User {user_tv} needs warning. Sending email...")
-            if send_warning_email(user_email, user_tv, product_name):
-                df.at[index, COL_WARNING_SENT] = str(today)
-                warnings_count += 1
+def _send_planned_warnings(plan, mailer, today):
+    """Email side: send the plan's warnings, recording each batch as soon as it went out."""
+    sent = 0
+    warnings = plan["warnings"]
+    for i in range(0, len(warnings), WARNING_BATCH_SIZE):
+        batch = warnings[i:i + WARNING_BATCH_SIZE]
+        results = send_warning_emails(mailer, [(entry["email"], entry["tv_username"], entry["product_name"]) for entry in batch])
+        delivered = []
+        for entry, ok in zip(batch, results):
+            if ok:
+                delivered.append(dict(entry, warning_sent_date=str(today)))
             else:
-                logging.warning(f"Could not send email. Skipping warning flag.")
-        
-        else:
-            # CASE 2: Check if 2 days have passed
-            try:
-                warning_date = datetime.datetime.strptime(warning_date_str, "%Y-%m-%d").date()
-                days_diff = (today - warning_date).days
-                
-                if days_diff >= 2:
-                    # Proceed to Remove
-                    logging.info(f"User {user_tv} warned {days_diff} days ago. Removing access...")
-                    
-                    if not bot and tv_username and tv_password:
-                        bot = TradingViewBot(tv_username, tv_password)
-                        bot.start_driver()
-                        bot.login()
-                    
-                    if bot:
-                        success = bot.manage_access(script_url, user_tv, action="remove")
-                        if success:
-                            df.at[index, COL_REMOVED] = str(today)
-                            removals_count += 1
-                else:
-                    logging.info(f"User {user_tv} warned {days_diff} days ago. Waiting for 2 days.")
-            except ValueError:
-                 logging.error(f"Invalid date format for {user_tv}: {warning_date_str}")
-
-    if bot:
-        bot.close_driver()
-
-    # Save changes back to CSV
-    df.to_csv(CSV_FILE, index=False)
-    logging.info(f"Process Complete. Warnings Sent: {warnings_count}, Users Removed: {removals_count}")
+                logging.warning(f"Could not send email to {entry['tv_username']}. Skipping warning flag.")
+        # Persist as we go so a crash never re-sends a warning that already went out
+        database.save_cleanup_state(delivered)
+        sent += len(delivered)
+    return sent
+
+def _remove_script_users(pool, script_url, users, today):
+    order_ids = {} # username -> [order ids]
+    for user in users:
+        order_ids.setdefault(user["tv_username"], []).append(user["order_id"])
+    logging.info(f"Removing {len(order_ids)} user(s) from {script_url}...")
+    results = pool.manage_access_batch(script_url, remove=list(order_ids))
+    removed = [username for username in order_ids if results.get(username)]
+    database.mark_cleanup_removed([(order_id, username) for username in removed for order_id in order_ids[username]], str(today))
+    return len(removed)
+
+def _run_planned_removals(plan, today):
+    """TradingView side: one access-list batch per script, several scripts at once."""
+    if not plan["removals"]:
+        return 0
+    pool = create_browser_pool(min(CLEANUP_BROWSERS, len(plan["removals"])))
+    if pool is None:
+        logging.error(f"{sum(len(users) for users in plan['removals'].values())} user(s) due for removal, but the browsers could not be started.")
+        return 0
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix="cleanup-remove") as executor:
+            futures = [executor.submit(_remove_script_users, pool, script_url, users, today) for script_url, users in plan["removals"].items()]
+            return sum(future.result() for future in futures)
+    finally:
+        pool.close()
+
+def execute_cleanup_plan(plan):
+    """
+    Phase 2: carry out a plan from build_cleanup_plan().
+    Warning emails and TradingView removals run at the same time on their own
+    worker pools, so a large cleanup takes as long as the slower side.
+    """
+    today = datetime.date.fromisoformat(plan["date"])
+    database.delete_cleanup_state([(entry["order_id"], entry["tv_username"]) for entry in plan["forget"]])
+    database.save_cleanup_state(plan["imports"])
+
+    mailer = create_mailer() if plan["warnings"] else None
+    try:
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="cleanup") as executor:
+            warnings = executor.submit(_send_planned_warnings, plan, mailer, today)
+            removals = executor.submit(_run_planned_removals, plan, today)
+            result = {"warnings": warnings.result(), "removals": removals.result()}
+    finally:
+        if mailer:
+            mailer.close()
+
+    logging.info(f"Process Complete. Warnings Sent: {result['warnings']}, Users Removed: {result['removals']}")
+    return result
+
+def clean_up_cancelled_users(chunk_size=CHUNK_SIZE, dry_run=False):
+    """
+    Diffs the export against the stored cleanup state (cleanup_state table in orders.db)
+    and acts on it. With dry_run=True only the plan is built and returned.
+    The CSV is never rewritten, so a fresh WooCommerce export can replace it at any time.
+    """
+    plan = build_cleanup_plan(chunk_size=chunk_size)
+    if plan is None or dry_run:
+        return plan
+    return execute_cleanup_plan(plan)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warn and remove lapsed WooCommerce subscribers.")
+    parser.add_argument("--dry-run", action="store_true", help="Only build the plan and save it; send and remove nothing")
+    parser.add_argument("--plan-out", default="cleanup_plan.json", help="Where --dry-run saves the plan (default: cleanup_plan.json)")
+    args = parser.parse_args()
+
     if not os.path.exists(CSV_FILE):
-        data = {
-            "Order ID": [101, 102, 103],
-            "Status": ["cancelled", "cancelled", "active"],
-            "Product Name": ["BTMM State Engine", "BTMM State Engine", "Multi-Pair Scanner"],
-            "TV Username": ["TraderJoe", "PaperHands69", "CryptoKing"],
-            "Customer Email": ["joe@example.com", "paper@example.com", "king@example.com"]
-        }
-        pd.DataFrame(data).to_csv(CSV_FILE, index=False)
+        rows = [
+            ["Order ID", "Status", "Product Name", "TV Username", "Customer Email"],
+            [101, "cancelled", "BTMM State Engine", "TraderJoe", "joe@example.com"],
+            [102, "cancelled", "BTMM State Engine", "PaperHands69", "paper@example.com"],
+            [103, "active", "BTMM Multi-Pair Scanner", "CryptoKing", "king@example.com"],
+        ]
+        with open(CSV_FILE, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
         print(f"Created template file: {CSV_FILE}. Please replace it with your actual data.")
+    elif args.dry_run:
+        plan = clean_up_cancelled_users(dry_run=True)
+        if plan is not None:
+            with open(args.plan_out, "w") as f:
+                json.dump(plan, f, indent=2)
+            print(f"Dry run: plan saved to {args.plan_out}. Nothing was sent or removed.")
     else:
         clean_up_cancelled_users()
@@ -0,0 +1,11 @@
+"""
+Production entry point for the server.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing the app does no work; each worker sets up its own state in
+server.init_worker() (called from gunicorn.conf.py, or on the first request).
+"""
+from server import app
+
+application = app